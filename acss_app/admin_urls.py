@@ -1,12 +1,16 @@
 """管理员相关接口路由"""
 from django.urls import path
 
-from acss_app.controller.admin_controller import query_all_piles_stat_api, query_queue_api, query_report_api, update_pile_status_api
+from acss_app.controller.admin_controller import (import_charging_requests_api, query_all_piles_stat_api, query_queue_api,
+                                                  query_report_api, update_pile_status_api)
+from acss_app.controller.stream_controller import admin_subscribe_queue_api
 
 
 urlpatterns = [
     path('query_all_piles_stat', query_all_piles_stat_api),
     path('update_pile', update_pile_status_api),
     path('query_report', query_report_api),
-    path('query_queue', query_queue_api)
+    path('query_queue', query_queue_api),
+    path('subscribe_queue', admin_subscribe_queue_api),
+    path('import_charging_requests', import_charging_requests_api)
 ]
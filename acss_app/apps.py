@@ -1,19 +1,44 @@
 import os
 
 from django.apps import AppConfig
+from django.conf import settings
 
 
 init_flag = True
 
+# 为 1 时在应用初始化时启动调度器、结算写入线程与 JWT 吊销记录同步线程，须在 django.setup() 之前设置。
+# asgi.py、wsgi.py 与 manage.py 中的服务命令（runserver、serve、run_scheduler）设置该变量，
+# 其他管理命令与自行调用 django.setup() 的脚本不启动这些服务，也不创建调度日志与 spool 文件
+SERVICE_PROCESS_ENV = 'ACSS_SERVICE_PROCESS'
+
+
+def is_service_process() -> bool:
+    """当前进程是否需要启动后台服务"""
+    return os.environ.get(SERVICE_PROCESS_ENV) == '1'
+
 
 class acssAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'acss_app'
 
     def ready(self) -> None:
+        from django.db.backends.signals import connection_created
+        from acss_app.service.util.db_tool import apply_sqlite_pragmas
+        connection_created.connect(apply_sqlite_pragmas, dispatch_uid='acss_app.apply_sqlite_pragmas')
+
         global init_flag
-        if init_flag is False:
+        if init_flag is False or not is_service_process():
             return
         init_flag = False
+        from acss_app.service.util.jwt_tool import on_init as on_jwt_init
+        remote = getattr(settings, 'SCHEDULER_MODE', 'local') == 'remote'
+        # 多个 Web 进程通过数据库共享 JWT 吊销记录，过期记录由运行调度器的进程删除
+        on_jwt_init(purge=not remote)
         from acss_app.service.schd import on_init as on_schd_init
+        if remote:
+            # 调度器与结算写入线程都运行在独立调度进程中
+            on_schd_init()
+            return
+        from acss_app.service.settlement import on_init as on_settlement_init
+        on_settlement_init()
         on_schd_init()
@@ -1,17 +1,24 @@
 """管理员客户端控制器"""
+from decimal import Decimal
+
 from django.http import HttpRequest, JsonResponse
 
-from acss_app.controller.util.validator import validate, ValidationError
-from acss_app.controller.util.resp_tool import RetCode
+from acss_app.controller.util.validator import compile_schema, validate, ValidationError
+from acss_app.controller.util.resp_tool import RetCode, is_not_modified, not_modified, with_etag
 from acss_app.service.auth import Role
-from acss_app.service.exceptions import PileDoesNotExisted
-from acss_app.service.schd import scheduler
+from acss_app.service.exceptions import PileDoesNotExisted, SchedulerUnavailable
+from acss_app.service.identity import get_identities
+from acss_app.service.schd import SubmitItem, scheduler
 from acss_app.service.simple_query import get_all_piles_status, get_pile_status, query_report, update_pile_status
 from acss_app.service.util.jwt_tool import RequestContext, preprocess_token
-from acss_app.models import PileStatus
+from acss_app.models import PileStatus, PileType
+
+
+# 批量导入充电请求时单次请求的最大条数
+IMPORT_MAX_ITEMS = 500
 
 
-__update_pile_status_schema = {
+__update_pile_status_schema = compile_schema({
     'type': 'object',
     'required': ['pile_id', 'status'],
     'properties': {
@@ -25,7 +32,50 @@ __update_pile_status_schema = {
             'errmsg': "status 应为可选值为'RUNNING', 'SHUTDOWN', 'UNAVAILABLE'的字符串"
         }
     }
-}
+})
+
+__import_charging_requests_schema = compile_schema({
+    'type': 'object',
+    'required': ['requests'],
+    'properties': {
+        'requests': {
+            'type': 'array',
+            'minItems': 1,
+            'maxItems': IMPORT_MAX_ITEMS,
+            'errmsg': f"requests 应为包含 1 到 {IMPORT_MAX_ITEMS} 个充电请求的数组",
+            'items': {
+                'type': 'object',
+                'required': ['username', 'charge_mode', 'require_amount', 'battery_size'],
+                'properties': {
+                    'username': {
+                        'type': 'string',
+                        'errmsg': "username 应为字符串"
+                    },
+                    'charge_mode': {
+                        'type': 'string',
+                        'enum': ['T', 'F'],
+                        'errmsg': "charge_mode 应为可选值为'T'或'F'的字符串"
+                    },
+                    'require_amount': {
+                        'type': 'string',
+                        'pattern': r'\d+\.\d{2}',
+                        'errmsg': "require_amount 应为字符串表示的保留两位小数的实数"
+                    },
+                    'battery_size': {
+                        'type': 'string',
+                        'pattern': r'\d+\.\d{2}',
+                        'errmsg': "battery_size 应为字符串表示的保留两位小数的实数"
+                    },
+                    'station_id': {
+                        'type': 'string',
+                        'pattern': r'^\d+$',
+                        'errmsg': "station_id 应为字符串表示的充电站编号"
+                    }
+                }
+            }
+        }
+    }
+})
 
 
 @preprocess_token(limited_role=Role.ADMIN)
@@ -65,9 +115,9 @@ def update_pile_status_api(_: RequestContext, req: HttpRequest) -> JsonResponse:
     pile_id = int(pile_id_str)
     status = PileStatus[status_str]
 
+    # 先通知调度器，调度服务不可用时不修改充电桩状态
     try:
         status_before = get_pile_status(pile_id)
-        update_pile_status(pile_id, status)
         match status_before:
             case PileStatus.RUNNING:
                 match status:
@@ -81,12 +131,18 @@ def update_pile_status_api(_: RequestContext, req: HttpRequest) -> JsonResponse:
                         scheduler.recover(pile_id)
                     case _:
                         pass
+        update_pile_status(pile_id, status)
 
     except PileDoesNotExisted as e:
         return JsonResponse({
             'code': RetCode.SUCCESS.value,
             'message': str(e)
         })
+    except SchedulerUnavailable as e:
+        return JsonResponse({
+            'code': RetCode.FAIL.value,
+            'message': str(e)
+        })
 
     return JsonResponse({
         'code': RetCode.SUCCESS.value,
@@ -114,7 +170,7 @@ def query_report_api(_: RequestContext, req: HttpRequest) -> JsonResponse:
 
 
 @preprocess_token(limited_role=Role.ADMIN)
-def query_queue_api(_: RequestContext, req: HttpRequest) -> JsonResponse:
+async def query_queue_api(_: RequestContext, req: HttpRequest) -> JsonResponse:
     try:
         validate(req, method='GET')
     except ValidationError as e:
@@ -123,10 +179,65 @@ def query_queue_api(_: RequestContext, req: HttpRequest) -> JsonResponse:
             'message': str(e)
         })
 
-    snapshot = scheduler.snapshot()
+    snapshot = scheduler.get_snapshot()
+    if is_not_modified(req, snapshot.etag):
+        return not_modified(snapshot.etag)
+
+    return with_etag(JsonResponse({
+        'code': RetCode.SUCCESS.value,
+        'message': 'success',
+        'data': snapshot.to_rows()
+    }), snapshot.etag)
+
+
+@preprocess_token(limited_role=Role.ADMIN)
+def import_charging_requests_api(_: RequestContext, req: HttpRequest) -> JsonResponse:
+    """批量导入充电请求，整体校验一次后一次性提交给调度器，返回每个请求的结果"""
+    try:
+        kwargs = validate(req, method='POST',
+                          schema=__import_charging_requests_schema)
+    except ValidationError as e:
+        return JsonResponse({
+            'code': RetCode.FAIL.value,
+            'message': str(e)
+        })
+
+    results = [None] * len(kwargs['requests'])
+    items = []
+    indexes = []
+    identities = get_identities(item['username'] for item in kwargs['requests'])
+    for index, item in enumerate(kwargs['requests']):
+        identity = identities.get(item['username'])
+        if identity is None:
+            results[index] = {
+                'username': item['username'],
+                'code': RetCode.FAIL.value,
+                'message': "用户不存在"
+            }
+            continue
+        request_mode = PileType.CHARGE if item['charge_mode'] == 'T' else PileType.FAST_CHARGE
+        station_id = int(item['station_id']) if 'station_id' in item else None
+        items.append(SubmitItem(request_mode, identity.username, Decimal(item['require_amount']),
+                                Decimal(item['battery_size']), identity.user_id, station_id))
+        indexes.append(index)
+
+    try:
+        errors = scheduler.submit_many(items)
+    except SchedulerUnavailable as e:
+        return JsonResponse({
+            'code': RetCode.FAIL.value,
+            'message': str(e)
+        })
+
+    for index, item, error in zip(indexes, items, errors):
+        results[index] = {
+            'username': item.username,
+            'code': RetCode.SUCCESS.value if error is None else RetCode.FAIL.value,
+            'message': 'success' if error is None else str(error)
+        }
 
     return JsonResponse({
         'code': RetCode.SUCCESS.value,
         'message': 'success',
-        'data': snapshot
+        'data': results
     })
@@ -1,15 +1,15 @@
 """身份验证控制器"""
 from django.http import HttpRequest, JsonResponse
 
-from acss_app.service.auth import login, register
+from acss_app.service.auth import login, logout, register
 
-from acss_app.controller.util.validator import validate, ValidationError
+from acss_app.controller.util.validator import compile_schema, validate, ValidationError
 from acss_app.controller.util.resp_tool import RetCode
 from acss_app.service.exceptions import UserAlreadyExisted, UserDoesNotExisted, WrongPassword
-from acss_app.service.util.jwt_tool import Role
+from acss_app.service.util.jwt_tool import STREAM_TICKET_TTL, RequestContext, Role, gen_stream_ticket, preprocess_token
 
 
-__login_schema = {
+__login_schema = compile_schema({
     'type': 'object',
     'required': ['username', 'password'],
     'properties': {
@@ -22,10 +22,10 @@ __login_schema = {
             'errmsg': "password 应为字符串"
         }
     }
-}
+})
 
 
-__register_schema = {
+__register_schema = compile_schema({
     'type': 'object',
     'required': ['username', 'password', 're_password'],
     'properties': {
@@ -45,7 +45,7 @@ __register_schema = {
             'errmsg': "re_password 应为8位以上字符串"
         }
     }
-}
+})
 
 
 def login_api(req: HttpRequest) -> JsonResponse:
@@ -113,3 +113,42 @@ def register_api(req: HttpRequest) -> JsonResponse:
         'code': RetCode.SUCCESS.value,
         'message': 'success'
     })
+
+
+@preprocess_token(limited_role=None)
+def logout_api(context: RequestContext, req: HttpRequest) -> JsonResponse:
+    try:
+        validate(req, method='GET')
+    except ValidationError as e:
+        return JsonResponse({
+            'code': RetCode.FAIL.value,
+            'message': str(e)
+        })
+
+    logout(context)
+
+    return JsonResponse({
+        'code': RetCode.SUCCESS.value,
+        'message': 'success'
+    })
+
+
+@preprocess_token(limited_role=None)
+def stream_ticket_api(context: RequestContext, req: HttpRequest) -> JsonResponse:
+    """签发推送连接票据，用于 subscribe_queue 的查询参数 ticket"""
+    try:
+        validate(req, method='GET')
+    except ValidationError as e:
+        return JsonResponse({
+            'code': RetCode.FAIL.value,
+            'message': str(e)
+        })
+
+    return JsonResponse({
+        'code': RetCode.SUCCESS.value,
+        'message': 'success',
+        'data': {
+            'ticket': gen_stream_ticket(context),
+            'expires_in': STREAM_TICKET_TTL
+        }
+    })
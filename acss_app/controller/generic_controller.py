@@ -1,13 +1,13 @@
 """身份验证控制器"""
 from django.http import HttpRequest, JsonResponse
 
-from acss_app.service.timemock import get_timestamp_now, get_datetime_now
+from acss_app.service.timemock import US_PER_SECOND, from_us, now_us
 
 from acss_app.controller.util.validator import validate, ValidationError
 from acss_app.controller.util.resp_tool import RetCode
 
 
-def query_time(req: HttpRequest) -> JsonResponse:
+async def query_time(req: HttpRequest) -> JsonResponse:
     try:
         validate(req, method='GET')
     except ValidationError as e:
@@ -16,11 +16,13 @@ def query_time(req: HttpRequest) -> JsonResponse:
             'message': str(e)
         })
 
+    # 只读取一次时钟，使两种格式表示同一时刻
+    time_now = now_us()
     return JsonResponse({
         'code': RetCode.SUCCESS.value,
         'message': 'success',
         'data': {
-            'datetime': get_datetime_now(),
-            'timestamp': get_timestamp_now()
+            'datetime': from_us(time_now),
+            'timestamp': time_now // US_PER_SECOND
         }
     })
@@ -0,0 +1,247 @@
+"""排队情况推送控制器
+
+以 Server-Sent Events 推送排队情况，代替客户端轮询 preview_queue 与 query_queue：
+- /user/subscribe_queue：本用户的排队情况（与 preview_queue 的 data 相同）变化时推送 status 事件
+- /admin/subscribe_queue：先推送 snapshot 事件（与 query_queue 的 data 相同），之后只推送 delta 事件
+
+调度器快照变化时唤醒连接，每个连接推送事件后至少间隔 COALESCE_INTERVAL 秒才推送下一个事件，
+间隔内的多次变化合并为一个事件。EventSource 不能设置请求头，可先由 /stream_ticket 获取短期票据，
+再通过查询参数 ticket 传递，JWT 不出现在 URL 中。
+
+ASGI 服务（manage.py serve）下由 with_event_streams 在事件循环内直接处理，不占用线程；
+WSGI 服务（runserver）下由同名 Django 视图处理，每个连接占用一个线程。
+"""
+import asyncio
+import json
+import time
+
+from typing import Any, Awaitable, Callable, Dict, Iterator
+from urllib.parse import parse_qs
+
+from django.conf import settings
+from django.http import HttpRequest, HttpResponse, JsonResponse, StreamingHttpResponse
+
+from acss_app.controller.util.resp_tool import RetCode, sse_comment, sse_event
+from acss_app.controller.util.validator import validate, ValidationError
+from acss_app.service.schd import SchedulerSnapshot, scheduler, view_to_row
+from acss_app.service.timemock import now_us
+from acss_app.service.util.jwt_tool import RequestContext, Role, authenticate, authenticate_stream_ticket
+
+
+# 同一连接两次推送之间的最短间隔（单位：秒）
+COALESCE_INTERVAL = 0.5
+# 没有事件时发送保活注释的间隔（单位：秒）
+KEEPALIVE_INTERVAL = 15.0
+
+USER_STREAM_PATH = '/user/subscribe_queue'
+ADMIN_STREAM_PATH = '/admin/subscribe_queue'
+
+
+class UserQueueStream:
+    """单个连接的用户排队情况推送状态"""
+
+    def __init__(self, username: str) -> None:
+        self.__username = username
+        self.__last_preview: Dict[str, Any] | None = None
+
+    def poll(self, snapshot: SchedulerSnapshot) -> str | None:
+        """本用户的排队情况变化时返回待推送的事件"""
+        preview = snapshot.to_preview(self.__username)
+        if preview == self.__last_preview:
+            return None
+        self.__last_preview = preview
+        return sse_event('status', preview, snapshot.version)
+
+
+class AdminQueueStream:
+    """单个连接的总体排队情况推送状态
+
+    首个事件为完整的 snapshot，之后的 delta 事件只包含新增或变化的行（upserts）
+    与已离开队列的用户名（removes），以用户名标识行。
+    与上次推送的快照按分片比较请求ID索引（CowMap.diff），只遍历变化的桶，不逐个比较全部请求。
+    """
+
+    def __init__(self) -> None:
+        self.__last_snapshot: SchedulerSnapshot | None = None
+
+    def poll(self, snapshot: SchedulerSnapshot) -> str | None:
+        last_snapshot = self.__last_snapshot
+        self.__last_snapshot = snapshot
+
+        if last_snapshot is None:
+            return sse_event('snapshot', {
+                'version': snapshot.version,
+                'rows': snapshot.to_rows()
+            }, snapshot.version)
+
+        time_now = now_us()
+        upserts = []
+        removes = []
+        for shard, last_shard in zip(snapshot.shards, last_snapshot.shards):
+            changed, removed = shard.by_request_id.diff(last_shard.by_request_id)
+            upserts.extend(view_to_row(shard.by_request_id[request_id], time_now) for request_id in changed)
+            removes.extend(last_shard.by_request_id[request_id].username for request_id in removed)
+        if len(removes) > 0:
+            # 结束后重新提交的用户只需更新行
+            upserted = {row['username'] for row in upserts}
+            removes = [username for username in removes if username not in upserted]
+        if len(upserts) == 0 and len(removes) == 0:
+            return None
+        return sse_event('delta', {
+            'version': snapshot.version,
+            'upserts': upserts,
+            'removes': removes
+        }, snapshot.version)
+
+
+def __create_stream(path: str, token: str | None, ticket: str | None) -> UserQueueStream | AdminQueueStream | str:
+    """验证 JWT（请求头）或推送连接票据（查询参数）并创建推送状态，失败时返回错误信息"""
+    role = Role.USER if path == USER_STREAM_PATH else Role.ADMIN
+    if token is None and ticket is not None:
+        context = authenticate_stream_ticket(ticket, role)
+    else:
+        context = authenticate(token, role)
+    if not isinstance(context, RequestContext):
+        return context
+    if role == Role.USER:
+        return UserQueueStream(context.username)
+    return AdminQueueStream()
+
+
+def __iter_events(stream: UserQueueStream | AdminQueueStream) -> Iterator[str]:
+    """阻塞地生成事件，供 WSGI 下的 StreamingHttpResponse 使用"""
+    version = -1
+    last_write_time = time.monotonic()
+    while True:
+        timeout = KEEPALIVE_INTERVAL - (time.monotonic() - last_write_time)
+        if timeout <= 0:
+            last_write_time = time.monotonic()
+            yield sse_comment('keepalive')
+            continue
+        snapshot = scheduler.wait_for_snapshot(version, timeout)
+        if snapshot.version == version:
+            continue
+        version = snapshot.version
+        event = stream.poll(snapshot)
+        if event is None:
+            continue
+        last_write_time = time.monotonic()
+        yield event
+        time.sleep(COALESCE_INTERVAL)
+
+
+def __stream_response(req: HttpRequest, path: str) -> HttpResponse:
+    try:
+        validate(req, method='GET')
+    except ValidationError as e:
+        return JsonResponse({
+            'code': RetCode.FAIL.value,
+            'message': str(e)
+        })
+
+    stream = __create_stream(path, req.META.get('HTTP_AUTHORIZATION'), req.GET.get('ticket'))
+    if isinstance(stream, str):
+        return JsonResponse({
+            'code': RetCode.FAIL.value,
+            'message': stream
+        })
+
+    response = StreamingHttpResponse(__iter_events(stream), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def user_subscribe_queue_api(req: HttpRequest) -> HttpResponse:
+    return __stream_response(req, USER_STREAM_PATH)
+
+
+def admin_subscribe_queue_api(req: HttpRequest) -> HttpResponse:
+    return __stream_response(req, ADMIN_STREAM_PATH)
+
+
+ASGIApp = Callable[[Dict[str, Any], Callable[[], Awaitable[dict]], Callable[[dict], Awaitable[None]]], Awaitable[None]]
+
+
+async def __wait_disconnect(receive: Callable[[], Awaitable[dict]]) -> None:
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
+
+
+async def __serve_stream(scope: Dict[str, Any], receive, send) -> None:
+    """在事件循环内处理推送连接，直到客户端断开"""
+    headers = {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope['headers']}
+    ticket = parse_qs(scope.get('query_string', b'').decode('latin-1')).get('ticket', [None])[0]
+    # 推送连接不经过 Django 中间件，需要自行添加跨域响应头；只允许 STREAM_ALLOWED_ORIGINS 中的来源，
+    # 票据通过查询参数传递，不需要携带 Cookie
+    cors_headers = [(b'vary', b'origin')]
+    origin = headers.get('origin')
+    if origin is not None and origin in getattr(settings, 'STREAM_ALLOWED_ORIGINS', ()):
+        cors_headers.append((b'access-control-allow-origin', origin.encode('latin-1')))
+
+    stream = __create_stream(scope['path'], headers.get('authorization'), ticket)
+    if isinstance(stream, str):
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [(b'content-type', b'application/json')] + cors_headers
+        })
+        await send({
+            'type': 'http.response.body',
+            'body': json.dumps({'code': RetCode.FAIL.value, 'message': stream}).encode()
+        })
+        return
+
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [(b'content-type', b'text/event-stream'),
+                    (b'cache-control', b'no-cache'),
+                    (b'x-accel-buffering', b'no')] + cors_headers
+    })
+
+    disconnected = asyncio.ensure_future(__wait_disconnect(receive))
+    version = -1
+    last_write_time = time.monotonic()
+    try:
+        while True:
+            timeout = KEEPALIVE_INTERVAL - (time.monotonic() - last_write_time)
+            if timeout <= 0:
+                event = sse_comment('keepalive')
+            else:
+                waiting = asyncio.ensure_future(scheduler.wait_for_snapshot_async(version, timeout))
+                await asyncio.wait({waiting, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+                if disconnected.done():
+                    waiting.cancel()
+                    return
+                snapshot = waiting.result()
+                if snapshot.version == version:
+                    continue
+                version = snapshot.version
+                event = stream.poll(snapshot)
+                if event is None:
+                    continue
+
+            last_write_time = time.monotonic()
+            await send({'type': 'http.response.body', 'body': event.encode(), 'more_body': True})
+            # 合并推送间隔内的变化，客户端断开时立即结束
+            await asyncio.wait({disconnected}, timeout=COALESCE_INTERVAL)
+            if disconnected.done():
+                return
+    except OSError:
+        return
+    finally:
+        disconnected.cancel()
+
+
+def with_event_streams(app: ASGIApp) -> ASGIApp:
+    """包装 ASGI 应用，在事件循环内直接处理排队情况推送连接，其余请求交给 app"""
+    async def application(scope: Dict[str, Any], receive, send) -> None:
+        if (scope['type'] == 'http' and scope['method'] == 'GET'
+                and scope['path'] in (USER_STREAM_PATH, ADMIN_STREAM_PATH)):
+            await __serve_stream(scope, receive, send)
+            return
+        await app(scope, receive, send)
+    return application
@@ -1,18 +1,24 @@
 """用户客户端控制器"""
+from datetime import date
 from decimal import Decimal
-from django.http import HttpRequest, JsonResponse
+from typing import Any, Dict, List, Tuple
 
-from acss_app.controller.util.validator import validate, ValidationError
-from acss_app.controller.util.resp_tool import RetCode
+from django.http import HttpRequest, HttpResponse, JsonResponse
+
+from acss_app.controller.util.async_tool import run_blocking
+from acss_app.controller.util.validator import compile_schema, validate, ValidationError
+from acss_app.controller.util.resp_tool import RetCode, is_not_modified, not_modified, streaming_json_response, with_etag
 from acss_app.models import PileType
 from acss_app.service.auth import Role
-from acss_app.service.exceptions import AlreadyRequested, IllegalUpdateAttemption, MappingNotExisted, OutOfSpace
-from acss_app.service.simple_query import get_all_orders
+from acss_app.service.exceptions import (AlreadyRequested, IllegalCursor, IllegalUpdateAttemption, MappingNotExisted,
+                                         OutOfSpace, SchedulerUnavailable)
+from acss_app.service.identity import get_identity
+from acss_app.service.simple_query import ORDER_PAGE_MAX_LIMIT, query_orders
 from acss_app.service.util.jwt_tool import RequestContext, preprocess_token
-from acss_app.service.schd import StatusType, scheduler
+from acss_app.service.schd import scheduler
 
 
-__submit_charging_request_schema = {
+__submit_charging_request_schema = compile_schema({
     'type': 'object',
     'required': ['charge_mode', 'require_amount', 'battery_size'],
     'properties': {
@@ -30,12 +36,17 @@ __submit_charging_request_schema = {
             'type': 'string',
             'pattern': r'\d+\.\d{2}',
             'errmsg': "battery_size 应为字符串表示的保留两位小数的实数"
+        },
+        'station_id': {
+            'type': 'string',
+            'pattern': r'^\d+$',
+            'errmsg': "station_id 应为字符串表示的充电站编号"
         }
     }
-}
+})
 
 
-__edit_charging_request_schema = {
+__edit_charging_request_schema = compile_schema({
     'type': 'object',
     'required': ['charge_mode', 'require_amount'],
     'properties': {
@@ -50,30 +61,86 @@ __edit_charging_request_schema = {
             'errmsg': "require_amount 应为字符串表示的保留两位小数的实数"
         }
     }
-}
+})
+
+
+def __parse_orders_query(req: HttpRequest) -> Dict[str, Any]:
+    kwargs = {}
+    try:
+        for name in ('begin_date', 'end_date'):
+            if name in req.GET:
+                kwargs[name] = date.fromisoformat(req.GET[name])
+    except ValueError as e:
+        raise ValidationError("请求格式非法: begin_date 与 end_date 应为 YYYY-MM-DD 格式的日期") from e
+    if 'limit' in req.GET:
+        limit = req.GET['limit']
+        if not limit.isdigit() or not 1 <= int(limit) <= ORDER_PAGE_MAX_LIMIT:
+            raise ValidationError(f"请求格式非法: limit 应为 1 到 {ORDER_PAGE_MAX_LIMIT} 之间的整数")
+        kwargs['limit'] = int(limit)
+    if 'cursor' in req.GET:
+        kwargs['cursor'] = req.GET['cursor']
+    return kwargs
+
+
+def __fetch_orders(username: str, kwargs: Dict[str, Any]) -> Tuple[List[Dict[str, Any]], str | None]:
+    """读取一页详单，ASGI 下响应内容在事件循环内迭代，不能在迭代时访问数据库"""
+    page = query_orders(username, **kwargs)
+    return list(page), page.next_cursor
 
 
 @preprocess_token(limited_role=Role.USER)
-def query_orders_api(context: RequestContext, req: HttpRequest) -> JsonResponse:
+async def query_orders_api(context: RequestContext, req: HttpRequest) -> HttpResponse:
     try:
         validate(req, method='GET')
+        kwargs = __parse_orders_query(req)
     except ValidationError as e:
         return JsonResponse({
             'code': RetCode.FAIL.value,
             'message': str(e)
         })
 
-    username = context.username
-    orders = get_all_orders(username)
+    try:
+        orders, next_cursor = await run_blocking(__fetch_orders, context.username, kwargs)
+    except IllegalCursor as e:
+        return JsonResponse({
+            'code': RetCode.FAIL.value,
+            'message': str(e)
+        })
+
+    if req.GET.get('stream') in ('1', 'true'):
+        return streaming_json_response({
+            'code': RetCode.SUCCESS.value,
+            'message': 'success'
+        }, 'data', orders, tail=lambda: {'next_cursor': next_cursor})
+
     return JsonResponse({
         'code': RetCode.SUCCESS.value,
         'message': 'success',
-        'data': orders
+        'data': orders,
+        'next_cursor': next_cursor
     })
 
 
+def __submit(request_mode: PileType, username: str, require_amount: Decimal, battery_capacity: Decimal,
+             station_id: int | None) -> None:
+    identity = get_identity(username)
+    scheduler.submit_request(
+        request_mode, username, require_amount, battery_capacity,
+        user_id=None if identity is None else identity.user_id, station_id=station_id)
+
+
+def __edit(username: str, require_amount: Decimal, request_mode: PileType) -> None:
+    request_id = scheduler.get_request_id_by_username(username)
+    scheduler.update_request(request_id, require_amount, request_mode)
+
+
+def __end(username: str) -> None:
+    request_id = scheduler.get_request_id_by_username(username)
+    scheduler.end_request(request_id)
+
+
 @preprocess_token(limited_role=Role.USER)
-def submit_charging_request(context: RequestContext, req: HttpRequest) -> JsonResponse:
+async def submit_charging_request(context: RequestContext, req: HttpRequest) -> JsonResponse:
     try:
         kwargs = validate(req, schema=__submit_charging_request_schema)
     except ValidationError as e:
@@ -85,6 +152,7 @@ def submit_charging_request(context: RequestContext, req: HttpRequest) -> JsonRe
     charge_mode: str = kwargs['charge_mode']
     require_amount: Decimal = Decimal(kwargs['require_amount'])
     battery_capacity: Decimal = Decimal(kwargs['battery_size'])
+    station_id: int | None = int(kwargs['station_id']) if 'station_id' in kwargs else None
 
     if charge_mode == 'T':
         request_mode = PileType.CHARGE
@@ -92,8 +160,7 @@ def submit_charging_request(context: RequestContext, req: HttpRequest) -> JsonRe
         request_mode = PileType.FAST_CHARGE
 
     try:
-        scheduler.submit_request(
-            request_mode, context.username, require_amount, battery_capacity)
+        await run_blocking(__submit, request_mode, context.username, require_amount, battery_capacity, station_id)
     except AlreadyRequested as e:
         return JsonResponse({
             'code': RetCode.FAIL.value,
@@ -104,6 +171,16 @@ def submit_charging_request(context: RequestContext, req: HttpRequest) -> JsonRe
             'code': RetCode.FAIL.value,
             'message': str(e)
         })
+    except MappingNotExisted as e:
+        return JsonResponse({
+            'code': RetCode.FAIL.value,
+            'message': str(e)
+        })
+    except SchedulerUnavailable as e:
+        return JsonResponse({
+            'code': RetCode.FAIL.value,
+            'message': str(e)
+        })
 
     return JsonResponse({
         'code': RetCode.SUCCESS.value,
@@ -112,7 +189,7 @@ def submit_charging_request(context: RequestContext, req: HttpRequest) -> JsonRe
 
 
 @preprocess_token(limited_role=Role.USER)
-def edit_charging_request(context: RequestContext, req: HttpRequest) -> JsonResponse:
+async def edit_charging_request(context: RequestContext, req: HttpRequest) -> JsonResponse:
     try:
         kwargs = validate(req, schema=__edit_charging_request_schema)
     except ValidationError as e:
@@ -124,9 +201,13 @@ def edit_charging_request(context: RequestContext, req: HttpRequest) -> JsonResp
     charge_mode: str = kwargs['charge_mode']
     require_amount: Decimal = Decimal(kwargs['require_amount'])
 
+    if charge_mode == 'T':
+        request_mode = PileType.CHARGE
+    elif charge_mode == 'F':
+        request_mode = PileType.FAST_CHARGE
+
     try:
-        request_id = scheduler.get_request_id_by_username(context.username)
-        scheduler.update_request(request_id, require_amount, charge_mode)
+        await run_blocking(__edit, context.username, require_amount, request_mode)
     except MappingNotExisted as e:
         return JsonResponse({
             'code': RetCode.FAIL.value,
@@ -137,6 +218,11 @@ def edit_charging_request(context: RequestContext, req: HttpRequest) -> JsonResp
             'code': RetCode.FAIL.value,
             'message': str(e)
         })
+    except SchedulerUnavailable as e:
+        return JsonResponse({
+            'code': RetCode.FAIL.value,
+            'message': str(e)
+        })
 
     return JsonResponse({
         'code': RetCode.SUCCESS.value,
@@ -145,7 +231,7 @@ def edit_charging_request(context: RequestContext, req: HttpRequest) -> JsonResp
 
 
 @preprocess_token(limited_role=Role.USER)
-def end_charging_request(context: RequestContext, req: HttpRequest) -> JsonResponse:
+async def end_charging_request(context: RequestContext, req: HttpRequest) -> JsonResponse:
     try:
         validate(req, method='GET')
     except ValidationError as e:
@@ -155,13 +241,17 @@ def end_charging_request(context: RequestContext, req: HttpRequest) -> JsonRespo
         })
 
     try:
-        request_id = scheduler.get_request_id_by_username(context.username)
-        scheduler.end_request(request_id)
+        await run_blocking(__end, context.username)
     except MappingNotExisted as e:
         return JsonResponse({
             'code': RetCode.FAIL.value,
             'message': str(e)
         })
+    except SchedulerUnavailable as e:
+        return JsonResponse({
+            'code': RetCode.FAIL.value,
+            'message': str(e)
+        })
 
     return JsonResponse({
         'code': RetCode.SUCCESS.value,
@@ -171,7 +261,7 @@ def end_charging_request(context: RequestContext, req: HttpRequest) -> JsonRespo
 
 # TODO 兼容修改请求与故障恢复
 @preprocess_token(limited_role=Role.USER)
-def preview_queue_api(context: RequestContext, req: HttpRequest) -> JsonResponse:
+async def preview_queue_api(context: RequestContext, req: HttpRequest) -> JsonResponse:
     try:
         validate(req, method='GET')
     except ValidationError as e:
@@ -180,38 +270,13 @@ def preview_queue_api(context: RequestContext, req: HttpRequest) -> JsonResponse
             'message': str(e)
         })
 
-    requested_flag = False
-    request_id = None
-    pile_id = None
-    position = -1
-
-    try:
-        request_id = scheduler.get_request_id_by_username(context.username)
-        reqeust_status = scheduler.get_request_status(request_id)
-        pile_id = reqeust_status.pile_id
-        position = reqeust_status.position
-    except MappingNotExisted:
-        requested_flag = True
-
-    if pile_id is None:
-        place = 'WAITINGPLACE'
-    else:
-        place = pile_id
-    if requested_flag:
-        cur_state = StatusType.NOTCHARGING.name
-    else:
-        cur_state = reqeust_status.status.name
-
-    if request_id is not None:
-        request_id = str(request_id)
+    snapshot = scheduler.get_snapshot()
+    etag = snapshot.preview_etag(context.username)
+    if is_not_modified(req, etag):
+        return not_modified(etag)
 
-    return JsonResponse({
+    return with_etag(JsonResponse({
         'code': RetCode.SUCCESS.value,
         'message': 'success',
-        'data': {
-            'charge_id': request_id,
-            'queue_len': position,
-            'cur_state': cur_state,
-            'place': str(place)
-        }
-    })
+        'data': snapshot.to_preview(context.username)
+    }), etag)
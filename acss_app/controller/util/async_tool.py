@@ -0,0 +1,32 @@
+"""异步视图工具"""
+import asyncio
+import functools
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+from django.db import close_old_connections
+
+
+# 异步视图中阻塞调用（访问数据库或独立调度进程）使用的线程数
+BLOCKING_POOL_SIZE = 16
+
+__executor = ThreadPoolExecutor(max_workers=BLOCKING_POOL_SIZE, thread_name_prefix='acss-blocking')
+
+
+def __call(func: Callable[..., Any], args: tuple, kwargs: dict) -> Any:
+    try:
+        return func(*args, **kwargs)
+    finally:
+        # 与请求结束时相同，按 CONN_MAX_AGE 关闭本线程的数据库连接
+        close_old_connections()
+
+
+async def run_blocking(func: Callable[..., Any], *args, **kwargs) -> Any:
+    """在线程池中执行同步调用
+
+    ASGI 下同步视图都在同一个线程内依次执行（sync_to_async(thread_sensitive=True)），
+    异步视图将阻塞调用交给该线程池，多个请求的数据库与调度进程访问可以并发进行。
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(__executor, functools.partial(__call, func, args, kwargs))
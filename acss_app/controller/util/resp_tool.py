@@ -1,7 +1,67 @@
 """响应工具箱"""
+import json
+
 from enum import Enum
+from typing import Any, Callable, Dict, Iterable, Iterator
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpRequest, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
 
 
 class RetCode(Enum):
     SUCCESS = 0
     FAIL = -1
+
+
+def is_not_modified(request: HttpRequest, etag: str) -> bool:
+    """判断客户端缓存的 ETag 是否仍然有效"""
+    return request.META.get('HTTP_IF_NONE_MATCH') == etag
+
+
+def with_etag(response: HttpResponse, etag: str) -> HttpResponse:
+    response['ETag'] = etag
+    return response
+
+
+def not_modified(etag: str) -> HttpResponse:
+    return with_etag(HttpResponseNotModified(), etag)
+
+
+def streaming_json_response(head: Dict[str, Any], key: str, items: Iterable[Any],
+                            tail: Callable[[], Dict[str, Any]] = None) -> StreamingHttpResponse:
+    """流式输出 JSON 对象
+
+    依次输出 head 的字段、key 对应的数组（逐项序列化）与 tail 返回的字段，
+    tail 在数组输出完成后调用。序列化方式与 JsonResponse 相同。
+    ASGI 下响应内容在事件循环内迭代，items 与 tail 不能访问数据库，应先在线程池中读取。
+    """
+    def chunks() -> Iterator[str]:
+        encoder = DjangoJSONEncoder()
+        yield encoder.encode(head)[:-1]
+        yield f', {json.dumps(key)}: ['
+        separator = ''
+        for item in items:
+            yield separator + encoder.encode(item)
+            separator = ', '
+        yield ']'
+        if tail is not None:
+            for tail_key, value in tail().items():
+                yield f', {json.dumps(tail_key)}: {encoder.encode(value)}'
+        yield '}'
+
+    return StreamingHttpResponse(chunks(), content_type='application/json')
+
+
+def sse_event(event: str, data: Any, event_id: Any = None) -> str:
+    """格式化一条 Server-Sent Events 事件，data 按 JsonResponse 的方式序列化"""
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'event: {event}')
+    lines.append(f'data: {DjangoJSONEncoder().encode(data)}')
+    return '\n'.join(lines) + '\n\n'
+
+
+def sse_comment(comment: str) -> str:
+    """格式化一条 Server-Sent Events 注释，用于保活"""
+    return f': {comment}\n\n'
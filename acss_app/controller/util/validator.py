@@ -1,26 +1,121 @@
 """请求检查工具箱"""
 import json
+import re
 
 from json import JSONDecodeError
-from typing import Dict
+from typing import Any, Callable, Dict, List
 
 from django.http import HttpRequest
-from jsonschema import validate as _validate, ValidationError as _ValidationError
+from jsonschema import ValidationError as _ValidationError
+from jsonschema.exceptions import best_match
+from jsonschema.validators import validator_for
 
 
 class ValidationError(BaseException):
     pass
 
 
-def validate(request: HttpRequest, method: str = 'POST', schema: Dict = None) -> Dict | None:
+_FAST_TYPES = {
+    'object': dict,
+    'array': list,
+    'string': str,
+    'boolean': bool,
+}
+
+# 快速检查时忽略的关键字（不影响校验结果）
+_ANNOTATION_KEYWORDS = {'errmsg', 'description', 'title', 'example', '$schema'}
+
+
+def _compile_fast_check(schema: Dict) -> Callable[[Any], bool] | None:
+    """将常用关键字组成的格式编译为只判断是否合法的检查函数
+
+    Returns:
+        Callable[[Any], bool] | None: 检查函数，格式包含不支持的关键字时返回 None
+    """
+    checks: List[Callable[[Any], bool]] = []
+    for key, value in schema.items():
+        match key:
+            case _ if key in _ANNOTATION_KEYWORDS:
+                continue
+            case 'type' if isinstance(value, str) and value in _FAST_TYPES:
+                checks.append(lambda x, t=_FAST_TYPES[value]: isinstance(x, t))
+            case 'required':
+                names = tuple(value)
+                checks.append(lambda x: not isinstance(x, dict) or all(name in x for name in names))
+            case 'properties':
+                properties = []
+                for name, sub_schema in value.items():
+                    sub_check = _compile_fast_check(sub_schema)
+                    if sub_check is None:
+                        return None
+                    properties.append((name, sub_check))
+                checks.append(lambda x: not isinstance(x, dict) or
+                              all(name not in x or check(x[name]) for name, check in properties))
+            case 'items' if isinstance(value, dict):
+                item_check = _compile_fast_check(value)
+                if item_check is None:
+                    return None
+                checks.append(lambda x: not isinstance(x, list) or all(item_check(item) for item in x))
+            case 'enum' if all(isinstance(option, str) for option in value):
+                options = frozenset(value)
+                checks.append(lambda x: isinstance(x, str) and x in options)
+            case 'pattern':
+                search = re.compile(value).search
+                checks.append(lambda x: not isinstance(x, str) or search(x) is not None)
+            case 'minLength':
+                checks.append(lambda x, n=value: not isinstance(x, str) or len(x) >= n)
+            case 'maxLength':
+                checks.append(lambda x, n=value: not isinstance(x, str) or len(x) <= n)
+            case 'minItems':
+                checks.append(lambda x, n=value: not isinstance(x, list) or len(x) >= n)
+            case 'maxItems':
+                checks.append(lambda x, n=value: not isinstance(x, list) or len(x) <= n)
+            case _:
+                return None
+    if len(checks) == 1:
+        return checks[0]
+    return lambda x: all(check(x) for check in checks)
+
+
+class CompiledSchema:
+    """预编译的请求格式
+
+    编译时检查一次格式本身并创建 jsonschema 校验器，正则表达式预先编译为快速检查函数。
+    请求合法时只执行快速检查；快速检查不通过（或格式包含不支持的关键字）时
+    再由 jsonschema 校验器选出最相关的错误，错误信息与直接调用 jsonschema.validate 相同。
+    """
+
+    def __init__(self, schema: Dict) -> None:
+        cls = validator_for(schema)
+        cls.check_schema(schema)
+        self.schema = schema
+        self.__validator = cls(schema)
+        self.__fast_check = _compile_fast_check(schema)
+
+    def check(self, instance: Any) -> None:
+        if self.__fast_check is not None and self.__fast_check(instance):
+            return
+        error = best_match(self.__validator.iter_errors(instance))
+        if error is not None:
+            raise error
+
+
+def compile_schema(schema: Dict) -> CompiledSchema:
+    """编译请求格式，控制器应在导入时编译并保存结果"""
+    return CompiledSchema(schema)
+
+
+def validate(request: HttpRequest, method: str = 'POST', schema: CompiledSchema = None) -> Dict | None:
     if request.method != method:
         raise ValidationError(f"请使用{method}请求")
     if method == 'GET':
         return
+    if not isinstance(schema, CompiledSchema):
+        raise TypeError("schema 须由 compile_schema 预先编译")
 
     try:
         req = json.loads(request.body)
-        _validate(req, schema)
+        schema.check(req)
     except JSONDecodeError as e:
         raise ValidationError("请求解析错误") from e
     except _ValidationError as e:
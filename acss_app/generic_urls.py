@@ -7,5 +7,7 @@ import acss_app.controller.generic_controller as generic_controller
 
 urlpatterns = [
     path('login', auth_controller.login_api),
+    path('logout', auth_controller.logout_api),
+    path('stream_ticket', auth_controller.stream_ticket_api),
     path('time', generic_controller.query_time),
 ]
@@ -0,0 +1,12 @@
+"""根据全部详单重建收入汇总表"""
+from django.core.management.base import BaseCommand
+
+from acss_app.service.rollup import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = '根据全部详单重建收入汇总表，用于升级已有数据库或修复不一致的汇总'
+
+    def handle(self, *args, **options) -> None:
+        rollup_cnt = rebuild_rollups()
+        self.stdout.write(self.style.SUCCESS(f'{rollup_cnt} rollups rebuilt.'))
@@ -0,0 +1,17 @@
+"""检查收入汇总表与详单是否一致"""
+from django.core.management.base import BaseCommand, CommandError
+
+from acss_app.service.rollup import diff_rollups
+
+
+class Command(BaseCommand):
+    help = '检查收入汇总表与详单是否一致，不一致时列出差异并以非零状态退出'
+
+    def handle(self, *args, **options) -> None:
+        mismatches = diff_rollups()
+        for (pile_id, period, period_start), expected, actual in mismatches:
+            self.stdout.write(f'pile {pile_id} {period.name} {period_start}: '
+                              f'expected {expected}, actual {actual}')
+        if len(mismatches) > 0:
+            raise CommandError(f'{len(mismatches)} rollups mismatched, run backfill_rollups to rebuild.')
+        self.stdout.write(self.style.SUCCESS('rollups are consistent.'))
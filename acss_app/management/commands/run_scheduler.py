@@ -0,0 +1,52 @@
+"""运行独立调度进程"""
+import signal
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from acss_app.service import schd
+from acss_app.service.schd_partition import PartitionedScheduler, station_path
+from acss_app.service.schd_remote import SchedulerServer
+
+
+class Command(BaseCommand):
+    help = ('运行独立调度进程，Web 进程以 ACSS_SCHEDULER_MODE=remote 启动后通过 Unix 套接字连接；'
+            '按充电站划分时每个充电站的调度域监听各自的套接字，设置 ACSS_SCHEDULER_STATION 时只运行该充电站')
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument('--socket', default=None,
+                            help='Unix 套接字路径，默认为 settings.SCHEDULER_SOCKET_PATH')
+
+    def handle(self, *args, **options) -> None:
+        # 调度器与结算写入线程已在应用初始化时于本进程内创建
+        socket_path = options['socket'] or settings.SCHEDULER_SOCKET_PATH
+        if isinstance(schd.scheduler, PartitionedScheduler):
+            domains = {station_path(socket_path, station_id): schd.scheduler.get_domain(station_id)
+                       for station_id in schd.scheduler.station_ids}
+        else:
+            domains = {socket_path: schd.scheduler}
+        if not all(isinstance(domain, schd.Scheduler) for domain in domains.values()):
+            raise CommandError('调度进程需要以 local 模式运行，请不要设置 ACSS_SCHEDULER_MODE=remote')
+
+        servers = []
+        for path, domain in domains.items():
+            try:
+                servers.append(SchedulerServer(domain, path))
+            except OSError as e:
+                for server in servers:
+                    server.server_close()
+                raise CommandError(f'无法监听 {path}: {e}') from e
+        stopped = threading.Event()
+        signal.signal(signal.SIGTERM, lambda *_: stopped.set())
+        for server in servers:
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            self.stdout.write(f'scheduler listening on {server.server_address}')
+        try:
+            stopped.wait()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            for server in servers:
+                server.shutdown()
+                server.server_close()
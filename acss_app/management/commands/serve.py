@@ -0,0 +1,48 @@
+"""使用 ASGI 服务器（uvicorn）运行后端"""
+import os
+
+from django.conf import settings
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = '使用 uvicorn 运行 ASGI 应用，preview_queue、query_queue、time 与 subscribe_queue 接口在事件循环内直接处理'
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument('--host', default='0.0.0.0')
+        parser.add_argument('--port', type=int, default=8000)
+        parser.add_argument('--workers', type=int, default=1,
+                            help='工作进程数，大于 1 时需要以 ACSS_SCHEDULER_MODE=remote 连接独立调度进程')
+        parser.add_argument('--log-level', default='info')
+
+    def handle(self, *args, **options) -> None:
+        try:
+            import uvicorn
+        except ImportError as e:
+            raise CommandError('需要安装 uvicorn: pip install uvicorn') from e
+
+        if options['workers'] == 1:
+            # 应用已在当前进程完成初始化（local 模式下调度器及其检查线程已启动），直接传入应用对象，
+            # uvicorn 在当前进程内运行事件循环
+            from acss_app.controller.stream_controller import with_event_streams
+            uvicorn.run(with_event_streams(get_asgi_application()),
+                        host=options['host'],
+                        port=options['port'],
+                        log_level=options['log_level'],
+                        lifespan='off')
+            return
+
+        # 调度器与结算写入线程都是进程内单例，
+        # 多个工作进程需要共享独立调度进程（manage.py run_scheduler）
+        if getattr(settings, 'SCHEDULER_MODE', 'local') != 'remote':
+            raise CommandError('--workers 大于 1 时需要设置 ACSS_SCHEDULER_MODE=remote 并运行 manage.py run_scheduler')
+
+        # 工作进程各自导入 ASGI 应用，DJANGO_SETTINGS_MODULE 与 ACSS_SCHEDULER_MODE 经环境变量传递
+        os.environ['DJANGO_SETTINGS_MODULE'] = settings.SETTINGS_MODULE
+        uvicorn.run('acss_site.asgi:application',
+                    host=options['host'],
+                    port=options['port'],
+                    workers=options['workers'],
+                    log_level=options['log_level'],
+                    lifespan='off')
@@ -0,0 +1,31 @@
+# Generated by Django 4.0.4 on 2026-10-18 01:23
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('acss_app', '0003_pile_register_time'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PileEarningRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.IntegerField(choices=[(0, 'Day'), (1, 'Week'), (2, 'Month'), (3, 'All')])),
+                ('period_start', models.DateField()),
+                ('order_count', models.IntegerField(default=0)),
+                ('charging_earning', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('service_earning', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('total_earning', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('pile', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, to='acss_app.pile')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='pileearningrollup',
+            constraint=models.UniqueConstraint(fields=('pile', 'period', 'period_start'), name='unique_pile_earning_rollup'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.0.4 on 2026-10-18 01:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('acss_app', '0004_pileearningrollup'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', 'create_time'], name='order_user_create_time_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.0.4 on 2026-10-18 09:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('acss_app', '0005_order_user_create_time_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Station',
+            fields=[
+                ('station_id', models.BigAutoField(primary_key=True, serialize=False, unique=True)),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('waiting_area_capacity', models.IntegerField(default=15)),
+                ('waiting_queue_capacity', models.IntegerField(default=3)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='pile',
+            name='station',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.DO_NOTHING, to='acss_app.station'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.0.4 on 2026-10-18 10:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('acss_app', '0006_station'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StationClaim',
+            fields=[
+                ('username', models.CharField(max_length=20, primary_key=True, serialize=False)),
+                ('station_id', models.IntegerField()),
+                ('request_id', models.BigIntegerField(blank=True, null=True)),
+                ('claim_time', models.DateTimeField()),
+            ],
+        ),
+    ]
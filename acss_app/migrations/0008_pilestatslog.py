@@ -0,0 +1,24 @@
+# Generated by Django 4.0.4 on 2026-10-18 11:04
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('acss_app', '0007_stationclaim'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PileStatsLog',
+            fields=[
+                ('log_id', models.BigAutoField(primary_key=True, serialize=False, unique=True)),
+                ('usage_times', models.IntegerField()),
+                ('charging_time', models.IntegerField()),
+                ('charging_amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('pile', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, to='acss_app.pile')),
+            ],
+        ),
+    ]
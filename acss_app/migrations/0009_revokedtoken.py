@@ -0,0 +1,21 @@
+# Generated by Django 4.0.4 on 2026-10-18 11:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('acss_app', '0008_pilestatslog'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RevokedToken',
+            fields=[
+                ('revoke_id', models.BigAutoField(primary_key=True, serialize=False, unique=True)),
+                ('jti', models.CharField(max_length=32, unique=True)),
+                ('expire_time', models.FloatField(db_index=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.0.4 on 2026-10-18 11:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('acss_app', '0009_revokedtoken'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='station',
+            name='waiting_area_capacity',
+            field=models.IntegerField(default=2000),
+        ),
+    ]
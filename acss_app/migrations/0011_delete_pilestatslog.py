@@ -0,0 +1,32 @@
+# Generated by Django 4.0.4 on 2026-10-18 11:23
+
+from django.db import migrations
+from django.db.models import F, Sum
+
+
+def fold_pending_logs(apps, schema_editor):
+    """删除增量日志表前，将尚未汇总的增量加到充电桩累计数据上"""
+    Pile = apps.get_model('acss_app', 'Pile')
+    PileStatsLog = apps.get_model('acss_app', 'PileStatsLog')
+    rows = PileStatsLog.objects.values('pile_id').annotate(usage_times=Sum('usage_times'),
+                                                           charging_time=Sum('charging_time'),
+                                                           charging_amount=Sum('charging_amount'))
+    for row in rows:
+        Pile.objects.filter(pile_id=row['pile_id']).update(
+            cumulative_usage_times=F('cumulative_usage_times') + row['usage_times'],
+            cumulative_charging_time=F('cumulative_charging_time') + row['charging_time'],
+            cumulative_charging_amount=F('cumulative_charging_amount') + row['charging_amount'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('acss_app', '0010_station_waiting_area_capacity'),
+    ]
+
+    operations = [
+        migrations.RunPython(fold_pending_logs, migrations.RunPython.noop),
+        migrations.DeleteModel(
+            name='PileStatsLog',
+        ),
+    ]
@@ -12,6 +12,16 @@ class User(models.Model):
     is_admin = models.BooleanField(default=False, blank=False)
 
 
+class RevokedToken(models.Model):
+    """已吊销JWT的ORM模型
+
+    各进程定期读取新增的记录，JWT过期后删除
+    """
+    revoke_id = models.BigAutoField(primary_key=True, unique=True, blank=False)
+    jti = models.CharField(max_length=32, unique=True, blank=False)  # JWT编号
+    expire_time = models.FloatField(db_index=True, blank=False)  # JWT 过期时间戳
+
+
 class PileStatus(models.IntegerChoices):
     """充电桩状态枚举类
     """
@@ -27,10 +37,34 @@ class PileType(models.IntegerChoices):
     FAST_CHARGE = 1  # 快充充电桩
 
 
+class Station(models.Model):
+    """充电站ORM模型
+
+    每个充电站是一个独立的调度域，拥有各自的等候区与充电桩队列
+    """
+    station_id = models.BigAutoField(primary_key=True, unique=True, blank=False)
+    name = models.CharField(max_length=50, unique=True, blank=False)
+    waiting_area_capacity = models.IntegerField(default=2000)
+    waiting_queue_capacity = models.IntegerField(default=3)
+
+
+class StationClaim(models.Model):
+    """用户充电站认领ORM模型
+
+    连接独立调度进程时各 Web 进程共用，保证同一用户至多在一个充电站有请求；
+    提交请求前认领，提交成功后记录请求ID，请求结束后删除
+    """
+    username = models.CharField(max_length=20, primary_key=True)
+    station_id = models.IntegerField(blank=False)
+    request_id = models.BigIntegerField(null=True, blank=True)  # 为空时请求尚未提交成功
+    claim_time = models.DateTimeField(blank=False)
+
+
 class Pile(models.Model):
     """充电桩ORM模型
     """
     pile_id = models.BigAutoField(primary_key=True, unique=True, blank=False)
+    station = models.ForeignKey(to=Station, on_delete=models.DO_NOTHING, null=True, blank=True)  # 为空时属于默认调度域
     status = models.IntegerField(choices=PileStatus.choices)
     pile_type = models.IntegerField(choices=PileType.choices)
     register_time = models.DateField(blank=False)
@@ -53,3 +87,38 @@ class Order(models.Model):
     total_cost = models.DecimalField(max_digits=5, decimal_places=2, blank=False)
     charged_amount = models.DecimalField(max_digits=6, decimal_places=2, blank=False)
     charged_time = models.IntegerField(blank=False)
+
+    class Meta:
+        indexes = [
+            # 按用户分页查询详单
+            models.Index(fields=['user', 'create_time'], name='order_user_create_time_idx')
+        ]
+
+
+class RollupPeriod(models.IntegerChoices):
+    """收入汇总周期枚举类
+    """
+    DAY = 0  # 按天
+    WEEK = 1  # 按周（周一开始）
+    MONTH = 2  # 按月
+    ALL = 3  # 全部时间
+
+
+class PileEarningRollup(models.Model):
+    """充电桩收入汇总ORM模型
+
+    按详单生成时间所在周期汇总，生成详单时增量更新
+    """
+    pile = models.ForeignKey(to=Pile, on_delete=models.DO_NOTHING, blank=False)
+    period = models.IntegerField(choices=RollupPeriod.choices)
+    period_start = models.DateField(blank=False)
+    order_count = models.IntegerField(default=0)
+    charging_earning = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    service_earning = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    total_earning = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['pile', 'period', 'period_start'],
+                                    name='unique_pile_earning_rollup')
+        ]
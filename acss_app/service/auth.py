@@ -7,18 +7,20 @@ from django.core.exceptions import ObjectDoesNotExist
 
 from acss_app.models import User
 from acss_app.service.exceptions import UserAlreadyExisted, UserDoesNotExisted, WrongPassword
-from acss_app.service.util.jwt_tool import Role, gen_token
+from acss_app.service.identity import identity_cache, remember_user
+from acss_app.service.util.jwt_tool import RequestContext, Role, gen_token, revoke_token
 
 
 def register(username: str, password: str, re_password: str) -> None:
     if password != re_password:
         raise WrongPassword("两次输入的密码不一致")
-    registered: User = User.objects.filter(username=username).exists()
-    if registered:
+    # 用户名已缓存说明已注册，无需查询数据库
+    if identity_cache.get(username) is not None or User.objects.filter(username=username).exists():
         raise UserAlreadyExisted("用户名已被注册")
     hashed_password = hashlib.md5(password.encode('utf-8')).hexdigest()
     user = User(username=username, password=hashed_password)
     user.save()
+    remember_user(user)
 
 
 def login(username: str, password: str) -> Tuple[str, Role]:
@@ -42,7 +44,13 @@ def login(username: str, password: str) -> Tuple[str, Role]:
     hashed_password = hashlib.md5(password.encode('utf-8')).hexdigest()
     if user.password != hashed_password:
         raise WrongPassword("密码错误")
+    remember_user(user)
     role = Role.USER
     if user.is_admin:
         role = Role.ADMIN
     return gen_token(username, role.name), role
+
+
+def logout(context: RequestContext) -> None:
+    """退出登录，吊销当前请求使用的JWT"""
+    revoke_token(context)
@@ -1,12 +1,19 @@
 """计费模块"""
+from dataclasses import dataclass
 from datetime import datetime
 from decimal import Decimal
-from logging import debug
+from logging import debug, warning
+from typing import Dict, Iterable, List, Tuple
 
-from acss_app.models import Pile, PileType
+from django.db import transaction
+
+from acss_app.models import PileType
 from acss_app.models import Order
 from acss_app.models import User
-from acss_app.service.timemock import get_datetime_now
+from acss_app.service.identity import identity_cache, remember_user
+from acss_app.service.rollup import record_order_rollups
+from acss_app.service.pile_stats import PileStatsDelta, record_pile_stats
+from acss_app.service.timemock import get_clock
 
 # 计费区间:
 # |  index   |   0    |   1    |    2    |    3    |    4    |    5    |   6    |
@@ -41,14 +48,100 @@ CHARGING_COST_PER_KWH_MEDIUM = Decimal('0.70')
 CHARGING_COST_PER_KWH_BOTTOM = Decimal('0.40')
 
 
+SECONDS_PER_DAY = 24 * 3600
+
+
+def __build_tariff_table():
+    """预计算一天内各计费区间的起点（秒）及各区间起点之前三种类型的累计时长（秒）"""
+    interval_begins = [0] + [hour * 3600 for hour in BILLING_INTERVALS_END[:-1]]
+    cumulative = [[0, 0, 0]]
+    for index, interval_begin in enumerate(interval_begins):
+        interval_end = BILLING_INTERVALS_END[index] * 3600 or SECONDS_PER_DAY
+        seconds = list(cumulative[-1])
+        seconds[WHICH_TYPE[index]] += interval_end - interval_begin
+        cumulative.append(seconds)
+    return interval_begins, cumulative
+
+
+_INTERVAL_BEGINS, _CUMULATIVE_SECONDS = __build_tariff_table()
+_SECONDS_PER_DAY_BY_TYPE = _CUMULATIVE_SECONDS[-1]
+_CHARGING_COST_PER_KWH = [CHARGING_COST_PER_KWH_BOTTOM,
+                          CHARGING_COST_PER_KWH_MEDIUM,
+                          CHARGING_COST_PER_KWH_TOP]
+_CENT = Decimal('0.00')
+
+
+def split_by_interval_type(begin_time: datetime, end_time: datetime) -> List[int]:
+    """计算 [begin_time, end_time) 在三种区间类型内的时长（单位：秒）
+
+    时长 = 整天数 * 每天各类型时长 + 结束时刻与开始时刻在当天累计时长之差，查表次数与时长无关。
+    不足一秒的部分与逐区间计算时相同：在同一天的同一区间内时取时长的整秒数，
+    否则开始时间向上取整、结束时间向下取整；整秒数为零时，视为在开始时刻所属区间内充电一秒。
+    """
+    # 同一天的同一区间内（最常见的情形）不查累计表
+    span = end_time - begin_time
+    begin_interval = WHICH_INTERVAL[begin_time.hour]
+    if span.days == 0 and span.seconds > 0 and begin_time.day == end_time.day and \
+            begin_interval == WHICH_INTERVAL[end_time.hour]:
+        intervals_time_cnt = [0, 0, 0]
+        intervals_time_cnt[WHICH_TYPE[begin_interval]] = span.seconds
+        return intervals_time_cnt
+
+    begin_days = begin_time.toordinal()
+    begin_second = begin_time.hour * 3600 + begin_time.minute * 60 + begin_time.second
+    if begin_time.microsecond > 0:
+        begin_second += 1
+        if begin_second == SECONDS_PER_DAY:
+            begin_days, begin_second = begin_days + 1, 0
+    end_days = end_time.toordinal()
+    end_second = end_time.hour * 3600 + end_time.minute * 60 + end_time.second
+    begin_interval = WHICH_INTERVAL[begin_second // 3600]
+    end_interval = WHICH_INTERVAL[end_second // 3600]
+    begin_cumulative = _CUMULATIVE_SECONDS[begin_interval]
+    end_cumulative = _CUMULATIVE_SECONDS[end_interval]
+    days = end_days - begin_days
+    intervals_time_cnt = [
+        days * _SECONDS_PER_DAY_BY_TYPE[BOTTOM] + end_cumulative[BOTTOM] - begin_cumulative[BOTTOM],
+        days * _SECONDS_PER_DAY_BY_TYPE[MEDIUM] + end_cumulative[MEDIUM] - begin_cumulative[MEDIUM],
+        days * _SECONDS_PER_DAY_BY_TYPE[TOP] + end_cumulative[TOP] - begin_cumulative[TOP]
+    ]
+    intervals_time_cnt[WHICH_TYPE[end_interval]] += end_second - _INTERVAL_BEGINS[end_interval]
+    intervals_time_cnt[WHICH_TYPE[begin_interval]] -= begin_second - _INTERVAL_BEGINS[begin_interval]
+    if days < 0 or (days == 0 and end_second <= begin_second):
+        intervals_time_cnt = [0, 0, 0]
+        intervals_time_cnt[WHICH_TYPE[WHICH_INTERVAL[begin_time.hour]]] = 1
+    return intervals_time_cnt
+
+
+def __costs_from_seconds(intervals_time_cnt: List[int], amount: Decimal):
+    # 按照与时间的正比例关系计算各个区间的充电度数
+    # 充电费 = 单位电价 * 充电度数
+    # 时长为零的区间费用为零，跳过不影响结果
+    intervals_time_sum = sum(intervals_time_cnt)
+    charging_cost = 0
+    for interval_type in (BOTTOM, MEDIUM, TOP):
+        interval_time = intervals_time_cnt[interval_type]
+        if interval_time != 0:
+            charging_cost += amount * _CHARGING_COST_PER_KWH[interval_type] * \
+                interval_time / intervals_time_sum
+    # 服务费 = 服务费单价 * 充电度数
+    service_cost = SERVICE_COST_PER_KWH * amount
+    # 总费用 = 充电费 + 服务费
+    charging_cost = Decimal(charging_cost).quantize(_CENT)
+    service_cost = Decimal(service_cost).quantize(_CENT)
+    return charging_cost + service_cost, charging_cost, service_cost
+
+
 def calc_cost(begin_time: datetime,
               end_time: datetime,
               amount: Decimal):
     """计算费用
 
+    按计费区间表查表计算，耗时与充电时长无关。
+
     Args:
         begin_time (datetime): 开始时间（包含）
-        end_time (datetime): 结束时间（包含）
+        end_time (datetime): 结束时间（不包含）
         amount (Decimal): 用量（单位：度）
 
     Returns:
@@ -56,66 +149,108 @@ def calc_cost(begin_time: datetime,
         Decimal: 充电费
         Decimal: 服务费
     """
-    intervals_time_cnt = [0, 0, 0]           # 三种区间的计时列表（单位：秒）
-    intervals_charging_cost = [0, 0, 0]       # 三种区间的充电量列表（单位：度）
-    current_time = begin_time
-    current_interval = WHICH_INTERVAL[begin_time.hour]          # 开始时间所属区间
-    end_interval = WHICH_INTERVAL[end_time.hour]                # 结束时间所属区间
-    print(datetime.now(), '开始时间所属区间', current_interval, sep='\t')
-    print(datetime.now(), '结束时间所属区间', end_interval, sep='\t')
-    # 当起始和结束不在同一天的同一区间时
-    while not ((end_time - current_time).days == 0 and end_interval == current_interval):
-        print(datetime.now(), '当前时间所属区间', current_interval, sep='\t')
-        print(datetime.now(), 'current_time', current_time, sep='\t')
-
-        current_interval_type = WHICH_TYPE[current_interval]    # 获取当前区间的类型
-
-        print(datetime.now(), '当前时间所属区间类型', current_interval_type, sep='\t')
-
-        next_interval_time = datetime(current_time.year,
-                                      current_time.month,
-                                      current_time.day,
-                                      BILLING_INTERVALS_END[current_interval], 0, 0)
-        current_interval = current_interval + 1  # 进入下一区间
-        if current_interval % 7 == 0:
-            current_interval = 0
-            if (end_time - current_time).days > 0 or end_time.day > current_time.day:
-                next_interval_time = datetime(current_time.year,
-                                              current_time.month,
-                                              current_time.day + 1,
-                                              next_interval_time.hour, 0, 0)  # 进入下一天
-        intervals_time_cnt[current_interval_type] += (
-            next_interval_time - current_time).seconds  # 累计时间差
-        current_time = next_interval_time
-
-    print(datetime.now(), 'current_time', current_time, sep='\t')
-    print(datetime.now(), 'end_time', end_time, sep='\t')
-    # 累计同一天同一区间内当前时刻到结束的时间
-    current_interval_type = WHICH_TYPE[current_interval]
-    intervals_time_cnt[current_interval_type] += (
-        end_time - current_time).seconds
-    print(datetime.now(), 'intervals_time_cnt', intervals_time_cnt, sep='\t')
-    # 按照与时间的正比例关系计算各个区间的充电度数
-    # 充电费 = 单位电价 * 充电度数
-    intervals_time_sum = sum(intervals_time_cnt)
-    print(datetime.now(), 'intervals_time_sum', intervals_time_sum, sep='\t')
-    intervals_charging_cost[TOP] = amount * CHARGING_COST_PER_KWH_TOP * \
-        intervals_time_cnt[TOP] / intervals_time_sum
-    intervals_charging_cost[MEDIUM] = amount * CHARGING_COST_PER_KWH_MEDIUM * \
-        intervals_time_cnt[MEDIUM] / intervals_time_sum
-    intervals_charging_cost[BOTTOM] = amount * CHARGING_COST_PER_KWH_BOTTOM * \
-        intervals_time_cnt[BOTTOM] / intervals_time_sum
-    print(datetime.now(), 'intervals_charging_cost',
-          intervals_charging_cost, sep='\t')
-    charging_cost = sum(intervals_charging_cost)
-    # 服务费 = 服务费单价 * 充电度数
-    service_cost = SERVICE_COST_PER_KWH * amount
-    # 总费用 = 充电费 + 服务费
-    print(datetime.now(), 'charging_cost', charging_cost, sep='\t')
-    print(datetime.now(), 'service_cost', service_cost, sep='\t')
-    charging_cost = Decimal(charging_cost).quantize(Decimal('0.00'))
-    service_cost = Decimal(service_cost).quantize(Decimal('0.00'))
-    return charging_cost + service_cost, charging_cost, service_cost
+    return __costs_from_seconds(split_by_interval_type(begin_time, end_time), amount)
+
+
+def calc_costs(spans: Iterable[Tuple[datetime, datetime, Decimal]]) -> List[Tuple[Decimal, Decimal, Decimal]]:
+    """批量计算费用，用于重新结算大量详单
+
+    先对全部时段查表得到各区间类型时长，再逐单计价。
+
+    Args:
+        spans (Iterable[Tuple[datetime, datetime, Decimal]]): (开始时间, 结束时间, 用量) 列表
+
+    Returns:
+        List[Tuple[Decimal, Decimal, Decimal]]: 与输入顺序一致的 (总费用, 充电费, 服务费) 列表
+    """
+    splits = [(split_by_interval_type(begin_time, end_time), amount)
+              for begin_time, end_time, amount in spans]
+    return [__costs_from_seconds(intervals_time_cnt, amount)
+            for intervals_time_cnt, amount in splits]
+
+
+@dataclass(frozen=True)
+class Settlement:
+    """结算记录
+
+    充电结束时由调度器生成，之后不再修改，由结算写入线程批量生成详单。
+    """
+    request_type: PileType
+    pile_id: int
+    username: str
+    amount: Decimal
+    begin_time: datetime
+    end_time: datetime
+    create_time: datetime
+    user_id: int | None = None  # 提交请求时解析的用户编号，为 None 时按用户名查询
+
+
+def create_orders(settlements: Iterable[Settlement]) -> int:
+    """批量生成详单
+
+    优先使用结算记录携带的用户编号，其次查询用户身份缓存，其余用户名合并为一次查询。
+    详单使用 bulk_create 写入，并在同一事务内更新收入汇总与充电桩累计数据（每个充电桩一条自增语句）。
+    用户不存在的结算记录会被跳过并记录警告。
+
+    Args:
+        settlements (Iterable[Settlement]): 结算记录
+
+    Returns:
+        int: 生成的详单数量
+    """
+    settlements = list(settlements)
+    user_ids: Dict[str, int] = {}
+    unresolved_usernames = set()
+    for settlement in settlements:
+        if settlement.user_id is not None:
+            user_ids[settlement.username] = settlement.user_id
+            continue
+        identity = identity_cache.get(settlement.username)
+        if identity is not None:
+            user_ids[settlement.username] = identity.user_id
+        else:
+            unresolved_usernames.add(settlement.username)
+    unresolved_usernames.difference_update(user_ids)
+    if len(unresolved_usernames) > 0:
+        for user in User.objects.filter(username__in=unresolved_usernames).only('user_id', 'username', 'is_admin'):
+            user_ids[user.username] = remember_user(user).user_id
+    known_settlements = []
+    for settlement in settlements:
+        if settlement.username not in user_ids:
+            warning("[settlement] user %s does not exist, order on pile %d skipped.",
+                    settlement.username, settlement.pile_id)
+            continue
+        known_settlements.append(settlement)
+    costs_list = calc_costs((settlement.begin_time, settlement.end_time, settlement.amount)
+                            for settlement in known_settlements)
+
+    orders = []
+    pile_deltas: Dict[int, PileStatsDelta] = {}
+    for settlement, costs in zip(known_settlements, costs_list):
+        order = Order()
+        order.pile_id = settlement.pile_id
+        order.user_id = user_ids[settlement.username]
+        order.begin_time = settlement.begin_time
+        order.end_time = settlement.end_time
+        order.create_time = settlement.create_time
+        order.total_cost = costs[0]
+        order.charging_cost = costs[1]
+        order.service_cost = costs[2]
+        order.charged_amount = settlement.amount
+        order.charged_time = (settlement.end_time - settlement.begin_time).seconds
+        orders.append(order)
+
+        delta = pile_deltas.setdefault(settlement.pile_id, PileStatsDelta())
+        delta.usage_times += 1
+        delta.charging_time += order.charged_time
+        delta.charging_amount += order.charged_amount
+
+    with transaction.atomic():
+        Order.objects.bulk_create(orders)
+        record_order_rollups(orders)
+        record_pile_stats(pile_deltas)
+    debug("[settlement] %d orders created.", len(orders))
+    return len(orders)
 
 
 def create_order(request_type: PileType,
@@ -126,94 +261,16 @@ def create_order(request_type: PileType,
                  end_time: datetime) -> None:
     """生成详单
 
-    使用 Django ORM 生成一条详单记录，详单的 create_time 字段
-    使用 timemock 模块的 get_datetime_now 获取。
+    同步生成一条详单记录，详单的 create_time 字段
+    取 timemock 模块全局时钟的当前时刻。
 
     Args:
         request_type (PileType): 充电模式
         pild_id (int): 充电桩编号
         username (str): 用户名
         amount (Decimal): 用量
-        battery_capacity (Decimal): 电池容量
         begin_time (datetime): 开始时间
         end_time (datetime): 结束时间
     """
-    costs = calc_cost(begin_time=begin_time, end_time=end_time, amount=amount)
-    order = Order()
-    # order.request_type = request_type
-    order.pile_id = pile_id
-    order.begin_time = begin_time
-    order.end_time = end_time
-    order.create_time = get_datetime_now()
-    order.total_cost = costs[0]
-    order.charging_cost = costs[1]
-    order.service_cost = costs[2]
-    order.charged_amount = amount
-    order.charged_time = (end_time - begin_time).seconds
-    # 需要注意详单内有外键 pile 和 user，这里传入的是username，需要设置为user_id
-    # 查找 User
-    user: User = User.objects.get(username=username)
-    order.user_id = user.user_id
-    # 保存数据至数据库
-    order.save()
-    debug("order created.")  # debug
-
-    pile: Pile = Pile.objects.get(pile_id=pile_id)
-    pile.cumulative_charging_amount += order.charged_amount
-    pile.cumulative_charging_time += order.charged_time
-    pile.cumulative_usage_times += 1
-    pile.save()
-
-
-if __name__ == '__main__':
-    # calc_cost-Tests
-    # Test-01
-    begin = datetime(2022, 6, 6, 7, 0, 0)
-    end = datetime(2022, 6, 6, 10, 0, 0)
-    amount = 10
-    print(datetime.now(), 'Expected Answer of Test-01', '15.00', sep='\t')
-    if calc_cost(begin, end, amount) == Decimal(15.00):
-        print(datetime.now(), 'Pass Test-01 ✔', sep='\t')
-    else:
-        print(datetime.now(), 'Pass Test-01 ✘', sep='\t')
-    print()
-
-    # Test-02
-    begin = datetime(2022, 6, 6, 21, 0, 0)
-    end = datetime(2022, 6, 7, 0, 0)
-    amount = 30
-    print(datetime.now(), 'Expected Answer of Test-02', '42.00', sep='\t')
-    if calc_cost(begin, end, amount) == Decimal(42.00).quantize(Decimal('0.00')):
-        print(datetime.now(), 'Pass Test-02 ✔', sep='\t')
-    else:
-        print(datetime.now(), 'Pass Test-02 ✘', sep='\t')
-    print()
-
-    # Test-03
-    begin = datetime(2022, 6, 6, 21, 0, 0)
-    end = datetime(2022, 6, 7, 21, 0, 0)
-    amount = 30
-    print(datetime.now(), 'Expected Answer of Test-03', '42.00', sep='\t')
-    if calc_cost(begin, end, amount) == Decimal(45.00).quantize(Decimal('0.00')):
-        print(datetime.now(), 'Pass Test-03 ✔', sep='\t')
-    else:
-        print(datetime.now(), 'Pass Test-03 ✘', sep='\t')
-    print()
-
-    # Test-04
-    begin = datetime(2022, 6, 6, 21, 0, 0)
-    end = datetime(2022, 6, 8, 0, 0, 0)
-    amount = 30
-    print(datetime.now(), 'Expected Answer of Test-04', '44.67', sep='\t')
-    if calc_cost(begin, end, amount) == Decimal(44.67).quantize(Decimal('0.00')):
-        print(datetime.now(), 'Pass Test-04 ✔', sep='\t')
-    else:
-        print(datetime.now(), 'Pass Test-04 ✘', sep='\t')
-    print()
-
-    # create_order-Tests
-    begin = datetime(2022, 6, 6, 21, 0, 0)
-    end = datetime(2022, 6, 7, 21, 0, 0)
-    amount = Decimal(30)
-    create_order(PileType.FAST_CHARGE, 5, 'user',
-                 amount, begin, end)
+    create_orders([Settlement(request_type, pile_id, username, amount,
+                              begin_time, end_time, get_clock().now())])
@@ -39,3 +39,11 @@ class AlreadyRequested(ServiceError):
 
 class MappingNotExisted(ServiceError):
     pass
+
+
+class IllegalCursor(ServiceError):
+    pass
+
+
+class SchedulerUnavailable(ServiceError):
+    pass
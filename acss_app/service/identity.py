@@ -0,0 +1,85 @@
+"""用户身份缓存模块"""
+from collections import OrderedDict
+from dataclasses import dataclass
+from threading import Lock
+from typing import Dict, Iterable
+
+from acss_app.models import User
+
+
+IDENTITY_CACHE_SIZE = 10000
+
+
+@dataclass(frozen=True)
+class Identity:
+    user_id: int
+    username: str
+    is_admin: bool
+
+
+class IdentityCache:
+    """用户名 -> 用户身份的 LRU 缓存
+
+    用户名注册后不再修改，缓存条目不会过期；不存在的用户名不缓存，以便注册后立即可查。
+    """
+
+    def __init__(self, max_size: int = IDENTITY_CACHE_SIZE) -> None:
+        self.__max_size = max_size
+        self.__lock = Lock()
+        self.__entries: OrderedDict[str, Identity] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    def get(self, username: str) -> Identity | None:
+        with self.__lock:
+            identity = self.__entries.get(username)
+            if identity is not None:
+                self.__entries.move_to_end(username)
+            return identity
+
+    def put(self, identity: Identity) -> None:
+        with self.__lock:
+            self.__entries[identity.username] = identity
+            self.__entries.move_to_end(identity.username)
+            if len(self.__entries) > self.__max_size:
+                self.__entries.popitem(last=False)
+
+
+identity_cache = IdentityCache()
+
+
+def remember_user(user: User) -> Identity:
+    """缓存已从数据库读取或新建的用户"""
+    identity = Identity(user.user_id, user.username, user.is_admin)
+    identity_cache.put(identity)
+    return identity
+
+
+def get_identity(username: str) -> Identity | None:
+    """查询用户身份，未命中缓存时查询数据库，用户不存在时返回 None"""
+    identity = identity_cache.get(username)
+    if identity is not None:
+        return identity
+    row = User.objects.filter(username=username).values_list('user_id', 'is_admin').first()
+    if row is None:
+        return None
+    identity = Identity(row[0], username, row[1])
+    identity_cache.put(identity)
+    return identity
+
+
+def get_identities(usernames: Iterable[str]) -> Dict[str, Identity]:
+    """批量查询用户身份，未命中缓存的用户名以一条查询读取，结果中不含不存在的用户"""
+    identities: Dict[str, Identity] = {}
+    unresolved_usernames = set()
+    for username in usernames:
+        identity = identity_cache.get(username)
+        if identity is not None:
+            identities[username] = identity
+        else:
+            unresolved_usernames.add(username)
+    if len(unresolved_usernames) > 0:
+        for user in User.objects.filter(username__in=unresolved_usernames).only('user_id', 'username', 'is_admin'):
+            identities[user.username] = remember_user(user)
+    return identities
@@ -0,0 +1,234 @@
+"""调度日志模块"""
+import json
+import os
+import threading
+import time
+
+from logging import debug, exception, warning
+from pathlib import Path
+from threading import Condition
+from typing import Any, Dict, Iterator, List
+
+
+# 两次 fsync 之间的最短间隔（单位：秒），间隔内追加的记录合并为一次写入
+JOURNAL_FSYNC_INTERVAL = 0.05
+# 自上次压缩后追加的记录数超过 max(该值, 存活记录数 * JOURNAL_COMPACT_RATIO) 时压缩日志
+JOURNAL_COMPACT_MIN_RECORDS = 10000
+JOURNAL_COMPACT_RATIO = 4
+# 写入失败（如磁盘已满）后的重试间隔（单位：秒）
+JOURNAL_RETRY_INTERVAL = 1.0
+
+
+def _fsync_dir(path: Path) -> None:
+    """fsync 目录，使其中文件的替换操作落盘"""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class JournalState:
+    """由日志记录重建的调度状态
+
+    日志记录均为绝对状态（而非增量），重复应用同一条记录结果不变：
+    - {"t": "clock", ...}：模拟时钟的启动时间
+    - {"t": "shard", "type": 0, "mode": 0, "broken": [...]}：分片的调度模式与故障充电桩
+    - {"t": "req", "id": 1, "type": 0, ...}：充电请求的全部字段，等候区请求的 seq 为入队序号，恢复时按序号排队
+    - {"t": "del", "id": 1, "type": 0}：删除请求，仅当请求仍属于该类型时生效
+      （请求ID在其他分片被复用时，两个分片的记录顺序不确定）
+    - {"t": "queue", "key": "P1", "ids": [...]}：队列内请求的顺序，键为 R + 充电桩类型（故障队列）或 P + 充电桩编号
+      （旧日志以 W + 充电桩类型记录等候区的顺序，恢复后写入空列表将其删除）
+    """
+
+    def __init__(self) -> None:
+        self.clock: Dict[str, Any] | None = None
+        self.shards: Dict[int, Dict[str, Any]] = {}
+        self.requests: Dict[int, Dict[str, Any]] = {}
+        self.queues: Dict[str, List[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self.shards) + len(self.requests) + len(self.queues) + 1
+
+    def apply(self, record: Dict[str, Any]) -> None:
+        match record['t']:
+            case 'clock':
+                self.clock = record
+            case 'shard':
+                self.shards[record['type']] = record
+            case 'req':
+                self.requests[record['id']] = record
+            case 'del':
+                request = self.requests.get(record['id'])
+                if request is not None and request['type'] == record['type']:
+                    del self.requests[record['id']]
+            case 'queue':
+                if len(record['ids']) == 0:
+                    self.queues.pop(record['key'], None)
+                else:
+                    self.queues[record['key']] = record['ids']
+
+    def records(self) -> Iterator[Dict[str, Any]]:
+        """按重放顺序输出等价的最少记录"""
+        if self.clock is not None:
+            yield self.clock
+        yield from self.shards.values()
+        yield from self.requests.values()
+        for key, ids in self.queues.items():
+            yield {'t': 'queue', 'key': key, 'ids': ids}
+
+
+class SchedulerJournal:
+    """调度日志
+
+    调度器在分片锁内调用 append 追加记录，只放入内存队列；后台线程批量写入文件并 fsync，
+    两次 fsync 至少间隔 fsync_interval 秒，期间追加的记录一起落盘（进程或系统崩溃时至多丢失最近一个间隔的记录）。
+    写入线程同时维护重建后的状态，自上次压缩后的记录数远多于存活记录数时，
+    以存活状态重写日志文件，使启动时的重放时间与存活请求数成正比，而与历史长度无关。
+
+    写入或压缩失败时记录错误日志，保留未落盘的记录每隔 JOURNAL_RETRY_INTERVAL 秒重试；
+    文件末尾可能留下不完整的记录，因此重试前先以存活状态重写日志文件。失败期间 sync 立即返回 False。
+    """
+
+    def __init__(self, path: str | Path,
+                 fsync_interval: float = JOURNAL_FSYNC_INTERVAL,
+                 compact_min_records: int = JOURNAL_COMPACT_MIN_RECORDS) -> None:
+        self.__path = Path(path)
+        self.__fsync_interval = fsync_interval
+        self.__compact_min_records = compact_min_records
+        self.__cond = Condition()
+        self.__pending: List[Dict[str, Any]] = []
+        self.__appended = 0  # 已追加的记录数
+        self.__synced = 0  # 已落盘的记录数
+        self.__state = JournalState()
+        self.__records_since_compact = 0
+        self.__file = None
+        self.__thread: threading.Thread | None = None
+        self.__closing = False
+        self.__failing = False  # 最近一次写入是否失败
+
+    def replay(self) -> JournalState:
+        """读取日志文件重建状态，应在 start 之前调用"""
+        state = JournalState()
+        record_cnt = 0
+        if self.__path.exists():
+            with open(self.__path, encoding='utf-8') as file:
+                for line in file:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # 崩溃时最后一行可能不完整
+                        warning("[journal] malformed journal line skipped: %r", line)
+                        continue
+                    state.apply(record)
+                    record_cnt += 1
+        debug("[journal] %d records replayed, %d requests alive.", record_cnt, len(state.requests))
+        self.__state = state
+        return state
+
+    def start(self) -> None:
+        """压缩已重放的日志并启动写入线程"""
+        self.__compact()
+        self.__thread = threading.Thread(target=self.__write_proc, daemon=True)
+        self.__thread.start()
+
+    def append(self, records: List[Dict[str, Any]]) -> None:
+        with self.__cond:
+            self.__pending.extend(records)
+            self.__appended += len(records)
+            self.__cond.notify_all()
+
+    @property
+    def failing(self) -> bool:
+        """最近一次写入是否失败"""
+        return self.__failing
+
+    def sync(self, timeout: float | None = None) -> bool:
+        """等待已追加的记录全部落盘
+
+        Returns:
+            bool: 超时前是否全部落盘，写入失败时立即返回 False
+        """
+        with self.__cond:
+            target = self.__appended
+            self.__cond.wait_for(lambda: self.__synced >= target or self.__failing, timeout)
+            return self.__synced >= target
+
+    def close(self, timeout: float | None = None) -> None:
+        """写入剩余记录后停止写入线程"""
+        with self.__cond:
+            self.__closing = True
+            self.__cond.notify_all()
+        if self.__thread is not None:
+            self.__thread.join(timeout)
+        with self.__cond:
+            if self.__file is not None:
+                self.__file.close()
+                self.__file = None
+
+    def __write_proc(self) -> None:
+        last_sync_time = 0.0
+        while True:
+            with self.__cond:
+                self.__cond.wait_for(lambda: len(self.__pending) > 0 or self.__closing)
+                if len(self.__pending) == 0:
+                    return
+                if not self.__closing:
+                    # 等待至 fsync 间隔结束，期间追加的记录合并写入
+                    delay = last_sync_time + self.__fsync_interval - time.monotonic()
+                    if delay > 0:
+                        self.__cond.wait(delay)
+                batch = self.__pending
+                self.__pending = []
+            try:
+                if self.__failing or self.__file is None:
+                    # 上次失败的写入可能在文件末尾留下不完整的记录
+                    self.__compact()
+                self.__file.write(''.join(json.dumps(record) + '\n' for record in batch))
+                self.__file.flush()
+                os.fsync(self.__file.fileno())
+            except (OSError, ValueError):
+                exception("[journal] failed to write %d records, retry in %.1fs.",
+                          len(batch), JOURNAL_RETRY_INTERVAL)
+                with self.__cond:
+                    self.__pending[:0] = batch
+                    self.__failing = True
+                    self.__cond.notify_all()
+                    if self.__closing:
+                        warning("[journal] %d records left unwritten.", len(self.__pending))
+                        return
+                    self.__cond.wait(JOURNAL_RETRY_INTERVAL)
+                continue
+            last_sync_time = time.monotonic()
+            for record in batch:
+                self.__state.apply(record)
+            self.__records_since_compact += len(batch)
+            with self.__cond:
+                self.__failing = False
+                self.__synced += len(batch)
+                self.__cond.notify_all()
+            if self.__records_since_compact > max(self.__compact_min_records,
+                                                  len(self.__state) * JOURNAL_COMPACT_RATIO):
+                try:
+                    self.__compact()
+                except OSError:
+                    # 已落盘的记录仍然有效，下次写入前重新压缩
+                    exception("[journal] failed to compact journal.")
+                    self.__file = None
+
+    def __compact(self) -> None:
+        """以当前状态重写日志文件"""
+        if self.__file is not None:
+            self.__file.close()
+            self.__file = None
+        self.__path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = self.__path.with_name(self.__path.name + '.tmp')
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            file.writelines(json.dumps(record) + '\n' for record in self.__state.records())
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, self.__path)
+        _fsync_dir(self.__path.parent)
+        self.__file = open(self.__path, 'a', encoding='utf-8')
+        self.__records_since_compact = 0
+        debug("[journal] journal compacted to %d records.", len(self.__state))
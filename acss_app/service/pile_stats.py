@@ -0,0 +1,30 @@
+"""充电桩统计模块"""
+from dataclasses import dataclass, field
+from decimal import Decimal
+from typing import Mapping
+
+from django.db.models import F
+
+from acss_app.models import Pile
+
+
+@dataclass
+class PileStatsDelta:
+    """充电桩累计数据增量"""
+    usage_times: int = 0
+    charging_time: int = 0
+    charging_amount: Decimal = field(default_factory=lambda: Decimal('0.00'))
+
+
+def record_pile_stats(deltas: Mapping[int, PileStatsDelta]) -> None:
+    """记录充电桩累计数据增量
+
+    应在生成详单的事务内调用，每个充电桩执行一条 UPDATE ... SET x = x + ? 语句，与详单一同提交或回滚。
+    结算写入线程按批生成详单，一批详单中同一充电桩的增量已合并为一条语句；
+    充电桩表中的计数器始终是准确值，任何进程直接读取即可。
+    """
+    for pile_id, delta in deltas.items():
+        Pile.objects.filter(pile_id=pile_id).update(
+            cumulative_usage_times=F('cumulative_usage_times') + delta.usage_times,
+            cumulative_charging_time=F('cumulative_charging_time') + delta.charging_time,
+            cumulative_charging_amount=F('cumulative_charging_amount') + delta.charging_amount)
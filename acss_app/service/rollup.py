@@ -0,0 +1,135 @@
+"""收入汇总模块"""
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import Dict, Iterable, List, Tuple
+
+from django.db import transaction
+from django.db.models import F
+
+from acss_app.models import Order, PileEarningRollup, RollupPeriod
+
+# RollupPeriod.ALL 周期的起始日期
+ALL_PERIOD_START = date(1970, 1, 1)
+
+# (充电桩编号, 汇总周期, 周期起始日期)
+RollupKey = Tuple[int, RollupPeriod, date]
+
+
+class RollupDelta:
+    """汇总增量"""
+    __slots__ = ('order_count', 'charging_earning', 'service_earning', 'total_earning')
+
+    def __init__(self) -> None:
+        self.order_count = 0
+        self.charging_earning = Decimal('0.00')
+        self.service_earning = Decimal('0.00')
+        self.total_earning = Decimal('0.00')
+
+    def add_order(self, charging_cost: Decimal, service_cost: Decimal, total_cost: Decimal) -> None:
+        self.order_count += 1
+        self.charging_earning += charging_cost
+        self.service_earning += service_cost
+        self.total_earning += total_cost
+
+    def as_tuple(self) -> Tuple[int, Decimal, Decimal, Decimal]:
+        return self.order_count, self.charging_earning, self.service_earning, self.total_earning
+
+
+def get_period_starts(day: date) -> Dict[RollupPeriod, date]:
+    """日期所在各汇总周期的起始日期"""
+    return {
+        RollupPeriod.DAY: day,
+        RollupPeriod.WEEK: day - timedelta(days=day.weekday()),
+        RollupPeriod.MONTH: day.replace(day=1),
+        RollupPeriod.ALL: ALL_PERIOD_START
+    }
+
+
+def aggregate_orders(orders: Iterable[Tuple[int, datetime, Decimal, Decimal, Decimal]]) -> Dict[RollupKey, RollupDelta]:
+    """按汇总周期累加详单
+
+    Args:
+        orders (Iterable[Tuple[int, datetime, Decimal, Decimal, Decimal]]):
+            (充电桩编号, 详单生成时间, 充电费, 服务费, 总费用) 列表
+    """
+    deltas: Dict[RollupKey, RollupDelta] = {}
+    for pile_id, create_time, charging_cost, service_cost, total_cost in orders:
+        for period, period_start in get_period_starts(create_time.date()).items():
+            key = (pile_id, period, period_start)
+            delta = deltas.get(key)
+            if delta is None:
+                delta = deltas[key] = RollupDelta()
+            delta.add_order(charging_cost, service_cost, total_cost)
+    return deltas
+
+
+def record_order_rollups(orders: Iterable[Order]) -> None:
+    """增量更新新生成详单所在周期的汇总，应在生成详单的事务内调用"""
+    deltas = aggregate_orders((order.pile_id, order.create_time, order.charging_cost,
+                               order.service_cost, order.total_cost) for order in orders)
+    for (pile_id, period, period_start), delta in deltas.items():
+        updated = PileEarningRollup.objects\
+            .filter(pile_id=pile_id, period=period, period_start=period_start)\
+            .update(order_count=F('order_count') + delta.order_count,
+                    charging_earning=F('charging_earning') + delta.charging_earning,
+                    service_earning=F('service_earning') + delta.service_earning,
+                    total_earning=F('total_earning') + delta.total_earning)
+        if updated == 0:
+            PileEarningRollup.objects.create(pile_id=pile_id, period=period, period_start=period_start,
+                                             order_count=delta.order_count,
+                                             charging_earning=delta.charging_earning,
+                                             service_earning=delta.service_earning,
+                                             total_earning=delta.total_earning)
+
+
+def __aggregate_all_orders() -> Dict[RollupKey, RollupDelta]:
+    orders = Order.objects\
+        .values_list('pile_id', 'create_time', 'charging_cost', 'service_cost', 'total_cost')\
+        .iterator(chunk_size=2000)
+    return aggregate_orders(orders)
+
+
+def rebuild_rollups() -> int:
+    """根据全部详单重建汇总表
+
+    Returns:
+        int: 汇总记录数
+    """
+    deltas = __aggregate_all_orders()
+    with transaction.atomic():
+        PileEarningRollup.objects.all().delete()
+        PileEarningRollup.objects.bulk_create(
+            (PileEarningRollup(pile_id=pile_id, period=period, period_start=period_start,
+                               order_count=delta.order_count,
+                               charging_earning=delta.charging_earning,
+                               service_earning=delta.service_earning,
+                               total_earning=delta.total_earning)
+             for (pile_id, period, period_start), delta in deltas.items()),
+            batch_size=500)
+    return len(deltas)
+
+
+def diff_rollups() -> List[Tuple[RollupKey, Tuple | None, Tuple | None]]:
+    """比较汇总表与根据全部详单计算的汇总
+
+    Returns:
+        List[Tuple[RollupKey, Tuple | None, Tuple | None]]:
+            不一致的 (汇总键, 期望值, 实际值)，值为 (详单数, 充电费, 服务费, 总费用)，不存在时为 None
+    """
+    expected = {key: delta.as_tuple() for key, delta in __aggregate_all_orders().items()}
+    actual = {}
+    for rollup in PileEarningRollup.objects.all().iterator():
+        key = (rollup.pile_id, RollupPeriod(rollup.period), rollup.period_start)
+        actual[key] = (rollup.order_count, rollup.charging_earning,
+                       rollup.service_earning, rollup.total_earning)
+    mismatches = []
+    for key in sorted(expected.keys() | actual.keys()):
+        if expected.get(key) != actual.get(key):
+            mismatches.append((key, expected.get(key), actual.get(key)))
+    return mismatches
+
+
+def get_earnings(period: RollupPeriod, period_start: date) -> Dict[int, PileEarningRollup]:
+    """查询各充电桩在指定周期内的收入汇总，没有详单的充电桩不在结果中"""
+    rollups = PileEarningRollup.objects.filter(period=period, period_start=period_start)
+    return {rollup.pile_id: rollup for rollup in rollups}
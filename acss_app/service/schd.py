@@ -1,87 +1,215 @@
 """调度模块"""
-from dataclasses import dataclass
-from datetime import datetime, timedelta
+import atexit
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from dataclasses import dataclass, field, replace
+from datetime import datetime
 from decimal import Decimal
 from enum import Enum
-from logging import debug
-from threading import Lock
+from bisect import insort
+from heapq import heappop, heappush
+from logging import debug, warning
+from threading import Condition, Lock, RLock
+import functools
+import secrets
 import threading
-from time import sleep
-from typing import Any, Dict, List, Tuple
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Set, Tuple
 
+from django.conf import settings
 from django.db.models import QuerySet
 
 from acss_app.models import Pile, PileType
-from acss_app.service.charge import create_order
-from acss_app.service.timemock import get_datetime_now
-from acss_app.service.exceptions import AlreadyRequested, IllegalUpdateAttemption, MappingNotExisted, OutOfRecycleResource, OutOfSpace
-
-
-MAX_RECYCLE_ID = 1000
-
-WAITING_AREA_CAPACITY = 15
+from acss_app.service.charge import Settlement
+from acss_app.service.timemock import US_PER_SECOND, from_us, get_boot_time, get_clock, now_us, set_boot_time, to_us
+from acss_app.service.journal import JournalState, SchedulerJournal
+from acss_app.service.schd_policy import DEFAULT_SCHEDULING_POLICY, SchedulingPolicy, make_policy
+from acss_app.service.settlement import submit_settlement
+from acss_app.service.exceptions import (AlreadyRequested, IllegalUpdateAttemption, MappingNotExisted, OutOfSpace,
+                                         ServiceError)
+from acss_app.service.util.change_notifier import ChangeNotifier
+from acss_app.service.util.cow_map import EMPTY_COW_MAP, CowMap
+from acss_app.service.util.id_allocator import RequestIdAllocator
+from acss_app.service.util.pile_index import SparePileIndex
+from acss_app.service.util.rank_index import EMPTY_RANK_INDEX, RankIndex
+from acss_app.service.util.time_index import TimeOrderedIndex
+from acss_app.service.util.waiting_area import WaitingArea
+
+
+MAX_RECYCLE_ID = 1000  # 请求ID编号空间的初始大小
+
+WAITING_AREA_CAPACITY = 2000
 WAITING_QUEUE_CAPACITY = 3
 
 NORMAL_PILE_POWER = 10.00
 FAST_CHARGE_PILE_POWER = 30.00
 
 
-class _RequestIdAllocator:
-    """请求ID分配器
-    """
+@dataclass(frozen=True)
+class SubmitItem:
+    """批量提交中的一个充电请求"""
+    request_mode: PileType
+    username: str
+    amount: Decimal
+    battery_capacity: Decimal
+    user_id: int | None = None
+    station_id: int | None = None  # 按充电站划分调度域时提交到的充电站，为 None 时提交到默认充电站
+
 
-    def __init__(self) -> None:
-        self.__lock = Lock()
-        self.__id_flags = [False for _ in range(MAX_RECYCLE_ID)]
-        self.__cur = 0
+class RequestState(Enum):
+    """充电请求所处的阶段"""
+    WAITING = 0  # 在等候区排队
+    REQUEUED = 1  # 修改充电模式后在等候区重新排队
+    QUEUED = 2  # 在充电桩队列中等待
+    CHARGING = 3  # 正在充电
+    RECOVERING = 4  # 充电桩故障后在故障队列中等待
+    REMOVED = 5  # 已结束或取消
 
-    def alloc(self) -> int:
-        with self.__lock:
-            failure_cnt = 0
-            while self.__id_flags[self.__cur]:
-                if failure_cnt == MAX_RECYCLE_ID:
-                    raise OutOfRecycleResource("充电标识已用尽")
-                self.__cur = (self.__cur + 1) % MAX_RECYCLE_ID
-                failure_cnt += 1
-            self.__id_flags[self.__cur] = True
-            return self.__cur
 
-    def dealloc(self, charging_id: int) -> None:
-        with self.__lock:
-            self.__id_flags[charging_id] = False
+def _get_power(pile_type: PileType) -> float:
+    if pile_type == PileType.CHARGE:
+        return NORMAL_PILE_POWER
+    return FAST_CHARGE_PILE_POWER
 
 
-@dataclass(order=True)
+@dataclass(order=True, slots=True)
 class _ChargingRequest:
     """充电请求
+
+    使用 __slots__ 存储，不为每个实例创建 __dict__；按 (create_time, request_id) 排序。
+    阶段由 state 表示，充电时长在创建与修改充电量时计算。时刻与时长均为微秒数。
     """
-    create_time: datetime
+    create_time: int
     request_id: int
-    request_type: PileType
-    username: str
-    amount: Decimal
-    battery_capacity: Decimal
-    is_in_waiting_queue = False
-    is_executing = False
-    begin_time: datetime = None
-    is_removed = False
-    pile_id: int = None
-    requeue_flag = False
-    fail_flag = False
+    request_type: PileType = field(compare=False)
+    username: str = field(compare=False)
+    amount: Decimal = field(compare=False)
+    battery_capacity: Decimal = field(compare=False)
+    user_id: int | None = field(default=None, compare=False)
+    state: RequestState = field(default=RequestState.WAITING, compare=False)
+    pile_id: int | None = field(default=None, compare=False)
+    begin_time: int | None = field(default=None, compare=False)
+    complete_time: int | None = field(default=None, compare=False)
+    waiting_seq: int | None = field(default=None, compare=False)  # 在等候区中的入队序号
+    duration: int = field(init=False, compare=False)  # 充满请求充电量所需的时长
+
+    def __post_init__(self) -> None:
+        self.duration = self.__get_duration()
+
+    def __get_duration(self) -> int:
+        return round(float(self.amount) / _get_power(self.request_type) * 3600 * US_PER_SECOND)
+
+    def set_amount(self, amount: Decimal) -> None:
+        self.amount = amount
+        self.duration = self.__get_duration()
+
+    @property
+    def in_waiting_area(self) -> bool:
+        return self.state == RequestState.WAITING or self.state == RequestState.REQUEUED
 
     def __str__(self) -> str:
         return f'{self.request_type.name[0]}{self.request_id}'
 
 
+def _journal_fields(request: _ChargingRequest) -> tuple:
+    """请求中需要记录到调度日志的字段，用于判断请求是否变化"""
+    return (request.request_type, request.username, request.amount, request.battery_capacity,
+            request.user_id, request.create_time, request.state,
+            request.begin_time, request.complete_time, request.pile_id, request.waiting_seq)
+
+
+def _format_time(value: int | None) -> str | None:
+    return None if value is None else from_us(value).isoformat()
+
+
+def _parse_time(value: str | None) -> int | None:
+    return None if value is None else to_us(datetime.fromisoformat(value))
+
+
+def _dump_request(request: _ChargingRequest) -> Dict[str, Any]:
+    return {
+        't': 'req',
+        'id': request.request_id,
+        'type': request.request_type.value,
+        'username': request.username,
+        'amount': str(request.amount),
+        'battery_capacity': str(request.battery_capacity),
+        'user_id': request.user_id,
+        'create_time': _format_time(request.create_time),
+        'state': request.state.value,
+        'begin_time': _format_time(request.begin_time),
+        'complete_time': _format_time(request.complete_time),
+        'pile_id': request.pile_id,
+        'seq': request.waiting_seq
+    }
+
+
+def _load_state(record: Dict[str, Any]) -> RequestState:
+    if 'state' in record:
+        return RequestState(record['state'])
+    # 兼容以多个标志位记录请求阶段的旧日志
+    if record['fail_flag']:
+        return RequestState.RECOVERING
+    if record['is_executing']:
+        return RequestState.CHARGING
+    if record['is_in_waiting_queue']:
+        return RequestState.QUEUED
+    if record['requeue_flag']:
+        return RequestState.REQUEUED
+    return RequestState.WAITING
+
+
+def _load_request(record: Dict[str, Any]) -> _ChargingRequest:
+    request = _ChargingRequest(create_time=_parse_time(record['create_time']),
+                               request_id=record['id'],
+                               request_type=PileType(record['type']),
+                               username=record['username'],
+                               amount=Decimal(record['amount']),
+                               battery_capacity=Decimal(record['battery_capacity']),
+                               user_id=record['user_id'],
+                               state=_load_state(record),
+                               pile_id=record['pile_id'],
+                               begin_time=_parse_time(record['begin_time']),
+                               complete_time=_parse_time(record['complete_time']),
+                               waiting_seq=record.get('seq'))
+    return request
+
+
 class PileScheduler:
     """充电桩调度器
     """
 
-    def __init__(self, pile_type: PileType) -> None:
-        self.__waiting_queue: Dict[int, _ChargingRequest] = {}
+    def __init__(self, pile_id: int, pile_type: PileType,
+                 on_execute: Callable[[_ChargingRequest], None] = None,
+                 on_change: Callable[['PileScheduler'], None] = None) -> None:
+        """
+        Args:
+            pile_id (int): 充电桩编号
+            pile_type (PileType): 充电桩类型
+            on_execute (Callable[[_ChargingRequest], None], optional): 请求开始充电时的回调，
+                用于登记完成时刻
+            on_change (Callable[[PileScheduler], None], optional): 队列或故障状态变化时的回调，
+                用于维护空闲充电桩索引
+        """
+        self.__waiting_queue: List[_ChargingRequest] = []  # 按排队顺序，首个为正在充电的请求
         self.__executing_request: _ChargingRequest = None
+        self.__pile_id = pile_id
         self.__pile_type = pile_type
-        self.is_broken = False
+        self.__total_amount = Decimal('0.00')  # 队列内请求的总充电量
+        self.__on_execute = on_execute
+        self.__on_change = on_change
+        self.__is_broken = False
+
+    @property
+    def is_broken(self) -> bool:
+        return self.__is_broken
+
+    @is_broken.setter
+    def is_broken(self, value: bool) -> None:
+        self.__is_broken = value
+        self.__notify_change()
+
+    def get_pile_id(self) -> int:
+        return self.__pile_id
 
     def get_type(self) -> PileType:
         return self.__pile_type
@@ -89,66 +217,105 @@ class PileScheduler:
     def get_executing_request(self) -> _ChargingRequest | None:
         return self.__executing_request
 
+    def __notify_change(self) -> None:
+        if self.__on_change is not None:
+            self.__on_change(self)
+
     def next_request(self) -> None:
         if self.__executing_request is not None:
-            self.__waiting_queue.pop(next(iter(self.__waiting_queue)))
+            finished = self.__waiting_queue.pop(0)
+            self.__total_amount -= finished.amount
             self.__executing_request = None
         if len(self.__waiting_queue) > 0:
-            _, request = next(iter(self.__waiting_queue.items()))
-            request.is_executing = True
-            request.begin_time = get_datetime_now()
+            request = self.__waiting_queue[0]
+            request.state = RequestState.CHARGING
+            request.begin_time = now_us()
+            request.complete_time = request.begin_time + request.duration
             self.__executing_request = request
+            if self.__on_execute is not None:
+                self.__on_execute(request)
+        self.__notify_change()
 
     def push_to_queue(self, request: _ChargingRequest) -> None:
-        self.__waiting_queue[request.request_id] = request
+        self.__waiting_queue.append(request)
+        self.__total_amount += request.amount
+        if self.__executing_request is None:
+            self.next_request()
+        else:
+            self.__notify_change()
+
+    def insert_in_time_order(self, request: _ChargingRequest) -> None:
+        """按 (create_time, request_id) 二分查找插入位置，不排在正在充电的请求之前
+
+        故障恢复期间放入队列的请求均按创建时刻插入，队列中等待的请求按创建时刻有序；
+        其他情况下插入到某个更早与更晚创建的请求之间。
+        """
         if self.__executing_request is None:
+            self.push_to_queue(request)
+            return
+        insort(self.__waiting_queue, request, lo=1)
+        self.__total_amount += request.amount
+        self.__notify_change()
+
+    def restore(self, requests: List[_ChargingRequest]) -> None:
+        """按排队顺序恢复队列，队首正在充电的请求保留原有的开始与完成时刻"""
+        self.__waiting_queue = list(requests)
+        self.__total_amount = sum((request.amount for request in requests), Decimal('0.00'))
+        self.__executing_request = None
+        if len(requests) > 0 and requests[0].state == RequestState.CHARGING:
+            self.__executing_request = requests[0]
+            if self.__on_execute is not None:
+                self.__on_execute(requests[0])
+        elif len(requests) > 0:
             self.next_request()
+        self.__notify_change()
 
     def get_used_size(self) -> int:
         return len(self.__waiting_queue)
 
-    def estimate_time(self) -> int:
-        total_cost = 0
-        for request in self.__waiting_queue.values():
-            if request.request_type == PileType.CHARGE:
-                power = NORMAL_PILE_POWER
-            else:
-                power = FAST_CHARGE_PILE_POWER
-            cost = float(request.amount) / power * 3600
-            total_cost += cost
-        return total_cost
+    def iter_requests(self) -> Iterator[_ChargingRequest]:
+        """按排队顺序遍历队列内的请求（首个为正在充电的请求）"""
+        return iter(self.__waiting_queue)
+
+    def estimate_time(self) -> float:
+        return float(self.__total_amount) / _get_power(self.__pile_type) * 3600
+
+    def estimate_finish_time(self) -> int:
+        """预计队列内请求全部充满的时刻（微秒），队列为空时为 0"""
+        if self.__executing_request is None:
+            return 0
+        return self.__executing_request.complete_time + \
+            sum(request.duration for request in self.__waiting_queue) - self.__executing_request.duration
 
     def contains(self, request_id: int) -> bool:
-        return request_id in self.__waiting_queue
+        return any(request.request_id == request_id for request in self.__waiting_queue)
 
     def remove(self, request_id: int) -> None:
-        request = self.__waiting_queue[request_id]
-        if request.is_executing:
+        pos = next(pos for pos, request in enumerate(self.__waiting_queue) if request.request_id == request_id)
+        request = self.__waiting_queue[pos]
+        if request is self.__executing_request:
             self.next_request()
             return
-        del self.__waiting_queue[request_id]
-
-    def find_position(self, request_id) -> int:
-        pos_cnt = 0
-        for req_id in self.__waiting_queue:
-            if req_id == request_id:
-                return pos_cnt
-            pos_cnt += 1
+        del self.__waiting_queue[pos]
+        self.__total_amount -= request.amount
+        self.__notify_change()
 
     def fetch_and_clear(self, include_executing: bool) -> List[_ChargingRequest]:
         if include_executing:
-            requests = self.__waiting_queue.values()
-            self.__waiting_queue = {}
+            requests = self.__waiting_queue
+            self.__waiting_queue = []
             self.__executing_request = None
-            return requests
+            self.__total_amount = Decimal('0.00')
         else:
+            requests = self.__waiting_queue
+            self.__waiting_queue = []
+            self.__total_amount = Decimal('0.00')
             if self.__executing_request is not None:
-                self.__waiting_queue.pop(next(iter(self.__waiting_queue)))
-            requests = self.__waiting_queue.values()
-            self.__waiting_queue = {}
-            if self.__executing_request is not None:
-                self.__waiting_queue[self.__executing_request.request_id] = self.__executing_request
-            return requests
+                requests.pop(0)
+                self.__waiting_queue.append(self.__executing_request)
+                self.__total_amount = self.__executing_request.amount
+        self.__notify_change()
+        return requests
 
 
 class StatusType(Enum):
@@ -162,9 +329,9 @@ class StatusType(Enum):
 
 class SchedulingMode(Enum):
     NORMAL = 0
-    PRIORITY = 1
-    TIME_ORDERED = 2
-    RECOVERY = 3
+    PRIORITY = 1  # 充电桩故障后优先调度故障队列，请求放入充电桩队列末尾
+    TIME_ORDERED = 2  # 充电桩故障后优先调度故障队列，请求按创建时刻插入充电桩队列
+    RECOVERY = 3  # 充电桩恢复后优先调度故障队列，请求按创建时刻插入充电桩队列
 
 
 @dataclass
@@ -174,342 +341,900 @@ class RequestStatus:
     pile_id: int | None
 
 
+@dataclass(frozen=True)
+class RequestView:
+    """充电请求在快照中的只读视图
+
+    等候区请求的视图记录入队序号 waiting_seq，其中的 status.position 为 0，
+    排队位置在读取快照时由 _ShardSnapshot.resolve 计算。
+    """
+    request_id: int
+    username: str
+    status: RequestStatus
+    amount: Decimal
+    battery_capacity: Decimal
+    create_time: int  # 模拟时刻（微秒）
+    waiting_seq: int | None = None
+
+
+def _make_view(request: _ChargingRequest, status: RequestStatus) -> RequestView:
+    return RequestView(request_id=request.request_id,
+                       username=request.username,
+                       status=status,
+                       amount=request.amount,
+                       battery_capacity=request.battery_capacity,
+                       create_time=request.create_time,
+                       waiting_seq=request.waiting_seq)
+
+
+@dataclass(frozen=True)
+class _ShardSnapshot:
+    """分片快照，两个索引均为写时复制映射，相邻版本共享未变化的部分
+
+    等候区请求的排队位置为 waiting_base（最长的充电桩队列长度）加上排名索引中更早入队的请求数。
+    """
+    version: int
+    by_username: CowMap
+    by_request_id: CowMap
+    epoch: int = 0  # 调度器实例的随机标识，重启后版本号从头计数，用于区分
+    waiting_ranks: RankIndex = EMPTY_RANK_INDEX
+    waiting_base: int = 0
+
+    def resolve(self, view: RequestView | None) -> RequestView | None:
+        """补全等候区请求视图的排队位置"""
+        if view is None or view.waiting_seq is None:
+            return view
+        position = self.waiting_base + self.waiting_ranks.rank(view.waiting_seq)
+        return replace(view, status=RequestStatus(view.status.status, position, None))
+
+
+_EMPTY_SHARD_SNAPSHOT = _ShardSnapshot(0, EMPTY_COW_MAP, EMPTY_COW_MAP)
+
+
+@dataclass(frozen=True)
+class SchedulerSnapshot:
+    """调度器状态快照
+
+    由各分片在每次修改后发布的不可变快照组成，读取时无需获取调度锁。
+    """
+    shards: Tuple[_ShardSnapshot, ...]
+
+    @property
+    def version(self) -> int:
+        return sum(shard.version for shard in self.shards)
+
+    @property
+    def epoch(self) -> int:
+        """各分片所属调度器实例标识的组合"""
+        return hash(tuple(shard.epoch for shard in self.shards)) & 0xFFFFFFFF
+
+    @property
+    def etag(self) -> str:
+        """总体排队情况的 ETag，调度器重启后不会与重启前的相同"""
+        return f'"{self.epoch:08x}-{self.version}"'
+
+    def preview_etag(self, username: str) -> str:
+        """用户排队情况的 ETag，只随该用户的请求状态变化"""
+        view = self.find_by_username(username)
+        if view is None:
+            return f'"{self.epoch:08x}-none"'
+        status = view.status
+        return f'"{self.epoch:08x}-{view.request_id}-{status.status.value}-{status.position}-{status.pile_id}"'
+
+    def find_by_username(self, username: str) -> RequestView | None:
+        for shard in self.shards:
+            view = shard.by_username.get(username)
+            if view is not None:
+                return shard.resolve(view)
+        return None
+
+    def find_by_request_id(self, request_id: int) -> RequestView | None:
+        for shard in self.shards:
+            view = shard.by_request_id.get(request_id)
+            if view is not None:
+                return shard.resolve(view)
+        return None
+
+    def iter_views(self) -> Iterator[RequestView]:
+        for shard in self.shards:
+            for view in shard.by_request_id.values():
+                yield shard.resolve(view)
+
+    def to_rows(self) -> List[Dict[str, Any]]:
+        """转换为总体排队情况列表"""
+        time_now = now_us()
+        views = sorted(self.iter_views(), key=lambda view: (view.create_time, view.request_id))
+        return [view_to_row(view, time_now) for view in views]
+
+    def to_preview(self, username: str) -> Dict[str, Any]:
+        """转换为用户的排队情况"""
+        request_id = None
+        pile_id = None
+        position = -1
+        cur_state = StatusType.NOTCHARGING.name
+
+        view = self.find_by_username(username)
+        if view is not None:
+            request_id = str(view.request_id)
+            pile_id = view.status.pile_id
+            position = view.status.position
+            cur_state = view.status.status.name
+
+        if pile_id is None:
+            place = 'WAITINGPLACE'
+        else:
+            place = pile_id
+
+        return {
+            'charge_id': request_id,
+            'queue_len': position,
+            'cur_state': cur_state,
+            'place': str(place)
+        }
+
+
+def view_to_row(view: RequestView, time_now: int) -> Dict[str, Any]:
+    """转换为总体排队情况中的一行，time_now 为当前模拟时刻（微秒）"""
+    return {
+        'pile_id': str(view.status.pile_id),
+        'username': view.username,
+        'battery_size': view.battery_capacity,
+        'require_amount': view.amount,
+        'waiting_time': (time_now - view.create_time) // US_PER_SECOND
+    }
+
+
 DEFAULT_RECOVERY_MODE = SchedulingMode.PRIORITY
 
 
+class ConcurrencyMode(Enum):
+    GLOBAL = 0  # 所有充电桩类型共用一把锁
+    SHARDED = 1  # 每种充电桩类型各用一把锁
+
+
+DEFAULT_CONCURRENCY_MODE = ConcurrencyMode.SHARDED
+
+
+class _PileTypeShard:
+    """调度分片
+
+    持有一种充电桩类型的全部调度状态：等候区、充电桩、空闲充电桩索引、调度策略、完成时刻堆与故障调度状态，
+    均由分片锁保护。故障队列与排队请求索引均按 (create_time, request_id) 排序，故障处理只移动受影响的请求。
+    """
+
+    def __init__(self, pile_type: PileType, lock: RLock, policy: SchedulingPolicy, queue_capacity: int) -> None:
+        self.pile_type = pile_type
+        self.lock = lock
+        self.policy = make_policy(policy, queue_capacity)
+        self.deadline_cond = Condition(lock)
+        # 完成时刻小根堆 (complete_time, request_id)，失效条目在出堆时丢弃
+        self.deadlines: List[Tuple[int, int]] = []
+        self.waiting_area = WaitingArea()
+        self.spare_piles = SparePileIndex()
+        self.pile_schedulers: Dict[int, PileScheduler] = {}
+        self.scheduling_mode = SchedulingMode.NORMAL
+        self.recovery_queue = TimeOrderedIndex()
+        self.queued_index = TimeOrderedIndex()  # 在充电桩队列中等待（尚未充电）的请求
+        self.snapshot = _EMPTY_SHARD_SNAPSHOT
+        # 自上次发布快照后变化的队列、等候区请求与结束的请求，发布快照与写入调度日志时只处理这些部分
+        self.waiting_key = f'W{pile_type.value}'  # 旧调度日志中记录等候区顺序的队列键
+        self.recovery_key = f'R{pile_type.value}'
+        self.dirty_queues: Set[str] = set()  # 队列键，与调度日志相同：R + 充电桩类型或 P + 充电桩编号
+        self.dirty_waiting: Set[int] = set()  # 入队或修改过的等候区请求ID
+        self.removed: Dict[int, _ChargingRequest] = {}
+        # 各充电桩队列长度及其计数，增量维护最长的队列长度（等候区请求的排队位置从该值开始）
+        self.used_sizes: Dict[int, int] = {}
+        self.used_size_counts: Counter = Counter()
+        self.max_used_size = 0
+        self.broken_piles: Set[int] = set()
+        # 最近一次写入调度日志的状态，发布快照时与当前状态比较，只记录变化的部分
+        self.journaled_state: tuple | None = None
+        self.journaled_requests: Dict[int, tuple] = {}
+        self.journaled_queues: Dict[str, Tuple[int, ...]] = {}
+
+
 class Scheduler:
     """调度器类
+
+    锁顺序（先获取者在前）：
+        1. 分片锁，多个分片时按 PileType 取值从小到大获取（修改充电模式时需要同时持有两个分片锁）
+        2. 索引锁 __index_lock，保护请求表、用户名索引与等候区占用数，持有期间不得获取分片锁
+        3. 请求ID分配器内部锁
+    用户名索引与请求表的读取不加锁，写入在索引锁内完成。
     """
 
-    def __init__(self) -> None:
-        self.__id_allocator = _RequestIdAllocator()
-        self.__lock = Lock()
-        self.__check_lock = Lock()
-        self.__pile_schedulers: Dict[int, PileScheduler] = {}
+    def __init__(self, piles: Iterable[Pile] = None,
+                 concurrency_mode: ConcurrencyMode = DEFAULT_CONCURRENCY_MODE,
+                 on_settle: Callable[[Settlement], None] = submit_settlement,
+                 journal: SchedulerJournal | None = None,
+                 id_allocator: RequestIdAllocator | None = None,
+                 run_checker: bool = True,
+                 policy: SchedulingPolicy = DEFAULT_SCHEDULING_POLICY,
+                 recovery_mode: SchedulingMode = DEFAULT_RECOVERY_MODE,
+                 waiting_area_capacity: int = WAITING_AREA_CAPACITY,
+                 waiting_queue_capacity: int = WAITING_QUEUE_CAPACITY,
+                 notifier: ChangeNotifier | None = None) -> None:
+        """
+        Args:
+            piles (Iterable[Pile], optional): 参与调度的充电桩，默认从数据库读取全部充电桩
+            concurrency_mode (ConcurrencyMode, optional): 并发模式
+            on_settle (Callable[[Settlement], None], optional): 充电结束时在分片锁内调用，默认提交给结算写入线程
+            journal (SchedulerJournal | None, optional): 调度日志，不为 None 时先重放日志恢复状态，之后记录每次修改
+            id_allocator (RequestIdAllocator | None, optional): 请求ID分配器，默认从 MAX_RECYCLE_ID 个编号开始按需扩容
+            run_checker (bool, optional): 是否启动检查线程在完成时刻结束请求，为 False 时由调用方推进时间后
+                调用 complete_due_requests（用于离散事件模拟）
+            policy (SchedulingPolicy, optional): 等候区调度策略
+            recovery_mode (SchedulingMode, optional): 充电桩故障时的调度方式，PRIORITY 或 TIME_ORDERED
+            waiting_area_capacity (int, optional): 等候区容量
+            waiting_queue_capacity (int, optional): 每个充电桩队列的容量（含正在充电的请求）
+            notifier (ChangeNotifier | None, optional): 发布快照时通知的订阅者，多个调度域可共用一个
+        """
+        self.__on_settle = on_settle
+        self.__recovery_mode = recovery_mode
+        self.__journal = journal
+        self.__waiting_area_capacity = waiting_area_capacity
+        self.__waiting_queue_capacity = waiting_queue_capacity
+        if notifier is None:
+            notifier = ChangeNotifier()
+        self.__notifier = notifier
+        if id_allocator is None:
+            id_allocator = RequestIdAllocator(MAX_RECYCLE_ID)
+        self.__id_allocator = id_allocator
+        self.__index_lock = Lock()
         self.__waiting_area_map: Dict[int, _ChargingRequest] = {}
         self.__username_to_request_id: Dict[str, int] = {}
-        self.__scheduling_mode = SchedulingMode.NORMAL
-        self.__broken_pile_id: int = None
-        self.__recovery_queue = []
-        self.__waiting_areas = {
-            PileType.CHARGE: [[], 0],
-            PileType.FAST_CHARGE: [[], 0]
-        }
-
-        __piles: QuerySet[Pile] = Pile.objects.all()
-        for pile in __piles:
-            self.__pile_schedulers[pile.pile_id] = PileScheduler(
-                pile.pile_type)
+        self.__waiting_area_used = 0
+
+        global_lock = RLock()
+        # 快照版本号在进程重启后从头计数，ETag 中加入本实例的随机标识
+        epoch = secrets.randbits(32)
+        self.__shards: Dict[PileType, _PileTypeShard] = {}
+        for pile_type in PileType:
+            lock = global_lock
+            if concurrency_mode == ConcurrencyMode.SHARDED:
+                lock = RLock()
+            self.__shards[pile_type] = _PileTypeShard(pile_type, lock, policy, waiting_queue_capacity)
+            self.__shards[pile_type].snapshot = replace(_EMPTY_SHARD_SNAPSHOT, epoch=epoch)
+        self.__pile_shards: Dict[int, _PileTypeShard] = {}
+
+        if piles is None:
+            piles: QuerySet[Pile] = Pile.objects.only('pile_id', 'pile_type')
+        for pile in piles:
+            shard = self.__shards[PileType(pile.pile_type)]
+            pile_scheduler = PileScheduler(pile.pile_id,
+                                           pile.pile_type,
+                                           on_execute=functools.partial(self.__arm_deadline, shard),
+                                           on_change=functools.partial(self.__on_pile_change, shard))
+            shard.pile_schedulers[pile.pile_id] = pile_scheduler
+            self.__pile_shards[pile.pile_id] = shard
+            self.__on_pile_change(shard, pile_scheduler)
+
+        if journal is not None:
+            state = journal.replay()
+            if state.clock is not None:
+                # 沿用日志中的模拟时钟，使恢复的开始与完成时刻仍然有效
+                set_boot_time(datetime.fromisoformat(state.clock['boot_datetime']))
+            self.__restore(state)
+            journal.start()
+            journal.append([{'t': 'clock', 'boot_datetime': get_boot_time().isoformat()}])
+
+        if run_checker:
+            for shard in self.__shards.values():
+                threading.Thread(target=self.__check_proc, args=(shard,), daemon=True).start()
+
+    def __restore(self, state: JournalState) -> None:
+        """由调度日志重建的状态恢复队列与索引，耗时与存活请求数成正比"""
+        requests = {request_id: _load_request(record) for request_id, record in state.requests.items()}
+        restored: Dict[int, _ChargingRequest] = {}
+
+        def take(pile_type: PileType, key: str) -> List[_ChargingRequest]:
+            taken = []
+            for request_id in state.queues.get(key, []):
+                request = requests.get(request_id)
+                if request is None or request.request_type != pile_type or request_id in restored:
+                    continue
+                restored[request_id] = request
+                taken.append(request)
+            return taken
+
+        def take_waiting(pile_type: PileType, legacy_key: str) -> List[_ChargingRequest]:
+            """按入队序号取出等候区请求；旧日志未记录序号，按其中的等候区队列顺序排在前面"""
+            legacy_order = {request_id: pos for pos, request_id in enumerate(state.queues.get(legacy_key, []))}
+            taken = [request for request_id, request in requests.items()
+                     if request.request_type == pile_type and request.in_waiting_area and request_id not in restored
+                     and (request.waiting_seq is not None or request_id in legacy_order)]
+            taken.sort(key=lambda request: (0, legacy_order[request.request_id]) if request.waiting_seq is None
+                       else (1, request.waiting_seq))
+            for request in taken:
+                restored[request.request_id] = request
+            return taken
+
+        for pile_type, shard in self.__shards.items():
+            with shard.lock:
+                record = state.shards.get(pile_type.value)
+                if record is not None:
+                    shard.scheduling_mode = SchedulingMode(record['mode'])
+                    for pile_id in record['broken']:
+                        if pile_id in shard.pile_schedulers:
+                            shard.pile_schedulers[pile_id].is_broken = True
+                for request in take_waiting(pile_type, shard.waiting_key):
+                    request.waiting_seq = shard.waiting_area.push(request.request_id, request, request.waiting_seq)
+                    shard.dirty_waiting.add(request.request_id)
+                if shard.waiting_key in state.queues:
+                    self.__journal.append([{'t': 'queue', 'key': shard.waiting_key, 'ids': []}])
+                for request in take(pile_type, shard.recovery_key):
+                    shard.recovery_queue.push(request.request_id, request)
+                shard.dirty_queues.add(shard.recovery_key)
+                for pile_id, pile_scheduler in shard.pile_schedulers.items():
+                    queued = take(pile_type, f'P{pile_id}')
+                    for request in queued:
+                        if request.state == RequestState.QUEUED:
+                            shard.queued_index.push(request.request_id, request)
+                    pile_scheduler.restore(queued)
+
+                # 充电桩已不存在等原因无法放回原队列的请求，转入故障队列重新调度
+                for request_id, request in requests.items():
+                    if request_id in restored or request.request_type != pile_type:
+                        continue
+                    warning("[journal] request %d cannot be restored to its queue, moved to recovery queue.",
+                            request_id)
+                    request.state = RequestState.RECOVERING
+                    request.pile_id = None
+                    restored[request_id] = request
+                    shard.recovery_queue.push(request_id, request)
+                    if shard.scheduling_mode == SchedulingMode.NORMAL:
+                        shard.scheduling_mode = self.__recovery_mode
+
+        with self.__index_lock:
+            for request_id, request in restored.items():
+                self.__waiting_area_map[request_id] = request
+                self.__username_to_request_id[request.username] = request_id
+                self.__id_allocator.reserve(request_id)
+                if request.in_waiting_area:
+                    self.__waiting_area_used += 1
+
+        for shard in self.__shards.values():
+            with shard.lock:
+                self.__publish(shard)
+        debug("[journal] %d requests restored.", len(restored))
+
+    @contextmanager
+    def __lock_request(self, request_id: int,
+                       extra_type: PileType = None) -> Iterator[_ChargingRequest]:
+        """锁定请求所在分片（及 extra_type 对应分片），并返回加锁后仍然有效的请求"""
+        while True:
+            request = self.__waiting_area_map.get(request_id)
+            if request is None:
+                raise MappingNotExisted("充电请求不存在")
+            pile_types = {request.request_type}
+            if extra_type is not None:
+                pile_types.add(extra_type)
+            with ExitStack() as stack:
+                for pile_type in sorted(pile_types):
+                    stack.enter_context(self.__shards[pile_type].lock)
+                # 请求ID可能在加锁前被回收复用
+                if self.__waiting_area_map.get(request_id) is request:
+                    yield request
+                    return
 
-        threading.Thread(target=self.__check_proc).start()
+    def __on_pile_change(self, shard: _PileTypeShard, pile_scheduler: PileScheduler) -> None:
+        """更新充电桩在空闲充电桩索引与调度策略中的位置，并记录待发布的变化"""
+        pile_id = pile_scheduler.get_pile_id()
+        used_size = pile_scheduler.get_used_size()
+        cost = None
+        free_slots = 0
+        if not pile_scheduler.is_broken:
+            free_slots = self.__waiting_queue_capacity - used_size
+        if free_slots > 0:
+            cost = pile_scheduler.estimate_time()
+        shard.spare_piles.update(pile_id, cost)
+        shard.policy.on_pile_change(pile_scheduler, free_slots)
 
-    @classmethod
-    def __pop_queue(cls, queue: Tuple[List[_ChargingRequest], int]) -> _ChargingRequest | None:
-        while len(queue[0]) > 0 and queue[0][0].is_removed:
-            queue[0].pop(0)
-            queue[1] -= 1
-        if len(queue[0]) == 0:
+        shard.dirty_queues.add(f'P{pile_id}')
+        if pile_scheduler.is_broken:
+            shard.broken_piles.add(pile_id)
+        else:
+            shard.broken_piles.discard(pile_id)
+        previous_size = shard.used_sizes.get(pile_id)
+        if previous_size == used_size:
             return
-        request = queue[0].pop(0)
-        queue[1] -= 1
-        return request
-
-    @classmethod
-    def __push_queue(cls, queue: Tuple[List[_ChargingRequest], int],
-                     request: _ChargingRequest) -> None:
-        queue[0].append(request)
-        queue[1] += 1
-
-    def __find_fastest_spare_pile(self, request_type: PileType) -> int:
-        fastest_pile = None
-        shortest_time = float('inf')
-        for pile_id, pile_scheduler in self.__pile_schedulers.items():
-            if pile_scheduler.is_broken is True:
-                continue
-            if pile_scheduler.get_type() != request_type:
-                continue
-            if pile_scheduler.get_used_size() == WAITING_QUEUE_CAPACITY:
-                continue
-            cost = pile_scheduler.estimate_time()
-            if shortest_time <= cost:
-                continue
-            fastest_pile = pile_id
-            shortest_time = cost
-        return fastest_pile
-
-    def __try_schedule(self) -> None:
-        def schedule_on_type(pile_type: PileType) -> None:
-            while True:
-                target_pile = self.__find_fastest_spare_pile(pile_type)
-                if target_pile is None:
-                    return
-                waiting_area_queue = self.__waiting_areas[pile_type]
-                request = Scheduler.__pop_queue(waiting_area_queue)
-                if request is None:
-                    return
-                request.is_in_waiting_queue = True
-                request.pile_id = target_pile
-                self.__pile_schedulers[target_pile].push_to_queue(request)
-                debug("[scheduler] request %d has been moved into queue of pile %d",
-                      request.request_id, request.pile_id)
-
-        skip_types = set()
-        if self.__scheduling_mode != SchedulingMode.NORMAL:
-            pile_type = self.__pile_schedulers[self.__broken_pile_id].get_type()
-            skip_types.add(pile_type)  # 跳过进行故障调度的充电桩
-            while len(self.__recovery_queue) > 0:
-                target_pile = self.__find_fastest_spare_pile(pile_type)
+        shard.used_sizes[pile_id] = used_size
+        shard.used_size_counts[used_size] += 1
+        if previous_size is not None:
+            shard.used_size_counts[previous_size] -= 1
+        if used_size > shard.max_used_size:
+            shard.max_used_size = used_size
+        while shard.max_used_size > 0 and shard.used_size_counts[shard.max_used_size] == 0:
+            shard.max_used_size -= 1
+
+    @staticmethod
+    def __queue_statuses(shard: _PileTypeShard, key: str) -> Iterator[Tuple[_ChargingRequest, RequestStatus]]:
+        """按排队顺序生成队列内请求的状态"""
+        if key == shard.recovery_key:
+            for pos, request in enumerate(shard.recovery_queue):
+                yield request, RequestStatus(StatusType.FAILTREQUEUE, pos, None)
+        else:
+            pile_id = int(key[1:])
+            pile_scheduler = shard.pile_schedulers.get(pile_id)
+            if pile_scheduler is None:
+                return
+            for pos, request in enumerate(pile_scheduler.iter_requests()):
+                if request.state == RequestState.CHARGING:
+                    yield request, RequestStatus(StatusType.CHARGING, 0, pile_id)
+                else:
+                    yield request, RequestStatus(StatusType.WAITINGSTAGE2, pos, pile_id)
+
+    def __publish(self, shard: _PileTypeShard) -> None:
+        """发布自上次发布后的变化，并通知等待快照变化的订阅者
+
+        重新生成变化的充电桩队列与故障队列内请求的视图（队列内的排队位置可能整体变化），以及入队或修改过的
+        等候区请求的视图。等候区请求的排队位置不写入视图，快照只引用等候区当前的排名索引，读取时再计算，
+        因此等候区的入队、出队与取消不会使其他等候请求的视图变化。新快照以写时复制的方式共享未变化的部分，
+        耗时与变化的请求数及变化的充电桩队列长度成正比，不随等候区的请求数增长。
+        """
+        dirty_queues = shard.dirty_queues
+        dirty_waiting = shard.dirty_waiting
+        removed = shard.removed
+        shard.dirty_queues = set()
+        shard.dirty_waiting = set()
+        shard.removed = {}
+
+        snapshot = shard.snapshot
+        touched: Dict[int, _ChargingRequest] = {}
+        queues: Dict[str, Tuple[int, ...]] = {}
+        statuses: List[Tuple[_ChargingRequest, RequestStatus]] = []
+        for key in dirty_queues:
+            queue_statuses = list(self.__queue_statuses(shard, key))
+            queues[key] = tuple(request.request_id for request, _ in queue_statuses)
+            statuses.extend(queue_statuses)
+        for request_id in dirty_waiting:
+            # 已被调度到充电桩队列的请求由充电桩队列生成视图
+            request = shard.waiting_area.get(request_id)
+            if request is not None:
+                status = StatusType.WAITINGSTAGE1
+                if request.state == RequestState.REQUEUED:
+                    status = StatusType.CHANGEMODEREQUEUE
+                statuses.append((request, RequestStatus(status, 0, None)))
+        views: Dict[int, RequestView] = {}
+        for request, status in statuses:
+            touched[request.request_id] = request
+            view = _make_view(request, status)
+            if snapshot.by_request_id.get(request.request_id) != view:
+                views[request.request_id] = view
+        # 请求ID可能在同一次发布前被新请求复用
+        removed_ids = [request_id for request_id in removed if request_id not in touched]
+        removed_usernames = []
+        for request_id in removed_ids:
+            old_view = snapshot.by_request_id.get(request_id)
+            if old_view is not None and snapshot.by_username.get(old_view.username) is old_view:
+                removed_usernames.append(old_view.username)
+
+        # 等候区请求的排队位置从最长的充电桩队列长度开始
+        waiting_ranks = shard.waiting_area.ranks
+        waiting_base = shard.max_used_size
+        if len(views) > 0 or len(removed_usernames) > 0 or \
+                waiting_ranks is not snapshot.waiting_ranks or waiting_base != snapshot.waiting_base:
+            shard.snapshot = _ShardSnapshot(
+                snapshot.version + 1,
+                snapshot.by_username.evolve({view.username: view for view in views.values()}, removed_usernames),
+                snapshot.by_request_id.evolve(views, removed_ids),
+                snapshot.epoch,
+                waiting_ranks,
+                waiting_base)
+        if self.__journal is not None:
+            self.__journal.append(self.__journal_records(shard, queues, touched.values(), removed_ids))
+        self.__notifier.notify(self)
+
+    @staticmethod
+    def __journal_records(shard: _PileTypeShard, queues: Dict[str, Tuple[int, ...]],
+                          touched: Iterable[_ChargingRequest], removed_ids: List[int]) -> List[Dict[str, Any]]:
+        """与上次写入调度日志的状态比较，生成变化部分的日志记录
+
+        Args:
+            queues (Dict[str, Tuple[int, ...]]): 变化的队列及其中的请求ID
+            touched (Iterable[_ChargingRequest]): 变化的队列内的全部请求与变化的等候区请求
+            removed_ids (List[int]): 已结束的请求
+        """
+        records = []
+        state = (shard.scheduling_mode, tuple(sorted(shard.broken_piles)))
+        if state != shard.journaled_state:
+            shard.journaled_state = state
+            records.append({'t': 'shard', 'type': shard.pile_type.value,
+                            'mode': state[0].value, 'broken': list(state[1])})
+
+        for request in touched:
+            fields = _journal_fields(request)
+            if shard.journaled_requests.get(request.request_id) != fields:
+                shard.journaled_requests[request.request_id] = fields
+                records.append(_dump_request(request))
+        for request_id in removed_ids:
+            if shard.journaled_requests.pop(request_id, None) is not None:
+                records.append({'t': 'del', 'id': request_id, 'type': shard.pile_type.value})
+
+        for key, ids in queues.items():
+            if shard.journaled_queues.get(key, ()) != ids:
+                shard.journaled_queues[key] = ids
+                records.append({'t': 'queue', 'key': key, 'ids': list(ids)})
+        return records
+
+    def __try_schedule(self, shard: _PileTypeShard) -> None:
+        if shard.scheduling_mode != SchedulingMode.NORMAL:
+            while len(shard.recovery_queue) > 0:
+                target_pile = shard.spare_piles.first()
                 if target_pile is None:  # 队列全满
                     break
-                request = self.__recovery_queue.pop(0)
-                request.fail_flag = False
-                request.pile_id = target_pile
-                self.__pile_schedulers[target_pile].push_to_queue(request)
+                request = shard.recovery_queue.pop()
+                shard.dirty_queues.add(shard.recovery_key)
+                self.__queue_request(shard, request, target_pile,
+                                     in_time_order=shard.scheduling_mode != SchedulingMode.PRIORITY)
                 debug("[recovery] request %d has been moved into queue of pile %d.",
                       request.request_id,
                       target_pile)
-                if len(self.__recovery_queue) == 0:  # 故障队列调度完成
-                    debug("[recovery] recovery queue is empty now. resume scheduling.")
-                    self.__scheduling_mode = SchedulingMode.NORMAL
-                    skip_types.clear()  # 清空 恢复正常调度
-
-        # 对未被故障影响的充电桩进行调度
-        schedule_on_type(PileType.CHARGE)
-        schedule_on_type(PileType.FAST_CHARGE)
-
-    def __find_recovery_position(self, request_id: int) -> int:
-        pos_cnt = 0
-        for request in self.__recovery_queue:
-            if request.request_id == request_id:
-                return pos_cnt
-            pos_cnt += 1
-
-    def __check_if_completed(self, request: _ChargingRequest) -> bool:
-        time_now = get_datetime_now()
-        if request.request_type == PileType.CHARGE:
-            power = NORMAL_PILE_POWER
+            if len(shard.recovery_queue) == 0:  # 故障队列调度完成
+                debug("[recovery] recovery queue is empty now. resume scheduling.")
+                shard.scheduling_mode = SchedulingMode.NORMAL
+
+        for request, target_pile in shard.policy.dispatch(shard.waiting_area, shard.spare_piles):
+            shard.waiting_area.remove(request.request_id)
+            request.waiting_seq = None
+            with self.__index_lock:
+                self.__waiting_area_used -= 1
+            self.__queue_request(shard, request, target_pile)
+            debug("[scheduler] request %d has been moved into queue of pile %d",
+                  request.request_id, request.pile_id)
+
+    @staticmethod
+    def __queue_request(shard: _PileTypeShard, request: _ChargingRequest, pile_id: int,
+                        in_time_order: bool = False) -> None:
+        """将请求放入充电桩队列，先登记到排队请求索引，开始充电时再从索引中移除"""
+        request.state = RequestState.QUEUED
+        request.pile_id = pile_id
+        shard.queued_index.push(request.request_id, request)
+        if in_time_order:
+            shard.pile_schedulers[pile_id].insert_in_time_order(request)
         else:
-            power = FAST_CHARGE_PILE_POWER
-        amount = request.amount
-        begin_time = request.begin_time
-        complete_time = begin_time + \
-            timedelta(seconds=float(amount) / power * 3600)
-        return time_now >= complete_time
-
-    def __check_proc(self) -> None:
-        while True:
-            with self.__check_lock:
-                for _scheduler in self.__pile_schedulers.values():
-                    with self.__lock:
-                        executing_request = _scheduler.get_executing_request()
-                        if executing_request is None:
-                            continue
-                        is_completed = self.__check_if_completed(executing_request)
-                    if is_completed:
-                        debug("[scheduler] request %d completed.", executing_request.request_id)
-                        self.end_request(executing_request.request_id)
-            sleep(1)
+            shard.pile_schedulers[pile_id].push_to_queue(request)
+
+    @staticmethod
+    def __displace(shard: _PileTypeShard, requests: Iterable[_ChargingRequest]) -> None:
+        """将已移出充电桩队列的请求转入故障队列"""
+        for request in requests:
+            debug("[recovery] request %d has been moved to recovery queue.", request.request_id)
+            shard.queued_index.discard(request.request_id)
+            request.pile_id = None
+            request.state = RequestState.RECOVERING
+            shard.recovery_queue.push(request.request_id, request)
+            shard.dirty_queues.add(shard.recovery_key)
 
-    def end_request(self, request_id: int) -> None:
-        with self.__lock:
+    @classmethod
+    def __check_if_completed(cls, request: _ChargingRequest) -> bool:
+        return now_us() >= request.complete_time
+
+    @classmethod
+    def __arm_deadline(cls, shard: _PileTypeShard, request: _ChargingRequest) -> None:
+        """登记请求的完成时刻，若成为最早的完成时刻则唤醒检查线程"""
+        shard.queued_index.discard(request.request_id)
+        entry = (request.complete_time, request.request_id)
+        heappush(shard.deadlines, entry)
+        if shard.deadlines[0] == entry:
+            shard.deadline_cond.notify()
+
+    def __is_deadline_valid(self, deadline: Tuple[int, int]) -> bool:
+        complete_time, request_id = deadline
+        request = self.__waiting_area_map.get(request_id)
+        if request is None or request.state != RequestState.CHARGING:
+            return False
+        return request.complete_time == complete_time
+
+    def __drop_stale_deadlines(self, shard: _PileTypeShard) -> None:
+        """丢弃已取消或已重新登记的完成时刻"""
+        while len(shard.deadlines) > 0 and \
+                not self.__is_deadline_valid(shard.deadlines[0]):
+            heappop(shard.deadlines)
+
+    def __check_proc(self, shard: _PileTypeShard) -> None:
+        with shard.lock:
+            while True:
+                self.__drop_stale_deadlines(shard)
+                if len(shard.deadlines) == 0:
+                    shard.deadline_cond.wait()
+                    continue
+                complete_time, request_id = shard.deadlines[0]
+                timeout = get_clock().to_real_seconds(complete_time - now_us())
+                if timeout > 0:
+                    shard.deadline_cond.wait(timeout)
+                    continue
+                heappop(shard.deadlines)
+                debug("[scheduler] request %d completed.", request_id)
+                self.__end_request(shard, request_id)
+                self.__publish(shard)
+
+    def get_next_deadline(self) -> int | None:
+        """最早的完成时刻（微秒），没有正在充电的请求时返回 None"""
+        deadline = None
+        for shard in self.__shards.values():
+            with shard.lock:
+                self.__drop_stale_deadlines(shard)
+                if len(shard.deadlines) > 0 and (deadline is None or shard.deadlines[0][0] < deadline):
+                    deadline = shard.deadlines[0][0]
+        return deadline
+
+    def complete_due_requests(self) -> int:
+        """结束所有已到完成时刻的请求，供不启动检查线程的调度器使用
+
+        Returns:
+            int: 结束的请求数
+        """
+        completed_cnt = 0
+        now = now_us()
+        for shard in self.__shards.values():
+            with shard.lock:
+                completed = False
+                while True:
+                    self.__drop_stale_deadlines(shard)
+                    if len(shard.deadlines) == 0 or shard.deadlines[0][0] > now:
+                        break
+                    _, request_id = heappop(shard.deadlines)
+                    debug("[scheduler] request %d completed.", request_id)
+                    self.__end_request(shard, request_id)
+                    completed = True
+                    completed_cnt += 1
+                if completed:
+                    self.__publish(shard)
+        return completed_cnt
+
+    def __end_request(self, shard: _PileTypeShard, request_id: int) -> None:
+        with self.__index_lock:
             request = self.__waiting_area_map.pop(request_id)
-            request.is_removed = True
-            self.__id_allocator.dealloc(request_id)
             del self.__username_to_request_id[request.username]
-            if not request.is_in_waiting_queue:
-                self.__waiting_areas[request.request_type][1] -= 1
-                return
-            pile_id = request.pile_id
-            pile_scheduler = self.__pile_schedulers[pile_id]
-            pile_scheduler.remove(request_id)
-
-            if request.is_executing:
-                if not self.__check_if_completed(request):
-                    debug("[scheduler] request %d is cancelled while executing.",
-                          request.request_id)
-                # 触发结算流程生成详单
-                debug("[scheduler] request %d created an order.", request_id)
-                create_order(request.request_type,
-                             request.pile_id,
-                             request.username,
-                             request.amount,
-                             request.create_time,
-                             end_time=get_datetime_now())
-            else:
-                debug("[scheduler] request %d is cancelled.", request_id)
-
-            # pile_scheduler 有空位 触发调度流程
-            self.__try_schedule()
+            if request.in_waiting_area:
+                self.__waiting_area_used -= 1
+        state = request.state
+        request.state = RequestState.REMOVED
+        shard.removed[request_id] = request
+        self.__id_allocator.dealloc(request_id)
+        if state == RequestState.WAITING or state == RequestState.REQUEUED:
+            shard.waiting_area.remove(request_id)
+            return
+        if state == RequestState.RECOVERING:
+            shard.recovery_queue.discard(request_id)
+            shard.dirty_queues.add(shard.recovery_key)
+            debug("[recovery] request %d is cancelled.", request_id)
+            return
+        pile_id = request.pile_id
+        pile_scheduler = shard.pile_schedulers[pile_id]
+        pile_scheduler.remove(request_id)
+        shard.queued_index.discard(request_id)
+
+        if state == RequestState.CHARGING:
+            if not self.__check_if_completed(request):
+                debug("[scheduler] request %d is cancelled while executing.",
+                      request.request_id)
+            # 提交结算记录，由结算写入线程生成详单
+            debug("[scheduler] request %d submitted a settlement.", request_id)
+            end_time = from_us(now_us())
+            self.__on_settle(Settlement(request_type=request.request_type,
+                                        pile_id=request.pile_id,
+                                        username=request.username,
+                                        amount=request.amount,
+                                        begin_time=from_us(request.create_time),
+                                        end_time=end_time,
+                                        create_time=end_time,
+                                        user_id=request.user_id))
+        else:
+            debug("[scheduler] request %d is cancelled.", request_id)
+
+        # pile_scheduler 有空位 触发调度流程
+        self.__try_schedule(shard)
+
+    def end_request(self, request_id: int) -> None:
+        with self.__lock_request(request_id) as request:
+            shard = self.__shards[request.request_type]
+            self.__end_request(shard, request_id)
+            self.__publish(shard)
 
     def update_request(self, request_id: int, amount: Decimal, request_type: PileType) -> None:
-        with self.__lock:
-            request = self.__waiting_area_map[request_id]
-            if request.is_in_waiting_queue:
+        with self.__lock_request(request_id, extra_type=request_type) as request:
+            if not request.in_waiting_area:
                 raise IllegalUpdateAttemption("不允许在充电区更新请求")
 
             if request.request_type == request_type:
-                request.amount = amount
+                request.set_amount(amount)
+                shard = self.__shards[request_type]
+                shard.dirty_waiting.add(request_id)
+                self.__publish(shard)
                 return
 
             # 修改了模式
-            self.end_request(request_id)  # 取消请求
-            self.submit_request(request_type,  # 重新请求
-                                request.username,
-                                amount,
-                                request.battery_capacity,
-                                requeue=True)
-
-    def submit_request(self, request_mode: PileType,
-                       username: str,
-                       amount: Decimal,
-                       battery_capacity: Decimal,
-                       requeue: bool = False) -> None:
-        with self.__lock:
+            self.__end_request(self.__shards[request.request_type], request_id)  # 取消请求
+            self.__submit_request(self.__shards[request_type],  # 重新请求
+                                  request.username,
+                                  amount,
+                                  request.battery_capacity,
+                                  requeue=True,
+                                  user_id=request.user_id)
+            self.__publish(self.__shards[request.request_type])
+            self.__publish(self.__shards[request_type])
+
+    def __submit_request(self, shard: _PileTypeShard,
+                         username: str,
+                         amount: Decimal,
+                         battery_capacity: Decimal,
+                         requeue: bool,
+                         user_id: int | None) -> None:
+        self.__enqueue_request(shard, username, amount, battery_capacity, requeue, user_id)
+        # 等待区更新 尝试调度
+        self.__try_schedule(shard)
+
+    def __enqueue_request(self, shard: _PileTypeShard,
+                          username: str,
+                          amount: Decimal,
+                          battery_capacity: Decimal,
+                          requeue: bool,
+                          user_id: int | None) -> None:
+        """登记请求并放入等候区，不进行调度"""
+        with self.__index_lock:
             if username in self.__username_to_request_id:
                 raise AlreadyRequested("已存在用户请求")
 
-            used_size = sum(q[1] for q in self.__waiting_areas.values())
-            waiting_queue = self.__waiting_areas[request_mode]
-            if used_size == WAITING_AREA_CAPACITY:
+            if self.__waiting_area_used == self.__waiting_area_capacity:
                 raise OutOfSpace("等候区空间不足")
 
             request_id = self.__id_allocator.alloc()
             request = _ChargingRequest(request_id=request_id,
-                                       request_type=request_mode,
+                                       request_type=shard.pile_type,
                                        username=username,
                                        amount=amount,
                                        battery_capacity=battery_capacity,
-                                       create_time=get_datetime_now())
-
-            request.requeue_flag = requeue
+                                       user_id=user_id,
+                                       create_time=now_us(),
+                                       state=RequestState.REQUEUED if requeue else RequestState.WAITING)
 
             self.__waiting_area_map[request_id] = request
             self.__username_to_request_id[username] = request_id
-            Scheduler.__push_queue(waiting_queue, request)
+            self.__waiting_area_used += 1
+        request.waiting_seq = shard.waiting_area.push(request_id, request)
+        shard.dirty_waiting.add(request_id)
 
-            debug("[scheduler] request %d from user %s is submitted", request_id, username)
+        debug("[scheduler] request %d from user %s is submitted", request_id, username)
 
-            # 等待区更新 尝试调度
-            self.__try_schedule()
+    def submit_request(self, request_mode: PileType,
+                       username: str,
+                       amount: Decimal,
+                       battery_capacity: Decimal,
+                       requeue: bool = False,
+                       user_id: int | None = None,
+                       station_id: int | None = None) -> None:
+        """提交充电请求
+
+        Args:
+            user_id (int | None, optional): 用户编号，随结算记录传递，避免结算时按用户名查询
+            station_id (int | None, optional): 充电站编号，由 PartitionedScheduler 路由，单个调度域忽略
+        """
+        shard = self.__shards[request_mode]
+        with shard.lock:
+            self.__submit_request(shard, username, amount, battery_capacity, requeue, user_id)
+            self.__publish(shard)
+
+    def submit_many(self, items: Iterable[SubmitItem]) -> List[ServiceError | None]:
+        """批量提交充电请求
+
+        一次获取涉及的分片锁，按顺序登记全部请求后，每个分片只调度与发布快照一次。
+        等候区已满时先调度已登记的请求再重试，结果与逐个提交相同。
+
+        Returns:
+            List[ServiceError | None]: 各请求的提交结果，成功为 None，失败为对应的异常
+        """
+        items = list(items)
+        pile_types = sorted({item.request_mode for item in items})
+        results: List[ServiceError | None] = []
+        with ExitStack() as stack:
+            for pile_type in pile_types:
+                stack.enter_context(self.__shards[pile_type].lock)
+            for item in items:
+                shard = self.__shards[item.request_mode]
+                try:
+                    try:
+                        self.__enqueue_request(shard, item.username, item.amount, item.battery_capacity,
+                                               False, item.user_id)
+                    except OutOfSpace:
+                        for pile_type in pile_types:
+                            self.__try_schedule(self.__shards[pile_type])
+                        self.__enqueue_request(shard, item.username, item.amount, item.battery_capacity,
+                                               False, item.user_id)
+                except (AlreadyRequested, OutOfSpace) as e:
+                    results.append(e)
+                else:
+                    results.append(None)
+            for pile_type in pile_types:
+                shard = self.__shards[pile_type]
+                self.__try_schedule(shard)
+                self.__publish(shard)
+        debug("[scheduler] %d of %d requests submitted in batch.",
+              results.count(None), len(results))
+        return results
+
+    def get_snapshot(self) -> SchedulerSnapshot:
+        """获取最新发布的状态快照，不获取调度锁"""
+        return SchedulerSnapshot(tuple(shard.snapshot for shard in self.__shards.values()))
+
+    def wait_for_snapshot(self, version: int, timeout: float | None = None) -> SchedulerSnapshot:
+        """阻塞等待快照版本不同于 version 并返回最新快照，超时时返回的快照版本可能仍为 version"""
+        generation = self.__notifier.generation
+        snapshot = self.get_snapshot()
+        if snapshot.version == version:
+            self.__notifier.wait(generation, timeout)
+            snapshot = self.get_snapshot()
+        return snapshot
+
+    async def wait_for_snapshot_async(self, version: int, timeout: float | None = None) -> SchedulerSnapshot:
+        """wait_for_snapshot 的协程版本，不阻塞事件循环"""
+        generation = self.__notifier.generation
+        snapshot = self.get_snapshot()
+        if snapshot.version == version:
+            await self.__notifier.wait_async(generation, timeout)
+            snapshot = self.get_snapshot()
+        return snapshot
 
     def get_request_status(self, request_id: int) -> RequestStatus:
-        with self.__lock:
-            request = self.__waiting_area_map[request_id]
-            if request.is_removed:
-                return RequestStatus(StatusType.NOTCHARGING, -1, None)
-            if request.is_executing:
-                return RequestStatus(StatusType.CHARGING, 0, request.pile_id)
-            if request.fail_flag:
-                pos = self.__find_recovery_position(request_id)
-                return RequestStatus(StatusType.FAILTREQUEUE, pos, None)
-            elif request.is_in_waiting_queue:
-                pile_id = request.pile_id
-                pile_scheduler = self.__pile_schedulers[pile_id]
-                pos = pile_scheduler.find_position(request_id)
-                return RequestStatus(StatusType.WAITINGSTAGE2, pos, pile_id)
-            status = StatusType.WAITINGSTAGE1
-            if request.requeue_flag is True:
-                status = StatusType.CHANGEMODEREQUEUE
-            request_type = request.request_type
-            request_waiting_queue: List[_ChargingRequest] = self.__waiting_areas[request_type][0]
-            pos_cnt = 0
-            for req in request_waiting_queue:
-                if req.request_id == request_id:
-                    break
-                if req.is_removed:
-                    continue
-                pos_cnt += 1
-
-            pos_cnt += max(p.get_used_size()
-                           for p in self.__pile_schedulers.values())
-            return RequestStatus(status, pos_cnt, None)
+        view = self.get_snapshot().find_by_request_id(request_id)
+        if view is None:
+            raise MappingNotExisted("充电请求不存在")
+        return view.status
 
     def brake(self, pile_id: int) -> None:
-        with self.__check_lock:
+        shard = self.__pile_shards[pile_id]
+        with shard.lock:
             debug("[recovery] pile %d is down.", pile_id)
 
-            self.__scheduling_mode = DEFAULT_RECOVERY_MODE
-            self.__broken_pile_id = pile_id
-            pile_scheduler = self.__pile_schedulers[pile_id]
+            shard.scheduling_mode = self.__recovery_mode
+            pile_scheduler = shard.pile_schedulers[pile_id]
             pile_scheduler.is_broken = True
+            # 只有故障充电桩队列中的请求需要重新调度，其他充电桩的队列保持不变；
+            # 尚未调度完的故障队列保留，与新转入的请求一起按创建时刻排序。
+            # 先转出排队的请求再结束正在充电的请求，后者不会在故障充电桩上开始充电，
+            # 结束时触发的调度也不会因故障队列为空而提前恢复正常调度
+            self.__displace(shard, pile_scheduler.fetch_and_clear(include_executing=False))
             executing_request = pile_scheduler.get_executing_request()
             if executing_request is not None:
-                self.end_request(executing_request.request_id)
-
-            match self.__scheduling_mode:
-                case SchedulingMode.PRIORITY:
-                    requests = pile_scheduler.fetch_and_clear(include_executing=True)
-                    for request in requests:
-                        debug("[recovery] request %d has been moved to recovery queue.",
-                              request.request_id)
-                        request.pile_id = None
-                        request.fail_flag = True
-                    self.__recovery_queue = list(requests)
-                case SchedulingMode.TIME_ORDERED:
-                    pile_type = pile_scheduler.get_type()
-                    requests: List[_ChargingRequest] = []
-                    for _pile_id, _scheduler in self.__pile_schedulers.items():
-                        if _scheduler.get_type() != pile_type:
-                            continue
-                        include_executing = False
-                        if _pile_id == pile_id:
-                            include_executing = True
-                        _requests = _scheduler.fetch_and_clear(include_executing)
-                        requests += _requests
-                    for request in requests:
-                        debug("[recovery] request %d has been moved to recovery queue.",
-                              request.request_id)
-                        request.pile_id = None
-                        request.fail_flag = True
-                    requests = sorted(requests)
-                    self.__recovery_queue = list(requests)
-            self.__try_schedule()
+                self.__end_request(shard, executing_request.request_id)
+            self.__try_schedule(shard)
+            self.__publish(shard)
 
     def recover(self, pile_id: int) -> None:
-        with self.__check_lock:
+        shard = self.__pile_shards[pile_id]
+        with shard.lock:
             debug("[recovery] pile %d is up.", pile_id)
 
-            self.__scheduling_mode = SchedulingMode.RECOVERY
-            pile_scheduler = self.__pile_schedulers[pile_id]
+            shard.scheduling_mode = SchedulingMode.RECOVERY
+            pile_scheduler = shard.pile_schedulers[pile_id]
             pile_scheduler.is_broken = False
 
-            pile_type = pile_scheduler.get_type()
-            requests: List[_ChargingRequest] = []
-            for _, _scheduler in self.__pile_schedulers.items():
-                if _scheduler.get_type() != pile_type:
-                    continue
-                _requests = _scheduler.fetch_and_clear(include_executing=False)
-                requests += _requests
+            # 最早排队的若干个请求转入故障队列，其余请求保持原有位置；
+            # 故障队列中最早的请求放入恢复的充电桩，放满后其余请求再按空闲充电桩调度
+            requests = shard.queued_index.smallest(self.__waiting_queue_capacity)
             for request in requests:
-                debug("[recovery] request %d has been moved to recovery queue.",
-                        request.request_id)
-                request.pile_id = None
-                request.fail_flag = True
-            requests = sorted(requests)
-            self.__recovery_queue = list(requests)
+                shard.pile_schedulers[request.pile_id].remove(request.request_id)
+            self.__displace(shard, requests)
+            while len(shard.recovery_queue) > 0 and pile_scheduler.get_used_size() < self.__waiting_queue_capacity:
+                request = shard.recovery_queue.pop()
+                shard.dirty_queues.add(shard.recovery_key)
+                self.__queue_request(shard, request, pile_id, in_time_order=True)
+                debug("[recovery] request %d has been moved into queue of pile %d.", request.request_id, pile_id)
+            self.__try_schedule(shard)
+            self.__publish(shard)
 
     def get_request_id_by_username(self, username: str) -> int:
-        with self.__lock:
-            request_id = self.__username_to_request_id.get(username)
-            if request_id is None:
-                raise MappingNotExisted("用户未创建充电请求")
-            return request_id
+        request_id = self.__username_to_request_id.get(username)
+        if request_id is None:
+            raise MappingNotExisted("用户未创建充电请求")
+        return request_id
 
     def snapshot(self) -> List[Dict[str, Any]]:
-        request_list = []
-        for request in self.__waiting_area_map.values():
-            request_info = {
-                'pile_id': str(request.pile_id),
-                'username': request.username,
-                'battery_size': request.battery_capacity,
-                'require_amount': request.amount,
-                'waiting_time': (get_datetime_now() - request.create_time).seconds
-            }
-            request_list.append(request_info)
-        return request_list
+        return self.get_snapshot().to_rows()
 
 
-scheduler: Scheduler = None
+scheduler: Scheduler = None  # remote 模式下为 RemoteScheduler，按充电站划分时为 PartitionedScheduler
 
 
 # def get_request_position_by_identifier(request_id: int) -> _ChargingRequest:
@@ -518,16 +1243,49 @@ scheduler: Scheduler = None
 
 def on_init() -> None:
     """调度器模块初始化
+
+    settings.SCHEDULER_MODE 为 remote 时连接独立调度进程（manage.py run_scheduler），否则在进程内创建调度器，
+    使用 settings.SCHEDULING_POLICY 指定的调度策略，并从 settings.SCHEDULER_JOURNAL_PATH 指定的调度日志恢复状态。
+    settings.SCHEDULER_PARTITIONED 为 True 时每个充电站创建一个调度域，见 schd_partition 模块。
     """
     global scheduler
 
-    scheduler = Scheduler()
-    for i in range(1, 14):
-        scheduler.submit_request(PileType.CHARGE, f'user{i:02d}', Decimal('15.00'), Decimal('65.50'))
-
-    for i in range(15, 31):
-        scheduler.submit_request(PileType.FAST_CHARGE, f'user{i:02d}', Decimal('15.00'), Decimal('65.50'))
+    if getattr(settings, 'SCHEDULER_PARTITIONED', False):
+        from acss_app.service.schd_partition import create_partitioned_scheduler
+        scheduler = create_partitioned_scheduler()
+        # 每个充电站一个调度进程时不添加演示数据，避免同一用户在多个充电站都有请求
+        if getattr(settings, 'SCHEDULER_MODE', 'local') == 'remote' or \
+                getattr(settings, 'SCHEDULER_STATION', None) is not None:
+            return
+    elif getattr(settings, 'SCHEDULER_MODE', 'local') == 'remote':
+        from acss_app.service.schd_remote import RemoteScheduler
+        scheduler = RemoteScheduler(settings.SCHEDULER_SOCKET_PATH)
+        return
+    else:
+        scheduler = __create_scheduler()
+    # 从调度日志恢复了请求时不再添加演示数据
+    if next(scheduler.get_snapshot().iter_views(), None) is not None:
+        return
+
+    items = [SubmitItem(PileType.CHARGE, f'user{i:02d}', Decimal('15.00'), Decimal('65.50')) for i in range(1, 14)]
+    items += [SubmitItem(PileType.FAST_CHARGE, f'user{i:02d}', Decimal('15.00'), Decimal('65.50'))
+              for i in range(15, 31)]
+    scheduler.submit_many(items)
 
     # scheduler.update_request(15, Decimal('23.00'), Decimal('53.50'))
     # scheduler.end_request(0)
     # scheduler.update_request(15, Decimal('23.00'), Decimal('53.50'))
+
+
+def __create_scheduler() -> Scheduler:
+    """在进程内创建单个调度域的调度器"""
+    journal = None
+    journal_path = getattr(settings, 'SCHEDULER_JOURNAL_PATH', None)
+    if journal_path is not None:
+        journal = SchedulerJournal(journal_path)
+        atexit.register(journal.close)
+    id_allocator = RequestIdAllocator(MAX_RECYCLE_ID,
+                                      getattr(settings, 'REQUEST_ID_MAX_CAPACITY', None),
+                                      getattr(settings, 'REQUEST_ID_GENERATION_TAGGED', False))
+    policy = SchedulingPolicy(getattr(settings, 'SCHEDULING_POLICY', DEFAULT_SCHEDULING_POLICY.value))
+    return Scheduler(journal=journal, id_allocator=id_allocator, policy=policy)
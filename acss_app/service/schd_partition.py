@@ -0,0 +1,401 @@
+"""按充电站划分的调度模块
+
+每个充电站（Station）是一个独立的调度域，拥有各自的等候区、队列容量、空闲充电桩索引、检查线程与调度日志，
+调度域之间不共享锁。PartitionedScheduler 提供与 Scheduler 相同的接口，按充电站、请求ID或充电桩编号
+将调用路由到对应的调度域，单次调度操作的开销只与所在充电站的规模有关。
+
+调度域可以是进程内的 Scheduler，也可以是连接独立调度进程（manage.py run_scheduler）的 RemoteScheduler。
+各调度域的请求ID空间按 STATION_ID_STRIDE 划分，请求ID除以 STATION_ID_STRIDE 的余数即为充电站编号。
+"""
+import atexit
+import functools
+import operator
+
+from contextlib import ExitStack
+from datetime import datetime, timedelta
+from decimal import Decimal
+from pathlib import Path
+from threading import Lock
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Tuple
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import Q
+
+from acss_app.models import Pile, PileType, Station, StationClaim
+from acss_app.service.exceptions import AlreadyRequested, MappingNotExisted, ServiceError
+from acss_app.service.journal import SchedulerJournal
+from acss_app.service.schd import (DEFAULT_SCHEDULING_POLICY, MAX_RECYCLE_ID, RequestStatus, Scheduler,
+                                   SchedulerSnapshot, SchedulingPolicy, SubmitItem)
+from acss_app.service.util.change_notifier import ChangeNotifier
+from acss_app.service.util.id_allocator import RequestIdAllocator
+
+
+DEFAULT_STATION_ID = 0  # 未分配充电站的充电桩组成的调度域
+STATION_ID_STRIDE = 1024  # 请求ID空间划分的调度域数量，充电站编号须小于该值
+
+_USER_LOCK_STRIPES = 64
+_RELEASE_BATCH = 200  # 一次删除的认领数量上限（受 SQL 参数数量限制）
+
+# 尚未提交成功的认领在此时长内不会被其他充电站抢占，须大于 schd_remote.CALL_TIMEOUT
+CLAIM_GRACE = timedelta(seconds=30)
+
+
+def station_of(request_id: int) -> int:
+    """请求所在调度域的充电站编号"""
+    return request_id % STATION_ID_STRIDE
+
+
+def station_path(path: str | Path, station_id: int) -> Path:
+    """调度域使用的文件路径（调度日志、套接字），在文件名后附加充电站编号"""
+    path = Path(path)
+    return path.with_name(f'{path.stem}-{station_id}{path.suffix}')
+
+
+class PartitionedScheduler:
+    """按充电站划分的调度器
+
+    同一用户在所有充电站中至多有一个请求，提交请求前先认领用户的充电站，按用户名分段加锁：
+    调度域全部在进程内时以用户名到充电站的映射认领；使用调度进程时其他 Web 进程也会提交请求，
+    在数据库中认领（StationClaim），映射只作为查询请求ID的缓存。
+    调度域发布快照时记录其中消失的用户，下次提交请求前删除这些用户的映射与认领。
+    """
+
+    def __init__(self, domains: Mapping[int, Scheduler], pile_stations: Mapping[int, int],
+                 notifier: ChangeNotifier) -> None:
+        """
+        Args:
+            domains (Mapping[int, Scheduler]): 充电站编号 -> 调度域（Scheduler 或 RemoteScheduler）
+            pile_stations (Mapping[int, int]): 充电桩编号 -> 充电站编号
+            notifier (ChangeNotifier): 各调度域共用的快照变化通知
+        """
+        self.__domains = dict(sorted(domains.items()))
+        self.__pile_stations = dict(pile_stations)
+        self.__notifier = notifier
+        self.__default_station = DEFAULT_STATION_ID if DEFAULT_STATION_ID in self.__domains else \
+            next(iter(self.__domains))
+        self.__exclusive = all(isinstance(domain, Scheduler) for domain in self.__domains.values())
+        self.__user_locks = [Lock() for _ in range(_USER_LOCK_STRIPES)]
+        self.__user_stations: Dict[str, int] = {}
+        for station_id, domain in self.__domains.items():
+            for view in domain.get_snapshot().iter_views():
+                self.__user_stations[view.username] = station_id
+        self.__domain_stations = {id(domain): station_id for station_id, domain in self.__domains.items()}
+        self.__ended_lock = Lock()
+        self.__seen_shards = {station_id: domain.get_snapshot().shards for station_id, domain in self.__domains.items()}
+        self.__ended: List[Tuple[str, int]] = []  # 快照中消失的 (用户名, 充电站编号)
+        notifier.add_listener(self.__on_publish)
+
+    @property
+    def station_ids(self) -> List[int]:
+        return list(self.__domains)
+
+    def get_domain(self, station_id: int) -> Scheduler:
+        domain = self.__domains.get(station_id)
+        if domain is None:
+            raise MappingNotExisted("充电站不存在")
+        return domain
+
+    def __domain_of(self, request_id: int) -> Scheduler:
+        domain = self.__domains.get(station_of(request_id))
+        if domain is None:
+            raise MappingNotExisted("充电请求不存在")
+        return domain
+
+    def __user_lock_index(self, username: str) -> int:
+        return hash(username) % _USER_LOCK_STRIPES
+
+    def __lookup(self, username: str) -> Tuple[int, int] | None:
+        """用户当前请求所在的 (充电站编号, 请求ID)，没有请求时返回 None"""
+        station_id = self.__user_stations.get(username)
+        if station_id is not None:
+            try:
+                return station_id, self.__domains[station_id].get_request_id_by_username(username)
+            except MappingNotExisted:
+                self.__user_stations.pop(username, None)
+        if self.__exclusive:
+            return None
+        # 其他 Web 进程提交的请求可能尚未推送到本地快照，先按认领记录查询
+        claim = StationClaim.objects.filter(username=username).first()
+        if claim is not None and claim.station_id in self.__domains:
+            try:
+                request_id = self.__domains[claim.station_id].get_request_id_by_username(username)
+            except MappingNotExisted:
+                pass
+            else:
+                self.__user_stations[username] = claim.station_id
+                return claim.station_id, request_id
+        for station_id, domain in self.__domains.items():
+            if domain.get_snapshot().find_by_username(username) is None:
+                continue
+            try:
+                request_id = domain.get_request_id_by_username(username)
+            except MappingNotExisted:
+                continue
+            self.__user_stations[username] = station_id
+            return station_id, request_id
+        return None
+
+    def __on_publish(self, source: Any) -> None:
+        """调度域发布快照时记录其中消失的用户，在发布快照的线程中执行，不获取其他锁"""
+        station_id = self.__domain_stations.get(id(source))
+        if station_id is None:
+            return
+        with self.__ended_lock:
+            shards = source.get_snapshot().shards
+            for shard, seen_shard in zip(shards, self.__seen_shards[station_id]):
+                if shard is not seen_shard:
+                    _, removed = shard.by_username.diff(seen_shard.by_username)
+                    self.__ended.extend((username, station_id) for username in removed)
+            self.__seen_shards[station_id] = shards
+
+    def __release_ended(self) -> None:
+        """删除已结束请求的用户名映射与认领，调用方不持有用户锁"""
+        with self.__ended_lock:
+            ended, self.__ended = self.__ended, []
+        released = []
+        for username, station_id in ended:
+            with self.__user_locks[self.__user_lock_index(username)]:
+                # 请求可能在同一充电站内修改了充电模式，或用户已重新提交
+                if self.__domains[station_id].get_snapshot().find_by_username(username) is not None:
+                    continue
+                if self.__user_stations.get(username) == station_id:
+                    del self.__user_stations[username]
+            released.append(Q(username=username, station_id=station_id, request_id__isnull=False))
+        if self.__exclusive:
+            return
+        for begin in range(0, len(released), _RELEASE_BATCH):
+            StationClaim.objects.filter(functools.reduce(operator.or_, released[begin:begin + _RELEASE_BATCH])).delete()
+
+    def __check_station(self, username: str, station_id: int) -> None:
+        """用户在其他充电站已有请求时抛出 AlreadyRequested，同一充电站内由调度域检查"""
+        found = self.__lookup(username)
+        if found is not None and found[0] != station_id:
+            raise AlreadyRequested("已存在用户请求")
+
+    def __claim(self, username: str, station_id: int) -> bool:
+        """在数据库中认领用户的充电站，返回是否新建了认领（提交失败时由调用方删除）
+
+        认领属于其他充电站时抛出 AlreadyRequested，除非该充电站已没有该用户的请求且认领超过 CLAIM_GRACE
+        （认领的 Web 进程可能在提交前退出，或请求结束后没有进程删除认领），此时抢占该认领。
+        """
+        now = datetime.now()
+        claim, created = StationClaim.objects.get_or_create(username=username,
+                                                            defaults={'station_id': station_id, 'claim_time': now})
+        if created:
+            return True
+        if claim.station_id == station_id:
+            return False
+        domain = self.__domains.get(claim.station_id)
+        if domain is None or domain.get_snapshot().find_by_username(username) is not None or \
+                now - claim.claim_time < CLAIM_GRACE:
+            raise AlreadyRequested("已存在用户请求")
+        taken = StationClaim.objects.filter(username=username, station_id=claim.station_id,
+                                            claim_time=claim.claim_time) \
+            .update(station_id=station_id, request_id=None, claim_time=now)
+        if taken == 0:
+            raise AlreadyRequested("已存在用户请求")
+        return True
+
+    def __confirm_claim(self, username: str, station_id: int) -> None:
+        """提交成功后在认领中记录请求ID；认领已被其他充电站抢占时撤销刚提交的请求"""
+        domain = self.__domains[station_id]
+        view = domain.get_snapshot().find_by_username(username)
+        request_id = view.request_id if view is not None else domain.get_request_id_by_username(username)
+        fields = {'station_id': station_id, 'request_id': request_id, 'claim_time': datetime.now()}
+        if StationClaim.objects.filter(username=username, station_id=station_id).update(**fields) > 0:
+            return
+        # 认领在提交期间被删除（原请求结束后其他进程清理），重新创建
+        claim, created = StationClaim.objects.get_or_create(username=username, defaults=fields)
+        if not created and claim.station_id != station_id:
+            domain.end_request(request_id)
+            raise AlreadyRequested("已存在用户请求")
+
+    def __submit_claimed(self, username: str, station_id: int, submit: Callable[[], Any]) -> Any:
+        """认领用户的充电站后提交请求"""
+        if self.__exclusive:
+            self.__check_station(username, station_id)
+            return submit()
+        created = self.__claim(username, station_id)
+        try:
+            result = submit()
+        except BaseException:
+            if created:
+                StationClaim.objects.filter(username=username, station_id=station_id, request_id=None).delete()
+            raise
+        self.__confirm_claim(username, station_id)
+        return result
+
+    def submit_request(self, request_mode: PileType,
+                       username: str,
+                       amount: Decimal,
+                       battery_capacity: Decimal,
+                       requeue: bool = False,
+                       user_id: int | None = None,
+                       station_id: int | None = None) -> None:
+        """提交充电请求到 station_id 对应的充电站，为 None 时提交到默认充电站"""
+        if station_id is None:
+            station_id = self.__default_station
+        domain = self.get_domain(station_id)
+        self.__release_ended()
+        with self.__user_locks[self.__user_lock_index(username)]:
+            self.__submit_claimed(username, station_id, lambda: domain.submit_request(
+                request_mode, username, amount, battery_capacity, requeue, user_id))
+            self.__user_stations[username] = station_id
+
+    def submit_many(self, items: Iterable[SubmitItem]) -> List[ServiceError | None]:
+        """批量提交充电请求，按充电站分组后每个调度域批量提交一次"""
+        items = list(items)
+        results: List[ServiceError | None] = [None] * len(items)
+        groups: Dict[int, List[int]] = {}
+        claimed: Dict[str, int] = {}
+        pending = set()  # 新建了数据库认领、尚未提交的请求
+        self.__release_ended()
+        with ExitStack() as stack:
+            for index in sorted({self.__user_lock_index(item.username) for item in items}):
+                stack.enter_context(self.__user_locks[index])
+            for index, item in enumerate(items):
+                station_id = self.__default_station if item.station_id is None else item.station_id
+                try:
+                    self.get_domain(station_id)
+                    if claimed.setdefault(item.username, station_id) != station_id:
+                        raise AlreadyRequested("已存在用户请求")
+                    if self.__exclusive:
+                        self.__check_station(item.username, station_id)
+                    elif self.__claim(item.username, station_id):
+                        pending.add(index)
+                except (AlreadyRequested, MappingNotExisted) as e:
+                    results[index] = e
+                    continue
+                groups.setdefault(station_id, []).append(index)
+            try:
+                for station_id, indexes in groups.items():
+                    errors = self.__domains[station_id].submit_many([items[index] for index in indexes])
+                    for index, error in zip(indexes, errors):
+                        username = items[index].username
+                        if error is None and not self.__exclusive:
+                            pending.discard(index)
+                            try:
+                                self.__confirm_claim(username, station_id)
+                            except AlreadyRequested as e:
+                                error = e
+                        results[index] = error
+                        if error is None:
+                            self.__user_stations[username] = station_id
+            finally:
+                for index in pending:
+                    StationClaim.objects.filter(username=items[index].username, request_id=None,
+                                                station_id=claimed[items[index].username]).delete()
+        return results
+
+    def update_request(self, request_id: int, amount: Decimal, request_type: PileType) -> None:
+        # 修改充电模式后重新提交的请求仍由同一调度域分配ID
+        self.__domain_of(request_id).update_request(request_id, amount, request_type)
+
+    def end_request(self, request_id: int) -> None:
+        self.__domain_of(request_id).end_request(request_id)
+
+    def get_request_id_by_username(self, username: str) -> int:
+        found = self.__lookup(username)
+        if found is None:
+            raise MappingNotExisted("用户未创建充电请求")
+        return found[1]
+
+    def get_request_status(self, request_id: int) -> RequestStatus:
+        return self.__domain_of(request_id).get_request_status(request_id)
+
+    def brake(self, pile_id: int) -> None:
+        self.__domains[self.__pile_stations[pile_id]].brake(pile_id)
+
+    def recover(self, pile_id: int) -> None:
+        self.__domains[self.__pile_stations[pile_id]].recover(pile_id)
+
+    def get_snapshot(self) -> SchedulerSnapshot:
+        """合并各调度域最新发布的快照，不获取调度锁"""
+        return SchedulerSnapshot(tuple(shard for domain in self.__domains.values()
+                                       for shard in domain.get_snapshot().shards))
+
+    def wait_for_snapshot(self, version: int, timeout: float | None = None) -> SchedulerSnapshot:
+        """见 Scheduler.wait_for_snapshot，任一调度域发布快照时唤醒"""
+        generation = self.__notifier.generation
+        snapshot = self.get_snapshot()
+        if snapshot.version == version:
+            self.__notifier.wait(generation, timeout)
+            snapshot = self.get_snapshot()
+        return snapshot
+
+    async def wait_for_snapshot_async(self, version: int, timeout: float | None = None) -> SchedulerSnapshot:
+        """见 Scheduler.wait_for_snapshot_async"""
+        generation = self.__notifier.generation
+        snapshot = self.get_snapshot()
+        if snapshot.version == version:
+            await self.__notifier.wait_async(generation, timeout)
+            snapshot = self.get_snapshot()
+        return snapshot
+
+    def get_next_deadline(self) -> int | None:
+        """见 Scheduler.get_next_deadline，只适用于进程内的调度域"""
+        deadlines = [deadline for deadline in (domain.get_next_deadline() for domain in self.__domains.values())
+                     if deadline is not None]
+        return min(deadlines, default=None)
+
+    def complete_due_requests(self) -> int:
+        """见 Scheduler.complete_due_requests，只适用于进程内的调度域"""
+        return sum(domain.complete_due_requests() for domain in self.__domains.values())
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        return self.get_snapshot().to_rows()
+
+
+def create_partitioned_scheduler() -> PartitionedScheduler:
+    """按数据库中的充电站创建调度器
+
+    settings.SCHEDULER_STATION 不为 None 时只创建该充电站的调度域（每个充电站一个调度进程）。
+    remote 模式下连接各充电站的调度进程，套接字路径为 station_path(SCHEDULER_SOCKET_PATH, 充电站编号)；
+    否则在进程内创建调度域，调度日志路径为 station_path(SCHEDULER_JOURNAL_PATH, 充电站编号)。
+    """
+    stations: Dict[int, Station | None] = {station.station_id: station for station in Station.objects.all()}
+    piles: Dict[int, List[Pile]] = {}
+    for pile in Pile.objects.only('pile_id', 'pile_type', 'station'):
+        piles.setdefault(DEFAULT_STATION_ID if pile.station_id is None else pile.station_id, []).append(pile)
+    if DEFAULT_STATION_ID in piles or len(stations) == 0:
+        stations[DEFAULT_STATION_ID] = None
+    for station_id in stations:
+        if station_id >= STATION_ID_STRIDE:
+            raise ImproperlyConfigured(f"充电站编号 {station_id} 超出上限 {STATION_ID_STRIDE}")
+
+    only_station = getattr(settings, 'SCHEDULER_STATION', None)
+    if only_station is not None:
+        only_station = int(only_station)
+        if only_station not in stations:
+            raise ImproperlyConfigured(f"充电站 {only_station} 不存在")
+        stations = {only_station: stations[only_station]}
+
+    notifier = ChangeNotifier()
+    pile_stations = {pile.pile_id: station_id for station_id in stations for pile in piles.get(station_id, [])}
+    domains: Dict[int, Scheduler] = {}
+    if getattr(settings, 'SCHEDULER_MODE', 'local') == 'remote':
+        from acss_app.service.schd_remote import RemoteScheduler
+        for station_id in stations:
+            domains[station_id] = RemoteScheduler(station_path(settings.SCHEDULER_SOCKET_PATH, station_id),
+                                                  notifier=notifier)
+        return PartitionedScheduler(domains, pile_stations, notifier)
+
+    journal_path = getattr(settings, 'SCHEDULER_JOURNAL_PATH', None)
+    policy = SchedulingPolicy(getattr(settings, 'SCHEDULING_POLICY', DEFAULT_SCHEDULING_POLICY.value))
+    for station_id, station in stations.items():
+        journal = None
+        if journal_path is not None:
+            journal = SchedulerJournal(station_path(journal_path, station_id))
+            atexit.register(journal.close)
+        id_allocator = RequestIdAllocator(MAX_RECYCLE_ID,
+                                          getattr(settings, 'REQUEST_ID_MAX_CAPACITY', None),
+                                          getattr(settings, 'REQUEST_ID_GENERATION_TAGGED', False),
+                                          stride=STATION_ID_STRIDE, offset=station_id)
+        capacities = {}
+        if station is not None:
+            capacities = {'waiting_area_capacity': station.waiting_area_capacity,
+                          'waiting_queue_capacity': station.waiting_queue_capacity}
+        domains[station_id] = Scheduler(piles.get(station_id, []), journal=journal, id_allocator=id_allocator,
+                                        policy=policy, notifier=notifier, **capacities)
+    return PartitionedScheduler(domains, pile_stations, notifier)
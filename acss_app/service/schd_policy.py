@@ -0,0 +1,173 @@
+"""调度策略模块
+
+调度策略决定等候区中的请求进入哪个充电桩队列，由 settings.SCHEDULING_POLICY 按部署选择。
+每个调度分片持有一个策略实例，只在分片锁内调用。故障后的调度（SchedulingMode）不受调度策略影响。
+"""
+from abc import ABC, abstractmethod
+from enum import Enum
+from typing import TYPE_CHECKING, Dict, Iterator, List, Tuple
+
+from acss_app.service.timemock import now_us
+from acss_app.service.util.pile_index import SparePileIndex
+from acss_app.service.util.waiting_area import WaitingArea
+
+if TYPE_CHECKING:
+    from acss_app.service.schd import PileScheduler, _ChargingRequest
+
+
+class SchedulingPolicy(Enum):
+    """等候区调度策略"""
+    GREEDY = 'greedy'  # 按到达顺序逐个放入预计排队时长最短的充电桩
+    SHORTEST_JOB_FIRST = 'sjf'  # 优先调度充电时长最短的请求，放入预计排队时长最短的充电桩
+    MIN_COST_BATCH = 'batch'  # 将等候区中的请求批量分配到充电桩空位，使完成时刻之和最小
+
+
+DEFAULT_SCHEDULING_POLICY = SchedulingPolicy.GREEDY
+
+
+class DispatchPolicy(ABC):
+    """调度策略基类"""
+
+    def on_pile_change(self, pile_scheduler: 'PileScheduler', free_slots: int) -> None:
+        """充电桩队列或故障状态变化时调用，free_slots 为可用空位数（故障时为 0）"""
+
+    @abstractmethod
+    def dispatch(self, waiting_area: WaitingArea,
+                 spare_piles: SparePileIndex) -> Iterator[Tuple['_ChargingRequest', int]]:
+        """逐个给出 (请求, 充电桩编号)
+
+        调用方在取下一个之前将请求移出等候区并放入该充电桩队列，
+        因此策略可以在两次给出之间读取更新后的空闲充电桩索引。
+        """
+
+
+class GreedyPolicy(DispatchPolicy):
+    """按到达顺序逐个放入预计排队时长最短的充电桩"""
+
+    def dispatch(self, waiting_area: WaitingArea,
+                 spare_piles: SparePileIndex) -> Iterator[Tuple['_ChargingRequest', int]]:
+        while True:
+            pile_id = spare_piles.first()
+            if pile_id is None:
+                return
+            request = next(iter(waiting_area), None)
+            if request is None:
+                return
+            yield request, pile_id
+
+
+class ShortestJobFirstPolicy(DispatchPolicy):
+    """优先调度充电时长最短的请求，时长相同时按到达顺序
+
+    每次选择需要遍历等候区，等候区容量较小，开销可以忽略。充电量大的请求可能等待更久。
+    """
+
+    def dispatch(self, waiting_area: WaitingArea,
+                 spare_piles: SparePileIndex) -> Iterator[Tuple['_ChargingRequest', int]]:
+        while True:
+            pile_id = spare_piles.first()
+            if pile_id is None or len(waiting_area) == 0:
+                return
+            yield min(waiting_area, key=lambda request: (request.duration, request.create_time,
+                                                         request.request_id)), pile_id
+
+
+def solve_min_cost(durations: List[int], level_loads: List[List[int]]) -> List[int]:
+    """求解请求到充电桩空位的最小代价分配
+
+    充电桩已有队列的剩余时长为 L，新放入的 m 个请求按顺序充电时完成时刻之和为
+    m * L + Σ (m - i + 1) * d_i，即倒数第 r 个请求的代价为 L + r * d。
+    同一层（倒数第 r 个）的空位只有 L 不同，最优解总是使用该层 L 最小的若干个空位；
+    给定各层的请求数后，按排序不等式将长的请求分配到靠后（r 小）的层。
+    因此只需对各层的请求数做动态规划，复杂度 O(层数 * n^2)。
+    若某充电桩使用了第 r 层而未使用第 r - 1 层，实际代价只会更小，不影响最优性。
+
+    Args:
+        durations (List[int]): 待分配请求的充电时长，从长到短排列
+        level_loads (List[List[int]]): level_loads[r] 为可用于倒数第 r + 1 个位置的空位
+            所在充电桩的剩余时长，从小到大排列，各层空位总数不少于请求数
+
+    Returns:
+        List[int]: 各层分配的请求数，第 r 层依次分配请求与空位
+    """
+    n = len(durations)
+    prefix = [0]
+    for duration in durations:
+        prefix.append(prefix[-1] + duration)
+
+    inf = float('inf')
+    best = [0] + [inf] * n  # best[m]: 最长的 m 个请求分配到已处理各层的最小代价
+    choices: List[List[int]] = []
+    for r, loads in enumerate(level_loads, 1):
+        load_prefix = [0]
+        for load in loads:
+            load_prefix.append(load_prefix[-1] + load)
+        next_best = [inf] * (n + 1)
+        choice = [0] * (n + 1)
+        for m in range(n + 1):
+            for k in range(min(m, len(loads)) + 1):
+                cost = best[m - k] + load_prefix[k] + r * (prefix[m] - prefix[m - k])
+                if cost < next_best[m]:
+                    next_best[m] = cost
+                    choice[m] = k
+        best = next_best
+        choices.append(choice)
+
+    counts: List[int] = []
+    m = n
+    for choice in reversed(choices):
+        counts.append(choice[m])
+        m -= choice[m]
+    counts.reverse()
+    return counts
+
+
+class MinCostBatchPolicy(DispatchPolicy):
+    """将等候区中的请求批量分配到充电桩空位，使这些请求的完成时刻之和最小
+
+    为每一层空位（倒数第 r 个位置）维护一个以预计全部充满时刻为键的空闲充电桩索引，
+    调度时只取出每层剩余时长最小的 n 个充电桩。请求多于空位时先调度充电时长最短的请求。
+    放入同一充电桩的请求按充电时长从短到长排队。
+    """
+
+    def __init__(self, queue_capacity: int) -> None:
+        self.__levels = [SparePileIndex() for _ in range(queue_capacity)]
+
+    def on_pile_change(self, pile_scheduler: 'PileScheduler', free_slots: int) -> None:
+        finish_time = pile_scheduler.estimate_finish_time()
+        for r, level in enumerate(self.__levels):
+            level.update(pile_scheduler.get_pile_id(), finish_time if r < free_slots else None)
+
+    def dispatch(self, waiting_area: WaitingArea,
+                 spare_piles: SparePileIndex) -> Iterator[Tuple['_ChargingRequest', int]]:
+        slot_cnt = sum(len(level) for level in self.__levels)
+        if slot_cnt == 0 or len(waiting_area) == 0:
+            return
+        requests = sorted(waiting_area, key=lambda request: (request.duration, request.create_time,
+                                                            request.request_id))
+        requests = requests[:slot_cnt]
+        requests.reverse()
+
+        now = now_us()
+        level_piles = [level.smallest(len(requests)) for level in self.__levels]
+        level_loads = [[max(finish_time - now, 0) for finish_time, _ in piles] for piles in level_piles]
+        counts = solve_min_cost([request.duration for request in requests], level_loads)
+
+        placements: Dict[int, List['_ChargingRequest']] = {}  # 充电桩编号 -> 新放入的请求（从长到短）
+        it = iter(requests)
+        for piles, count in zip(level_piles, counts):
+            for _, pile_id in piles[:count]:
+                placements.setdefault(pile_id, []).append(next(it))
+        for pile_id, pile_requests in placements.items():
+            for request in reversed(pile_requests):
+                yield request, pile_id
+
+
+def make_policy(policy: SchedulingPolicy, queue_capacity: int) -> DispatchPolicy:
+    match policy:
+        case SchedulingPolicy.GREEDY:
+            return GreedyPolicy()
+        case SchedulingPolicy.SHORTEST_JOB_FIRST:
+            return ShortestJobFirstPolicy()
+        case SchedulingPolicy.MIN_COST_BATCH:
+            return MinCostBatchPolicy(queue_capacity)
@@ -0,0 +1,448 @@
+"""独立调度进程模块
+
+调度器运行在独立进程（manage.py run_scheduler）中，独占全部队列与定时器，保证单写者；
+Web 进程通过 Unix 套接字上的 JSON Lines 协议与其通信：
+
+- 命令：{"id": 1, "op": "end_request", "args": {...}}，响应：{"id": 1, "result": ...}
+  或 {"id": 1, "error": "OutOfSpace", "message": "..."}，同一连接上可连续发送多条命令而不等待响应
+- 快照：{"shard": 0, "version": 3, "epoch": 12345, "waiting_base": 2, "views": [...]}，连接建立时推送全部分片；
+  之后只推送变化的请求：{"shard": 0, "version": 5, "epoch": 12345, "waiting_base": 2, "base": 3, "views": [...],
+  "removed": [请求ID]}，客户端在版本为 base 的本地副本上应用，并由视图中的入队序号重建等候区的排名索引；
+  同一连接先推送命令产生的快照变化再返回响应，客户端收到响应时本地快照副本已包含该命令的修改
+
+客户端 RemoteScheduler 提供与 Scheduler 相同的接口，读取快照不经过套接字。
+"""
+import errno
+import itertools
+import json
+import os
+import socket
+import socketserver
+import threading
+import time
+
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from datetime import datetime
+from decimal import Decimal
+from logging import debug, warning
+from pathlib import Path
+from threading import Lock
+from typing import Any, Callable, Dict, Iterable, List
+
+from acss_app.models import PileType
+from acss_app.service import exceptions
+from acss_app.service.exceptions import MappingNotExisted, SchedulerUnavailable, ServiceError
+from acss_app.service.schd import (_EMPTY_SHARD_SNAPSHOT, RequestStatus, RequestView, Scheduler,
+                                   SchedulerSnapshot, StatusType, SubmitItem, _ShardSnapshot)
+from acss_app.service.timemock import get_boot_time, set_boot_time
+from acss_app.service.util.change_notifier import ChangeNotifier
+from acss_app.service.util.cow_map import EMPTY_COW_MAP
+from acss_app.service.util.rank_index import EMPTY_RANK_INDEX
+
+
+# 等待调度进程响应的最长时间（单位：秒）
+CALL_TIMEOUT = 10.0
+# 读取快照时发现连接断开，在后台重新连接的最短间隔（单位：秒）
+RECONNECT_INTERVAL = 1.0
+
+
+def _encode_view(view: RequestView) -> list:
+    status = view.status
+    return [view.request_id, view.username, status.status.value, status.position, status.pile_id,
+            str(view.amount), str(view.battery_capacity), view.create_time, view.waiting_seq]
+
+
+def _decode_view(row: list) -> RequestView:
+    request_id, username, status, position, pile_id, amount, battery_capacity, create_time, waiting_seq = row
+    return RequestView(request_id=request_id,
+                       username=username,
+                       status=RequestStatus(StatusType(status), position, pile_id),
+                       amount=Decimal(amount),
+                       battery_capacity=Decimal(battery_capacity),
+                       create_time=create_time,
+                       waiting_seq=waiting_seq)
+
+
+def _encode_shard(index: int, shard: _ShardSnapshot, base: _ShardSnapshot | None) -> Dict[str, Any]:
+    """编码分片；给出对方已有的版本 base 时只编码两个版本间变化的请求"""
+    message = {'shard': index, 'version': shard.version, 'epoch': shard.epoch, 'waiting_base': shard.waiting_base}
+    if base is None or base.epoch != shard.epoch:
+        message['views'] = [_encode_view(view) for view in shard.by_request_id.values()]
+        return message
+    changed, removed = shard.by_request_id.diff(base.by_request_id)
+    message['base'] = base.version
+    message['views'] = [_encode_view(shard.by_request_id[request_id]) for request_id in changed]
+    message['removed'] = removed
+    return message
+
+
+def _decode_shard(message: Dict[str, Any], current: _ShardSnapshot) -> _ShardSnapshot:
+    """由推送的分片消息得到新的本地副本，增量消息应用在 current 上"""
+    views = [_decode_view(row) for row in message['views']]
+    added_seqs = [view.waiting_seq for view in views if view.waiting_seq is not None]
+    if 'base' not in message:
+        return _ShardSnapshot(message['version'],
+                              EMPTY_COW_MAP.evolve({view.username: view for view in views}),
+                              EMPTY_COW_MAP.evolve({view.request_id: view for view in views}),
+                              message['epoch'],
+                              EMPTY_RANK_INDEX.update(added_seqs),
+                              message['waiting_base'])
+    if current.version != message['base'] or current.epoch != message['epoch']:
+        raise ValueError(f"增量快照的基准版本 {message['base']} 与本地副本 {current.version} 不符")
+    # 先删除结束的请求与变化请求的旧用户名与入队序号，再写入变化的请求（同一用户可能结束后重新提交）
+    stale_views = [current.by_request_id[request_id]
+                   for request_id in itertools.chain(message['removed'], (view.request_id for view in views))
+                   if request_id in current.by_request_id]
+    stale_seqs = [view.waiting_seq for view in stale_views if view.waiting_seq is not None]
+    return _ShardSnapshot(message['version'],
+                          current.by_username.evolve({view.username: view for view in views},
+                                                     [view.username for view in stale_views]),
+                          current.by_request_id.evolve({view.request_id: view for view in views}, message['removed']),
+                          message['epoch'],
+                          current.waiting_ranks.update(added_seqs, stale_seqs),
+                          message['waiting_base'])
+
+
+def _encode_item(item: SubmitItem) -> list:
+    return [item.request_mode.value, item.username, str(item.amount), str(item.battery_capacity), item.user_id]
+
+
+def _decode_item(row: list) -> SubmitItem:
+    request_mode, username, amount, battery_capacity, user_id = row
+    return SubmitItem(PileType(request_mode), username, Decimal(amount), Decimal(battery_capacity), user_id)
+
+
+def _encode_error(error: ServiceError | None) -> list | None:
+    return None if error is None else [type(error).__name__, str(error)]
+
+
+def _decode_error(encoded: list | None) -> ServiceError | None:
+    if encoded is None:
+        return None
+    name, message = encoded
+    error_type = getattr(exceptions, name, None)
+    if not (isinstance(error_type, type) and issubclass(error_type, ServiceError)):
+        error_type = ServiceError
+    return error_type(message)
+
+
+_COMMANDS: Dict[str, Callable[[Scheduler, Dict[str, Any]], Any]] = {
+    'submit_request': lambda s, args: s.submit_request(PileType(args['request_mode']),
+                                                       args['username'],
+                                                       Decimal(args['amount']),
+                                                       Decimal(args['battery_capacity']),
+                                                       args['requeue'],
+                                                       args['user_id']),
+    'submit_many': lambda s, args: [_encode_error(e) for e in s.submit_many(map(_decode_item, args['items']))],
+    'update_request': lambda s, args: s.update_request(args['request_id'],
+                                                       Decimal(args['amount']),
+                                                       PileType(args['request_type'])),
+    'end_request': lambda s, args: s.end_request(args['request_id']),
+    'brake': lambda s, args: s.brake(args['pile_id']),
+    'recover': lambda s, args: s.recover(args['pile_id']),
+    'get_request_id_by_username': lambda s, args: s.get_request_id_by_username(args['username']),
+}
+
+
+class _ConnectionHandler(socketserver.StreamRequestHandler):
+    """单个 Web 进程的连接，按顺序执行命令"""
+
+    server: 'SchedulerServer'
+
+    def setup(self) -> None:
+        super().setup()
+        self.__write_lock = Lock()
+        self.__sent_shards: List[_ShardSnapshot | None] = [None] * len(PileType)
+
+    def handle(self) -> None:
+        self.__write([{'hello': {'boot_datetime': get_boot_time().isoformat()}}])
+        self.server.add_connection(self)
+        self.sync_snapshot()
+        try:
+            for line in self.rfile:
+                message = json.loads(line)
+                response = self.__execute(message)
+                with self.__write_lock:
+                    self.__write(self.__collect_snapshot() + [response])
+        except (OSError, ValueError) as e:
+            debug("[scheduler] connection closed: %s", e)
+        finally:
+            self.server.remove_connection(self)
+
+    def __execute(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        command = _COMMANDS.get(message.get('op'))
+        if command is None:
+            return {'id': message.get('id'), 'error': 'ValueError', 'message': f"未知命令 {message.get('op')}"}
+        try:
+            return {'id': message['id'], 'result': command(self.server.scheduler, message['args'])}
+        except ServiceError as e:
+            return {'id': message['id'], 'error': type(e).__name__, 'message': str(e)}
+        except Exception as e:  # noqa: BLE001 返回给调用方，不中断连接
+            warning("[scheduler] command %s failed: %r", message.get('op'), e)
+            return {'id': message['id'], 'error': type(e).__name__, 'message': str(e)}
+
+    def __collect_snapshot(self) -> List[Dict[str, Any]]:
+        """收集自上次推送后变化的分片，首次推送全部请求，之后只推送变化的请求，调用方持有写锁"""
+        messages = []
+        for index, shard in enumerate(self.server.scheduler.get_snapshot().shards):
+            sent = self.__sent_shards[index]
+            if sent is not None and sent.version == shard.version:
+                continue
+            messages.append(_encode_shard(index, shard, sent))
+            self.__sent_shards[index] = shard
+        return messages
+
+    def sync_snapshot(self) -> None:
+        """推送变化的分片"""
+        with self.__write_lock:
+            messages = self.__collect_snapshot()
+            if len(messages) > 0:
+                self.__write(messages)
+
+    def __write(self, messages: List[Dict[str, Any]]) -> None:
+        data = ''.join(json.dumps(message) + '\n' for message in messages)
+        self.wfile.write(data.encode())
+
+
+class SchedulerServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """调度进程的 Unix 套接字服务，每个连接一个线程"""
+
+    daemon_threads = True
+
+    def __init__(self, scheduler: Scheduler, socket_path: str | Path) -> None:
+        self.scheduler = scheduler
+        self.__connections_lock = Lock()
+        self.__connections: List[_ConnectionHandler] = []
+        Path(socket_path).parent.mkdir(parents=True, exist_ok=True)
+        if os.path.exists(socket_path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(str(socket_path))
+            except OSError:
+                os.unlink(socket_path)  # 上次运行残留的套接字文件
+            else:
+                raise OSError(errno.EADDRINUSE, "已有调度进程在运行", str(socket_path))
+            finally:
+                probe.close()
+        super().__init__(str(socket_path), _ConnectionHandler)
+        threading.Thread(target=self.__broadcast_proc, daemon=True).start()
+
+    def add_connection(self, connection: _ConnectionHandler) -> None:
+        with self.__connections_lock:
+            self.__connections.append(connection)
+
+    def remove_connection(self, connection: _ConnectionHandler) -> None:
+        with self.__connections_lock:
+            if connection in self.__connections:
+                self.__connections.remove(connection)
+
+    def __broadcast_proc(self) -> None:
+        """向全部连接推送定时器等非命令引起的快照变化"""
+        version = -1
+        while True:
+            version = self.scheduler.wait_for_snapshot(version).version
+            with self.__connections_lock:
+                connections = list(self.__connections)
+            for connection in connections:
+                try:
+                    connection.sync_snapshot()
+                except OSError:
+                    pass
+
+    def server_close(self) -> None:
+        super().server_close()
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+
+
+class RemoteScheduler:
+    """调度进程的客户端，接口与 Scheduler 相同
+
+    进程内共享一条连接，多个线程的命令在连接上流水线发送。快照读取使用调度进程推送的本地副本，
+    不获取锁也不访问套接字；连接断开后在下次调用时重新连接。
+    """
+
+    def __init__(self, socket_path: str | Path, notifier: ChangeNotifier | None = None) -> None:
+        """
+        Args:
+            socket_path (str | Path): 调度进程的 Unix 套接字路径
+            notifier (ChangeNotifier | None, optional): 收到快照时通知的订阅者，连接多个调度进程时可共用一个
+        """
+        self.__socket_path = str(socket_path)
+        if notifier is None:
+            notifier = ChangeNotifier()
+        self.__notifier = notifier
+        self.__shards: List[_ShardSnapshot] = [_EMPTY_SHARD_SNAPSHOT] * len(PileType)
+        self.__connect_lock = Lock()
+        self.__write_lock = Lock()
+        self.__socket: socket.socket | None = None
+        self.__pending: Dict[int, Future] = {}
+        self.__next_id = 0
+        self.__reconnect_lock = Lock()
+        self.__reconnecting = False
+        self.__last_reconnect = float('-inf')
+        self.__reconnect_in_background()
+
+    def __ensure_connected(self) -> socket.socket:
+        sock = self.__socket
+        if sock is not None:
+            return sock
+        with self.__connect_lock:
+            if self.__socket is not None:
+                return self.__socket
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.connect(self.__socket_path)
+            except OSError as e:
+                sock.close()
+                raise SchedulerUnavailable("调度服务不可用") from e
+            reader = sock.makefile('rb')
+            # 连接建立时调度进程依次发送 hello 与全部分片
+            self.__handle(json.loads(reader.readline()))
+            for _ in range(len(PileType)):
+                self.__handle(json.loads(reader.readline()))
+            self.__socket = sock
+            threading.Thread(target=self.__read_proc, args=(sock, reader), daemon=True).start()
+            debug("[scheduler] connected to %s", self.__socket_path)
+            return sock
+
+    def __reconnect_in_background(self) -> None:
+        """在后台线程中连接调度进程，读取快照的调用方（可能是事件循环）不等待连接"""
+        with self.__reconnect_lock:
+            now = time.monotonic()
+            if self.__reconnecting or now - self.__last_reconnect < RECONNECT_INTERVAL:
+                return
+            self.__reconnecting = True
+            self.__last_reconnect = now
+        threading.Thread(target=self.__reconnect_proc, daemon=True).start()
+
+    def __reconnect_proc(self) -> None:
+        try:
+            self.__ensure_connected()
+        except SchedulerUnavailable as e:
+            debug("[scheduler] %s, using stale snapshot.", e)
+        finally:
+            with self.__reconnect_lock:
+                self.__reconnecting = False
+
+    def __read_proc(self, sock: socket.socket, reader) -> None:
+        try:
+            for line in reader:
+                self.__handle(json.loads(line))
+        except (OSError, ValueError) as e:
+            debug("[scheduler] connection lost: %s", e)
+        with self.__write_lock:
+            if self.__socket is sock:
+                self.__socket = None
+            pending = self.__pending
+            self.__pending = {}
+        sock.close()
+        for future in pending.values():
+            future.set_exception(SchedulerUnavailable("调度服务连接已断开"))
+
+    def __handle(self, message: Dict[str, Any]) -> None:
+        if 'shard' in message:
+            index = message['shard']
+            self.__shards[index] = _decode_shard(message, self.__shards[index])
+            self.__notifier.notify(self)
+        elif 'id' in message:
+            with self.__write_lock:
+                future = self.__pending.pop(message['id'], None)
+            if future is None:
+                return
+            if 'error' in message:
+                error_type = getattr(exceptions, message['error'], None)
+                if not (isinstance(error_type, type) and issubclass(error_type, ServiceError)):
+                    error_type = SchedulerUnavailable
+                future.set_exception(error_type(message['message']))
+            else:
+                future.set_result(message.get('result'))
+        elif 'hello' in message:
+            hello = message['hello']
+            set_boot_time(datetime.fromisoformat(hello['boot_datetime']))
+
+    def __call(self, op: str, **args) -> Any:
+        sock = self.__ensure_connected()
+        future = Future()
+        with self.__write_lock:
+            call_id = self.__next_id
+            self.__next_id += 1
+            self.__pending[call_id] = future
+            try:
+                sock.sendall((json.dumps({'id': call_id, 'op': op, 'args': args}) + '\n').encode())
+            except OSError as e:
+                self.__pending.pop(call_id, None)
+                raise SchedulerUnavailable("调度服务连接已断开") from e
+        try:
+            return future.result(CALL_TIMEOUT)
+        except FutureTimeoutError as e:
+            raise SchedulerUnavailable("调度服务响应超时") from e
+
+    def submit_request(self, request_mode: PileType,
+                       username: str,
+                       amount: Decimal,
+                       battery_capacity: Decimal,
+                       requeue: bool = False,
+                       user_id: int | None = None,
+                       station_id: int | None = None) -> None:
+        """见 Scheduler.submit_request，调度进程只运行一个调度域，忽略 station_id"""
+        self.__call('submit_request', request_mode=request_mode.value, username=username,
+                    amount=str(amount), battery_capacity=str(battery_capacity),
+                    requeue=requeue, user_id=user_id)
+
+    def submit_many(self, items: Iterable[SubmitItem]) -> List[ServiceError | None]:
+        results = self.__call('submit_many', items=[_encode_item(item) for item in items])
+        return [_decode_error(encoded) for encoded in results]
+
+    def update_request(self, request_id: int, amount: Decimal, request_type: PileType) -> None:
+        self.__call('update_request', request_id=request_id, amount=str(amount), request_type=request_type.value)
+
+    def end_request(self, request_id: int) -> None:
+        self.__call('end_request', request_id=request_id)
+
+    def brake(self, pile_id: int) -> None:
+        self.__call('brake', pile_id=pile_id)
+
+    def recover(self, pile_id: int) -> None:
+        self.__call('recover', pile_id=pile_id)
+
+    def get_request_id_by_username(self, username: str) -> int:
+        """由调度进程查询，不使用本地快照副本，保证看到其他 Web 进程刚提交的请求"""
+        return self.__call('get_request_id_by_username', username=username)
+
+    def get_snapshot(self) -> SchedulerSnapshot:
+        """获取本地快照副本，不访问套接字
+
+        连接断开时在后台重新连接，连接建立前返回断开前的副本（首次连接前为空快照）。
+        """
+        if self.__socket is None:
+            self.__reconnect_in_background()
+        return SchedulerSnapshot(tuple(self.__shards))
+
+    def wait_for_snapshot(self, version: int, timeout: float | None = None) -> SchedulerSnapshot:
+        """见 Scheduler.wait_for_snapshot"""
+        generation = self.__notifier.generation
+        snapshot = self.get_snapshot()
+        if snapshot.version == version:
+            self.__notifier.wait(generation, timeout)
+            snapshot = self.get_snapshot()
+        return snapshot
+
+    async def wait_for_snapshot_async(self, version: int, timeout: float | None = None) -> SchedulerSnapshot:
+        """见 Scheduler.wait_for_snapshot_async"""
+        generation = self.__notifier.generation
+        snapshot = self.get_snapshot()
+        if snapshot.version == version:
+            await self.__notifier.wait_async(generation, timeout)
+            snapshot = self.get_snapshot()
+        return snapshot
+
+    def get_request_status(self, request_id: int) -> RequestStatus:
+        view = self.get_snapshot().find_by_request_id(request_id)
+        if view is None:
+            raise MappingNotExisted("充电请求不存在")
+        return view.status
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        return self.get_snapshot().to_rows()
+
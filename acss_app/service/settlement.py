@@ -0,0 +1,249 @@
+"""结算模块"""
+import atexit
+import json
+import os
+import threading
+
+from collections import deque
+from datetime import datetime
+from decimal import Decimal
+from logging import debug, exception, warning
+from pathlib import Path
+from threading import Condition
+from typing import Callable, Deque, List
+
+from django.conf import settings
+from django.db import InterfaceError, OperationalError
+
+from acss_app.models import Order, PileType
+from acss_app.service.charge import Settlement, create_orders
+
+
+def _dump_settlement(settlement: Settlement) -> str:
+    return json.dumps({
+        'request_type': int(settlement.request_type),
+        'pile_id': settlement.pile_id,
+        'username': settlement.username,
+        'amount': str(settlement.amount),
+        'begin_time': settlement.begin_time.isoformat(),
+        'end_time': settlement.end_time.isoformat(),
+        'create_time': settlement.create_time.isoformat(),
+        'user_id': settlement.user_id
+    })
+
+
+def _load_settlement(line: str) -> Settlement:
+    record = json.loads(line)
+    return Settlement(request_type=PileType(record['request_type']),
+                      pile_id=record['pile_id'],
+                      username=record['username'],
+                      amount=Decimal(record['amount']),
+                      begin_time=datetime.fromisoformat(record['begin_time']),
+                      end_time=datetime.fromisoformat(record['end_time']),
+                      create_time=datetime.fromisoformat(record['create_time']),
+                      user_id=record.get('user_id'))
+
+
+def _is_settled(settlement: Settlement) -> bool:
+    """结算记录是否已生成详单"""
+    return Order.objects.filter(pile_id=settlement.pile_id,
+                                user__username=settlement.username,
+                                begin_time=settlement.begin_time,
+                                end_time=settlement.end_time).exists()
+
+
+class SettlementWriter:
+    """结算写入器
+
+    调度器在锁内调用 submit 提交结算记录，只追加到内存队列与 spool 文件；
+    后台线程每次取出队首至多 batch_size 条记录交给 sink 写入数据库，写入成功后才从队列中移除。
+    写入期间新提交的记录在队列中累积，负载越高批次越大。
+
+    spool 文件每行一条结算记录，提交时追加写入（不 fsync，进程崩溃不丢失），
+    写入成功后在队列为空或文件过长时按队列内容重写。启动时从 spool 恢复记录，已生成详单的记录会被跳过。
+
+    数据库不可用（OperationalError、InterfaceError）时整批等待重试；其他错误说明批次中有无法写入的记录，
+    逐条重新写入，仍然失败的记录记录错误日志并移入隔离文件（spool 文件名加 .quarantine 后缀），不再阻塞后续记录。
+    """
+
+    RETRY_INTERVAL = 1.0  # 写入失败后的重试间隔（单位：秒）
+
+    def __init__(self, spool_path: str | Path | None = None,
+                 batch_size: int = 256,
+                 sink: Callable[[List[Settlement]], int] = create_orders) -> None:
+        """
+        Args:
+            spool_path (str | Path | None, optional): spool 文件路径，为 None 时不落盘
+            batch_size (int, optional): 单批写入的最大记录数
+            sink (Callable[[List[Settlement]], int], optional): 批量写入函数，默认生成详单
+        """
+        self.__spool_path = None if spool_path is None else Path(spool_path)
+        self.__quarantine_path = None if spool_path is None else Path(f'{spool_path}.quarantine')
+        self.__batch_size = batch_size
+        self.__sink = sink
+        self.__cond = Condition()
+        self.__queue: Deque[Settlement] = deque()
+        self.__spool = None
+        self.__spool_lines = 0  # spool 文件中的记录数
+        self.__thread: threading.Thread | None = None
+        self.__closing = False
+
+    def __len__(self) -> int:
+        return len(self.__queue)
+
+    def start(self) -> None:
+        """恢复 spool 中未写入的记录并启动写入线程"""
+        if self.__spool_path is not None:
+            self.__spool_path.parent.mkdir(parents=True, exist_ok=True)
+            pending = self.__recover_spool()
+            self.__queue.extend(pending)
+            self.__rewrite_spool()
+        self.__thread = threading.Thread(target=self.__write_proc, daemon=True)
+        self.__thread.start()
+
+    def submit(self, settlement: Settlement) -> None:
+        """提交结算记录"""
+        with self.__cond:
+            self.__queue.append(settlement)
+            if self.__spool is not None:
+                self.__spool.write(_dump_settlement(settlement) + '\n')
+                self.__spool.flush()
+                self.__spool_lines += 1
+            self.__cond.notify_all()
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """等待已提交的记录全部写入
+
+        Returns:
+            bool: 超时前是否全部写入
+        """
+        with self.__cond:
+            return self.__cond.wait_for(lambda: len(self.__queue) == 0, timeout)
+
+    def close(self, timeout: float | None = None) -> None:
+        """写入剩余记录后停止写入线程，写入失败的记录留在 spool 中"""
+        with self.__cond:
+            self.__closing = True
+            self.__cond.notify_all()
+        if self.__thread is not None:
+            self.__thread.join(timeout)
+        with self.__cond:
+            if self.__spool is not None:
+                self.__spool.close()
+                self.__spool = None
+            if len(self.__queue) > 0:
+                warning("[settlement] %d settlements left unwritten.", len(self.__queue))
+
+    def __write_proc(self) -> None:
+        while True:
+            with self.__cond:
+                self.__cond.wait_for(lambda: len(self.__queue) > 0 or self.__closing)
+                if len(self.__queue) == 0:
+                    return
+                batch = [self.__queue[i] for i in range(min(self.__batch_size, len(self.__queue)))]
+            try:
+                self.__sink(batch)
+            except (OperationalError, InterfaceError):
+                exception("[settlement] failed to write %d settlements.", len(batch))
+                if not self.__wait_retry():
+                    return
+                continue
+            except Exception:
+                exception("[settlement] failed to write %d settlements, retrying one by one.", len(batch))
+                if not self.__write_one_by_one(batch) and not self.__wait_retry():
+                    return
+                continue
+            self.__remove_written(len(batch))
+
+    def __wait_retry(self) -> bool:
+        """等待重试间隔，正在关闭时返回 False"""
+        with self.__cond:
+            if self.__closing:
+                return False
+            self.__cond.wait(SettlementWriter.RETRY_INTERVAL)
+        return True
+
+    def __write_one_by_one(self, batch: List[Settlement]) -> bool:
+        """逐条写入批次中的记录，无法写入的记录移入隔离文件；数据库不可用时返回 False，剩余记录留在队首"""
+        for settlement in batch:
+            try:
+                self.__sink([settlement])
+            except (OperationalError, InterfaceError):
+                exception("[settlement] failed to write settlement.")
+                return False
+            except Exception:
+                self.__quarantine(settlement)
+            self.__remove_written(1)
+        return True
+
+    def __quarantine(self, settlement: Settlement) -> None:
+        line = _dump_settlement(settlement)
+        exception("[settlement] settlement quarantined: %s", line)
+        if self.__quarantine_path is None:
+            return
+        try:
+            with open(self.__quarantine_path, 'a', encoding='utf-8') as quarantine:
+                quarantine.write(line + '\n')
+        except OSError:
+            exception("[settlement] failed to write quarantine file %s.", self.__quarantine_path)
+
+    def __remove_written(self, count: int) -> None:
+        """从队首移除已写入（或已隔离）的记录"""
+        with self.__cond:
+            for _ in range(count):
+                self.__queue.popleft()
+            if self.__spool is not None and (
+                    len(self.__queue) == 0 or self.__spool_lines > 2 * len(self.__queue) + self.__batch_size):
+                self.__rewrite_spool()
+            self.__cond.notify_all()
+
+    def __recover_spool(self) -> List[Settlement]:
+        if not self.__spool_path.exists():
+            return []
+        pending = []
+        with open(self.__spool_path, encoding='utf-8') as spool:
+            for line in spool:
+                try:
+                    settlement = _load_settlement(line)
+                except (ValueError, KeyError):
+                    # 进程崩溃时最后一行可能不完整
+                    warning("[settlement] malformed spool line skipped: %r", line)
+                    continue
+                if not _is_settled(settlement):
+                    pending.append(settlement)
+        debug("[settlement] %d settlements recovered from spool.", len(pending))
+        return pending
+
+    def __rewrite_spool(self) -> None:
+        """按队列内容重写 spool 文件"""
+        if self.__spool is not None:
+            self.__spool.close()
+        temp_path = self.__spool_path.with_name(self.__spool_path.name + '.tmp')
+        with open(temp_path, 'w', encoding='utf-8') as spool:
+            spool.writelines(_dump_settlement(settlement) + '\n' for settlement in self.__queue)
+        os.replace(temp_path, self.__spool_path)
+        self.__spool = open(self.__spool_path, 'a', encoding='utf-8')
+        self.__spool_lines = len(self.__queue)
+
+
+settlement_writer: SettlementWriter | None = None
+
+
+def submit_settlement(settlement: Settlement) -> None:
+    """提交结算记录，结算模块未初始化时同步生成详单"""
+    if settlement_writer is None:
+        create_orders([settlement])
+        return
+    settlement_writer.submit(settlement)
+
+
+def on_init() -> None:
+    """结算模块初始化
+
+    spool 文件路径由 settings.SETTLEMENT_SPOOL_PATH 指定，进程正常退出时写入全部剩余记录。
+    """
+    global settlement_writer
+
+    settlement_writer = SettlementWriter(spool_path=getattr(settings, 'SETTLEMENT_SPOOL_PATH', None))
+    settlement_writer.start()
+    atexit.register(settlement_writer.close)
@@ -1,34 +1,115 @@
 """简单查询服务"""
-from datetime import date
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import date, datetime, time, timedelta
 from decimal import Decimal
-from typing import Any, Dict, List
+from typing import Any, Dict, Iterator, List, Tuple
 
+from django.db.models import Q
 from django.db.models.query import QuerySet
-from django.db.models import Sum
 from django.core.exceptions import ObjectDoesNotExist
 
-from acss_app.models import Order, Pile, PileStatus
-from acss_app.service.exceptions import PileDoesNotExisted
+from acss_app.models import Order, Pile, PileStatus, RollupPeriod
+from acss_app.service.exceptions import IllegalCursor, PileDoesNotExisted
+from acss_app.service.identity import get_identity
+from acss_app.service.rollup import get_earnings, get_period_starts
+from acss_app.service.timemock import get_datetime_now
+
+
+ORDER_PAGE_MAX_LIMIT = 1000
+
+__ORDER_FIELDS = ('order_id', 'create_time', 'charged_amount', 'charged_time', 'begin_time',
+                  'end_time', 'charging_cost', 'service_cost', 'total_cost', 'pile_id')
+
+
+def __format_order(row: Tuple) -> Dict[str, Any]:
+    order_id, create_time, charged_amount, charged_time, begin_time, \
+        end_time, charging_cost, service_cost, total_cost, pile_id = row
+    return {
+        'order_id': str(order_id),
+        'create_time': str(create_time),
+        'charged_amount': charged_amount,
+        'charged_time': charged_time,
+        'begin_time': str(begin_time),
+        'end_time': str(end_time),
+        'charging_cost': charging_cost,
+        'service_cost': service_cost,
+        'total_cost': total_cost,
+        'pile_id': str(pile_id)
+    }
+
+
+def encode_order_cursor(order_info: Dict[str, Any]) -> str:
+    """以详单的 (create_time, order_id) 生成游标，下一页从该详单之后开始"""
+    key = f"{order_info['create_time']}|{order_info['order_id']}"
+    return urlsafe_b64encode(key.encode()).decode()
+
+
+def __decode_order_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        create_time, order_id = urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(create_time), int(order_id)
+    except ValueError as e:
+        raise IllegalCursor("游标非法") from e
+
+
+class OrderPage:
+    """一页详单
+
+    逐条迭代详单，迭代结束后若还有下一页，next_cursor 为下一页的游标。
+    """
+
+    def __init__(self, orders: Iterator[Dict[str, Any]], limit: int | None) -> None:
+        self.__orders = orders
+        self.__limit = limit
+        self.next_cursor: str | None = None
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        order_info = None
+        for index, next_order_info in enumerate(self.__orders):
+            if index == self.__limit:
+                self.next_cursor = encode_order_cursor(order_info)
+                return
+            order_info = next_order_info
+            yield order_info
+
+
+def query_orders(username: str,
+                 begin_date: date = None,
+                 end_date: date = None,
+                 cursor: str = None,
+                 limit: int = None) -> OrderPage:
+    """按 (create_time, order_id) 升序分页查询用户详单
+
+    用户编号从用户身份缓存解析，使用 (user, create_time) 索引按游标定位，
+    只读取需要的列，迭代时逐批从数据库读取（不能在事件循环内迭代）。
+
+    Args:
+        username (str): 用户名
+        begin_date (date, optional): 详单生成日期下限（包含）
+        end_date (date, optional): 详单生成日期上限（包含）
+        cursor (str, optional): 上一页的 next_cursor，为空时从第一条开始
+        limit (int, optional): 每页数量，为空时不分页
+    """
+    identity = get_identity(username)
+    if identity is None:
+        return OrderPage(iter(()), limit)
+    orders: QuerySet[Order] = Order.objects.filter(user_id=identity.user_id)
+    if begin_date is not None:
+        orders = orders.filter(create_time__gte=datetime.combine(begin_date, time.min))
+    if end_date is not None:
+        orders = orders.filter(create_time__lt=datetime.combine(end_date + timedelta(days=1), time.min))
+    if cursor is not None:
+        create_time, order_id = __decode_order_cursor(cursor)
+        orders = orders.filter(Q(create_time__gt=create_time) | Q(create_time=create_time, order_id__gt=order_id))
+    rows = orders.order_by('create_time', 'order_id').values_list(*__ORDER_FIELDS)
+    if limit is not None:
+        # 多取一条判断是否还有下一页
+        rows = rows[:limit + 1]
+    return OrderPage((__format_order(row) for row in rows.iterator(chunk_size=500)), limit)
 
 
 def get_all_orders(username: str) -> List[Dict[str, Any]]:
-    order_list = []
-    orders: QuerySet[Order] = Order.objects.filter(user__username=username)
-    for order in orders:
-        order_info = {
-            'order_id': str(order.order_id),
-            'create_time': str(order.create_time),
-            'charged_amount': order.charged_amount,
-            'charged_time': order.charged_time,
-            'begin_time': str(order.begin_time),
-            'end_time': str(order.end_time),
-            'charging_cost': order.charging_cost,
-            'service_cost': order.service_cost,
-            'total_cost': order.total_cost,
-            'pile_id': str(order.pile_id)
-        }
-        order_list.append(order_info)
-    return order_list
+    return list(query_orders(username))
 
 
 def get_all_piles_status() -> List[Dict[str, Any]]:
@@ -66,22 +147,24 @@ def update_pile_status(pile_id: int, status: PileStatus) -> None:
 
 
 def query_report() -> List[Dict[str, Any]]:
+    """查询报表
+
+    收入读取收入汇总表，查询次数与详单数量无关。
+    """
     status_list = []
-    # 使用聚集函数时decimal会损失保留几位小数的信息
-    piles: QuerySet[Pile] = Pile.objects\
-        .annotate(cumulative_charging_earning=Sum('order__charging_cost'),
-                  cumulative_service_earning=Sum('order__service_cost'),
-                  cumulative_earning=Sum('order__total_cost'))
+    period_starts = get_period_starts(get_datetime_now().date())
+    earnings = {period: get_earnings(period, period_start)
+                for period, period_start in period_starts.items()}
+    piles: QuerySet[Pile] = Pile.objects.all()
     for pile in piles:
         cumulative_charging_earning = Decimal('0.00')
-        cumulative_service_earning =  Decimal('0.00')
+        cumulative_service_earning = Decimal('0.00')
         cumulative_earning = Decimal('0.00')
-        if pile.cumulative_charging_earning is not None:
-            cumulative_charging_earning = pile.cumulative_charging_earning.quantize(Decimal('0.00'))
-        if pile.cumulative_service_earning is not None:
-            cumulative_service_earning = pile.cumulative_service_earning.quantize(Decimal('0.00'))
-        if pile.cumulative_earning is not None:
-            cumulative_earning = pile.cumulative_earning.quantize(Decimal('0.00'))
+        rollup = earnings[RollupPeriod.ALL].get(pile.pile_id)
+        if rollup is not None:
+            cumulative_charging_earning = rollup.charging_earning.quantize(Decimal('0.00'))
+            cumulative_service_earning = rollup.service_earning.quantize(Decimal('0.00'))
+            cumulative_earning = rollup.total_earning.quantize(Decimal('0.00'))
         pile_status = {
             'pile_id': str(pile.pile_id),
             'day': (date.today() - pile.register_time).days,
@@ -94,5 +177,10 @@ def query_report() -> List[Dict[str, Any]]:
             'cumulative_service_earning': cumulative_service_earning,
             'cumulative_earning': cumulative_earning
         }
+        for period, key in ((RollupPeriod.DAY, 'daily_earning'),
+                            (RollupPeriod.WEEK, 'weekly_earning'),
+                            (RollupPeriod.MONTH, 'monthly_earning')):
+            rollup = earnings[period].get(pile.pile_id)
+            pile_status[key] = Decimal('0.00') if rollup is None else rollup.total_earning.quantize(Decimal('0.00'))
         status_list.append(pile_status)
     return status_list
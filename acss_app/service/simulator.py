@@ -0,0 +1,243 @@
+"""离散事件模拟模块
+
+以虚拟时钟驱动调度器，重放充电请求的事件序列（trace），不启动检查线程也不等待真实时间。
+事件序列为 JSON Lines 格式，每行一个事件，t 为自模拟开始的秒数：
+
+- {"t": 0.0, "op": "submit", "user": "u1", "mode": "F", "amount": "15.00", "battery": "60.00"}
+- {"t": 60.0, "op": "edit", "user": "u1", "mode": "T", "amount": "20.00"}
+- {"t": 90.0, "op": "cancel", "user": "u1"}
+- {"t": 120.0, "op": "brake", "pile": 3}
+- {"t": 600.0, "op": "recover", "pile": 3}
+"""
+import json
+import random
+import time
+
+from dataclasses import dataclass
+from datetime import datetime
+from decimal import Decimal
+from logging import debug
+from pathlib import Path
+from typing import Any, Dict, Iterable, List
+
+from acss_app.models import Pile, PileType
+from acss_app.service.charge import Settlement
+from acss_app.service.exceptions import ServiceError
+from acss_app.service.schd import FAST_CHARGE_PILE_POWER, NORMAL_PILE_POWER, Scheduler
+from acss_app.service.schd_policy import DEFAULT_SCHEDULING_POLICY, SchedulingPolicy
+from acss_app.service.timemock import US_PER_SECOND, VirtualClock, set_clock, to_us
+
+
+SIMULATION_EPOCH = datetime(2022, 6, 1, 6)  # 虚拟时钟的起点
+
+
+@dataclass
+class SimulationReport:
+    """模拟结果
+
+    等待时间为提交（或修改充电模式后重新排队）到开始充电的时长，只统计充满结束的请求；
+    充电桩利用率为充满结束的请求的充电时长之和占全部充电桩可用时长的比例。
+    """
+    policy: SchedulingPolicy
+    pile_cnt: int
+    event_cnt: int  # 事件序列中的事件数
+    completed_cnt: int  # 充满结束的请求数
+    interrupted_cnt: int  # 充电中被取消或因故障结束的请求数
+    rejected_cnt: int  # 调度器拒绝的事件数（等候区已满、修改已进入充电区的请求等）
+    simulated_hours: float
+    throughput: float  # 每小时充满结束的请求数
+    mean_wait_minutes: float
+    p95_wait_minutes: float
+    utilization: float
+    wall_seconds: float
+    wall_us_per_event: float  # 每个事件（含完成事件）的真实耗时
+
+    def format(self) -> str:
+        return (f'{self.policy.value:>7}{self.pile_cnt:>7}{self.event_cnt:>8}{self.completed_cnt:>8}{self.rejected_cnt:>8}'
+                f'{self.simulated_hours:>8.1f}{self.throughput:>10.1f}{self.mean_wait_minutes:>9.1f}'
+                f'{self.p95_wait_minutes:>9.1f}{self.utilization:>7.0%}{self.wall_seconds:>9.2f}'
+                f'{self.wall_us_per_event:>10.0f}')
+
+    @staticmethod
+    def header() -> str:
+        return (f"{'policy':>7}{'piles':>7}{'events':>8}{'done':>8}{'reject':>8}{'hours':>8}{'done/h':>10}"
+                f"{'wait':>9}{'p95':>9}{'util':>7}{'wall(s)':>9}{'us/event':>10}")
+
+
+def make_piles(pile_cnt: int) -> List[Pile]:
+    """构造不入库的充电桩，五分之二为快充桩"""
+    fast_cnt = max(1, pile_cnt * 2 // 5)
+    return [Pile(pile_id=i + 1, pile_type=PileType.FAST_CHARGE if i < fast_cnt else PileType.CHARGE)
+            for i in range(pile_cnt)]
+
+
+def _get_power(pile_type: PileType) -> float:
+    return FAST_CHARGE_PILE_POWER if pile_type == PileType.FAST_CHARGE else NORMAL_PILE_POWER
+
+
+def generate_workload(pile_cnt: int, event_cnt: int, seed: int = 0,
+                      load: float = 0.85,
+                      edit_ratio: float = 0.1,
+                      cancel_ratio: float = 0.1,
+                      fault_ratio: float = 0.01) -> List[Dict[str, Any]]:
+    """生成合成事件序列
+
+    到达为泊松过程，两种充电模式的到达率按充电桩数与平均充电时长设置，使充电桩负载约为 load；
+    充电量在 5 到 50 度之间均匀分布。部分请求在提交后修改或取消，部分到达伴随一次充电桩故障与恢复。
+
+    Args:
+        pile_cnt (int): 充电桩数，与 make_piles 一致
+        event_cnt (int): 事件数（近似）
+        seed (int, optional): 随机种子，相同参数生成相同的序列
+    """
+    rand = random.Random(seed)
+    piles = make_piles(pile_cnt)
+    pile_ids = {pile_type: [pile.pile_id for pile in piles if pile.pile_type == pile_type] for pile_type in PileType}
+    mean_amount = 27.5
+    rates = {pile_type: load * len(pile_ids[pile_type]) / (mean_amount / _get_power(pile_type) * 3600)
+             for pile_type in PileType}
+    total_rate = sum(rates.values())
+    fast_share = rates[PileType.FAST_CHARGE] / total_rate
+    arrival_cnt = round(event_cnt / (1 + edit_ratio + cancel_ratio + 2 * fault_ratio))
+
+    events: List[Dict[str, Any]] = []
+    broken_until: Dict[int, float] = {}
+    t = 0.0
+    for i in range(arrival_cnt):
+        t += rand.expovariate(total_rate)
+        pile_type = PileType.FAST_CHARGE if rand.random() < fast_share else PileType.CHARGE
+        user = f'u{i}'
+        amount = rand.uniform(5, 50)
+        events.append({'t': t, 'op': 'submit', 'user': user, 'mode': 'F' if pile_type == PileType.FAST_CHARGE else 'T',
+                       'amount': f'{amount:.2f}', 'battery': f'{amount + rand.uniform(10, 60):.2f}'})
+        if rand.random() < edit_ratio:
+            events.append({'t': t + rand.uniform(10, 600), 'op': 'edit', 'user': user,
+                           'mode': rand.choice('FT'), 'amount': f'{rand.uniform(5, 50):.2f}'})
+        if rand.random() < cancel_ratio:
+            events.append({'t': t + rand.uniform(60, 3600), 'op': 'cancel', 'user': user})
+        if rand.random() < fault_ratio:
+            pile_id = rand.randrange(pile_cnt) + 1
+            if broken_until.get(pile_id, -1.0) < t:
+                recover_time = t + rand.uniform(600, 3600)
+                broken_until[pile_id] = recover_time
+                events.append({'t': t, 'op': 'brake', 'pile': pile_id})
+                events.append({'t': recover_time, 'op': 'recover', 'pile': pile_id})
+    events.sort(key=lambda event: event['t'])
+    return events
+
+
+def load_trace(path: str | Path) -> List[Dict[str, Any]]:
+    with open(path, encoding='utf-8') as file:
+        events = [json.loads(line) for line in file if line.strip()]
+    events.sort(key=lambda event: event['t'])
+    return events
+
+
+def dump_trace(events: Iterable[Dict[str, Any]], path: str | Path) -> None:
+    with open(path, 'w', encoding='utf-8') as file:
+        file.writelines(json.dumps(event) + '\n' for event in events)
+
+
+class Simulator:
+    """离散事件模拟器
+
+    模拟期间以虚拟时钟替换 timemock 的全局时钟。每一步取下一个事件与最早完成时刻中较早者，
+    将虚拟时钟推进到该时刻后执行；事件序列结束后继续推进，直至全部请求结束。
+    """
+
+    def __init__(self, piles: List[Pile], policy: SchedulingPolicy = DEFAULT_SCHEDULING_POLICY) -> None:
+        self.__piles = piles
+        self.__policy = policy
+        self.__epoch_us = to_us(SIMULATION_EPOCH)
+        self.__clock = VirtualClock(self.__epoch_us)
+        self.__completing = False
+        self.__waits: List[float] = []
+        self.__charging_seconds = 0.0
+        self.__interrupted_cnt = 0
+
+    def __on_settle(self, settlement: Settlement) -> None:
+        if not self.__completing:
+            self.__interrupted_cnt += 1
+            return
+        duration = float(settlement.amount) / _get_power(settlement.request_type) * 3600
+        self.__charging_seconds += duration
+        self.__waits.append((settlement.end_time - settlement.begin_time).total_seconds() - duration)
+
+    def run(self, events: List[Dict[str, Any]]) -> SimulationReport:
+        previous_clock = set_clock(self.__clock)
+        try:
+            scheduler = Scheduler(self.__piles, on_settle=self.__on_settle, run_checker=False, policy=self.__policy)
+            begin = time.perf_counter()
+            rejected_cnt, step_cnt = self.__replay(scheduler, events)
+            wall_seconds = time.perf_counter() - begin
+        finally:
+            set_clock(previous_clock)
+
+        simulated_seconds = max((self.__clock.now_us() - self.__epoch_us) / US_PER_SECOND, 1.0)
+        waits = sorted(self.__waits)
+        return SimulationReport(
+            policy=self.__policy,
+            pile_cnt=len(self.__piles),
+            event_cnt=len(events),
+            completed_cnt=len(waits),
+            interrupted_cnt=self.__interrupted_cnt,
+            rejected_cnt=rejected_cnt,
+            simulated_hours=simulated_seconds / 3600,
+            throughput=len(waits) / simulated_seconds * 3600,
+            mean_wait_minutes=sum(waits) / len(waits) / 60 if len(waits) > 0 else 0.0,
+            p95_wait_minutes=waits[int(len(waits) * 0.95)] / 60 if len(waits) > 0 else 0.0,
+            utilization=self.__charging_seconds / (simulated_seconds * len(self.__piles)),
+            wall_seconds=wall_seconds,
+            wall_us_per_event=wall_seconds / max(step_cnt, 1) * 1e6)
+
+    def __replay(self, scheduler: Scheduler, events: List[Dict[str, Any]]) -> tuple:
+        rejected_cnt = 0
+        step_cnt = 0
+        index = 0
+        while True:
+            deadline = scheduler.get_next_deadline()
+            event_time = None
+            if index < len(events):
+                event_time = self.__epoch_us + round(events[index]['t'] * US_PER_SECOND)
+            if deadline is None and event_time is None:
+                break
+            if deadline is not None and (event_time is None or deadline <= event_time):
+                self.__clock.advance_to(deadline)
+                self.__completing = True
+                step_cnt += scheduler.complete_due_requests()
+                self.__completing = False
+                continue
+            self.__clock.advance_to(event_time)
+            try:
+                self.__apply(scheduler, events[index])
+            except ServiceError as e:
+                debug("[simulator] event %r rejected: %s", events[index], e)
+                rejected_cnt += 1
+            index += 1
+            step_cnt += 1
+        return rejected_cnt, step_cnt
+
+    @staticmethod
+    def __apply(scheduler: Scheduler, event: Dict[str, Any]) -> None:
+        match event['op']:
+            case 'submit':
+                scheduler.submit_request(PileType.FAST_CHARGE if event['mode'] == 'F' else PileType.CHARGE,
+                                         event['user'], Decimal(event['amount']), Decimal(event['battery']))
+            case 'edit':
+                scheduler.update_request(scheduler.get_request_id_by_username(event['user']),
+                                         Decimal(event['amount']),
+                                         PileType.FAST_CHARGE if event['mode'] == 'F' else PileType.CHARGE)
+            case 'cancel':
+                scheduler.end_request(scheduler.get_request_id_by_username(event['user']))
+            case 'brake':
+                scheduler.brake(event['pile'])
+            case 'recover':
+                scheduler.recover(event['pile'])
+            case op:
+                raise ValueError(f"未知事件 {op}")
+
+
+def simulate(pile_cnt: int, events: List[Dict[str, Any]],
+             policy: SchedulingPolicy = DEFAULT_SCHEDULING_POLICY) -> SimulationReport:
+    """以 make_piles(pile_cnt) 构造的充电桩与指定的调度策略重放事件序列"""
+    return Simulator(make_piles(pile_cnt), policy).run(events)
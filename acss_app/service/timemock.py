@@ -1,31 +1,147 @@
-"""时间mock模块"""
+"""时间mock模块
+
+模拟时间由时钟（Clock）提供，以自 Unix 纪元起的微秒数（整数）表示。
+加速时钟与真实时钟按单调时钟推进，不受系统时间调整影响；虚拟时钟只在被显式推进时变化。
+调度器内部只做整数运算，仅在接口与持久化边界通过 from_us / to_us 与 datetime 转换。
+"""
 import time
 
+from abc import ABC, abstractmethod
 from datetime import datetime
 
 
 FAST_FORWARD_RATE = 60
 
-__boot_datetime = datetime.now()
-__boot_timestamp = round(time.time())
+US_PER_SECOND = 1_000_000
+
+
+def from_us(us: int) -> datetime:
+    """将模拟时刻（微秒）转换为本地时间的 datetime"""
+    # 浮点数在当前时间范围内的精度远小于 1 微秒，舍入后得到准确的微秒数
+    return datetime.fromtimestamp(us / US_PER_SECOND)
+
+
+def to_us(value: datetime) -> int:
+    """将本地时间的 datetime 转换为模拟时刻（微秒）"""
+    return round(value.replace(microsecond=0).timestamp()) * US_PER_SECOND + value.microsecond
+
+
+class Clock(ABC):
+    """时钟接口"""
+
+    def __init__(self, boot_us: int) -> None:
+        self._boot_us = boot_us
+
+    @abstractmethod
+    def now_us(self) -> int:
+        """当前模拟时刻（微秒）"""
+
+    @abstractmethod
+    def to_real_seconds(self, delta_us: int) -> float:
+        """将模拟时间间隔（微秒）换算为真实时间秒数"""
+
+    def now(self) -> datetime:
+        return from_us(self.now_us())
+
+    def timestamp(self) -> int:
+        return self.now_us() // US_PER_SECOND
+
+    def get_boot_us(self) -> int:
+        return self._boot_us
+
+    def set_boot_us(self, boot_us: int) -> None:
+        self._boot_us = boot_us
+
+
+class FastForwardClock(Clock):
+    """按真实时间加速的时钟
+
+    以启动时的系统时间为起点，此后按单调时钟流逝时长的 rate 倍前进。
+    """
+
+    def __init__(self, rate: int = FAST_FORWARD_RATE) -> None:
+        super().__init__(time.time_ns() // 1000)
+        self.rate = rate
+        # 锚点 (模拟时刻, 单调时钟读数)，整体替换以免读到不一致的一对值
+        self.__anchor = (self._boot_us, time.monotonic_ns())
+
+    def now_us(self) -> int:
+        anchor_us, anchor_ns = self.__anchor
+        return anchor_us + (time.monotonic_ns() - anchor_ns) * self.rate // 1000
+
+    def to_real_seconds(self, delta_us: int) -> float:
+        return delta_us / (self.rate * US_PER_SECOND)
+
+    def set_boot_us(self, boot_us: int) -> None:
+        """使用其他进程的启动时刻：按系统时间计算一次当前模拟时刻并重新锚定"""
+        super().set_boot_us(boot_us)
+        wall_us = time.time_ns() // 1000
+        self.__anchor = (boot_us + (wall_us - boot_us) * self.rate, time.monotonic_ns())
+
+
+class RealClock(FastForwardClock):
+    """不加速的真实时钟"""
+
+    def __init__(self) -> None:
+        super().__init__(rate=1)
+
+
+class VirtualClock(Clock):
+    """虚拟时钟，只在调用 advance_to 时变化，用于离散事件模拟"""
+
+    def __init__(self, now_us: int) -> None:
+        super().__init__(now_us)
+        self.__now_us = now_us
+
+    def now_us(self) -> int:
+        return self.__now_us
+
+    def advance_to(self, now_us: int) -> None:
+        self.__now_us = now_us
+
+    def to_real_seconds(self, delta_us: int) -> float:
+        return delta_us / US_PER_SECOND
+
+
+__clock: Clock = FastForwardClock()
+
+
+def get_clock() -> Clock:
+    return __clock
+
+
+def set_clock(clock: Clock) -> Clock:
+    """替换全局时钟
+
+    Returns:
+        Clock: 原先的时钟，用于恢复
+    """
+    global __clock
+    previous = __clock
+    __clock = clock
+    return previous
+
+
+def now_us() -> int:
+    return __clock.now_us()
 
 
 def reset_time() -> None:
-    global __boot_datetime
-    global __boot_timestamp
-    __boot_datetime = datetime.now()
-    __boot_timestamp = round(time.time())
+    set_clock(FastForwardClock())
+
+
+def get_boot_time() -> datetime:
+    return from_us(__clock.get_boot_us())
+
+
+def set_boot_time(boot_datetime: datetime) -> None:
+    """使用其他进程的启动时间，使多个进程的模拟时间一致"""
+    __clock.set_boot_us(to_us(boot_datetime))
 
 
 def get_timestamp_now() -> int:
-    real_timestamp = round(time.time())
-    delta = real_timestamp - __boot_timestamp
-    mocked_timestamp = __boot_timestamp + delta * FAST_FORWARD_RATE
-    return mocked_timestamp
+    return __clock.timestamp()
 
 
 def get_datetime_now() -> datetime:
-    real_datetime = datetime.now()
-    delta = real_datetime - __boot_datetime
-    mocked_datetime = __boot_datetime + delta * FAST_FORWARD_RATE
-    return mocked_datetime
+    return __clock.now()
@@ -0,0 +1,67 @@
+"""变化通知"""
+import asyncio
+
+from threading import Condition
+from typing import Any, Callable, Dict, List
+
+
+def _resolve(futures: List[asyncio.Future], generation: int) -> None:
+    for future in futures:
+        if not future.done():
+            future.set_result(generation)
+
+
+class ChangeNotifier:
+    """变化通知
+
+    每次 notify 使代数加一，并唤醒等待代数变化的线程与 asyncio 协程。
+    同一事件循环上的全部等待协程只通过一次 call_soon_threadsafe 唤醒，
+    notify 的开销与等待者数量无关（除事件循环数量外）。
+    监听函数在 notify 的调用线程中执行，参数为 notify 的 source（发布快照的调度器）。
+    """
+
+    def __init__(self) -> None:
+        self.__cond = Condition()
+        self.__generation = 0
+        self.__futures: Dict[asyncio.AbstractEventLoop, List[asyncio.Future]] = {}
+        self.__listeners: List[Callable[[Any], None]] = []
+
+    @property
+    def generation(self) -> int:
+        return self.__generation
+
+    def add_listener(self, listener: Callable[[Any], None]) -> None:
+        """添加监听函数，监听函数不能阻塞，也不能获取调度锁"""
+        self.__listeners.append(listener)
+
+    def notify(self, source: Any = None) -> None:
+        for listener in self.__listeners:
+            listener(source)
+        with self.__cond:
+            self.__generation += 1
+            generation = self.__generation
+            self.__cond.notify_all()
+            futures = self.__futures
+            self.__futures = {}
+        for loop, loop_futures in futures.items():
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(_resolve, loop_futures, generation)
+
+    def wait(self, generation: int, timeout: float | None = None) -> int:
+        """阻塞等待代数不同于 generation，返回当前代数，超时时可能与 generation 相同"""
+        with self.__cond:
+            self.__cond.wait_for(lambda: self.__generation != generation, timeout)
+            return self.__generation
+
+    async def wait_async(self, generation: int, timeout: float | None = None) -> int:
+        """wait 的协程版本，不阻塞事件循环"""
+        loop = asyncio.get_running_loop()
+        with self.__cond:
+            if self.__generation != generation:
+                return self.__generation
+            future = loop.create_future()
+            self.__futures.setdefault(loop, []).append(future)
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            return self.__generation
@@ -0,0 +1,97 @@
+"""写时复制映射"""
+from typing import Any, Dict, Hashable, Iterable, Iterator, List, Mapping, Tuple
+
+
+COW_MAP_BUCKET_BITS = 8
+
+__BUCKET_SHIFT = 64 - COW_MAP_BUCKET_BITS
+__MULTIPLIER = 0x9E3779B97F4A7C15  # 2^64 / 黄金分割比
+__MASK = (1 << 64) - 1
+
+
+def _bucket_of(key: Hashable) -> int:
+    # 请求ID可能按固定步长分配（各充电站的ID同余），先乘法散列再取高位
+    return ((hash(key) * __MULTIPLIER) & __MASK) >> __BUCKET_SHIFT
+
+
+class CowMap(Mapping):
+    """不可变映射，修改时只复制受影响的桶
+
+    键按散列值分到 2^COW_MAP_BUCKET_BITS 个桶中，evolve 复制桶列表与被修改的桶，
+    未修改的桶在新旧版本之间共享，修改少量键的开销约为 桶数 + 修改的键数 * 桶大小。
+    两个版本的差异只需比较不同的桶，见 diff。
+    """
+
+    __slots__ = ('__buckets', '__len')
+
+    def __init__(self, buckets: Tuple[Dict[Any, Any], ...] | None = None, length: int = 0) -> None:
+        if buckets is None:
+            buckets = (_EMPTY_BUCKET,) * (1 << COW_MAP_BUCKET_BITS)
+        self.__buckets = buckets
+        self.__len = length
+
+    def __getitem__(self, key: Hashable) -> Any:
+        return self.__buckets[_bucket_of(key)][key]
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        return self.__buckets[_bucket_of(key)].get(key, default)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.__buckets[_bucket_of(key)]
+
+    def __iter__(self) -> Iterator[Any]:
+        for bucket in self.__buckets:
+            yield from bucket
+
+    def __len__(self) -> int:
+        return self.__len
+
+    def values(self) -> Iterator[Any]:
+        for bucket in self.__buckets:
+            yield from bucket.values()
+
+    def items(self) -> Iterator[Tuple[Any, Any]]:
+        for bucket in self.__buckets:
+            yield from bucket.items()
+
+    def evolve(self, updates: Mapping[Hashable, Any], removes: Iterable[Hashable] = ()) -> 'CowMap':
+        """返回先删除 removes 中的键、再写入 updates 后的新映射，当前映射不变"""
+        buckets = list(self.__buckets)
+        copied = set()
+        length = self.__len
+        for key in removes:
+            index = _bucket_of(key)
+            if key not in buckets[index]:
+                continue
+            if index not in copied:
+                buckets[index] = dict(buckets[index])
+                copied.add(index)
+            del buckets[index][key]
+            length -= 1
+        for key, value in updates.items():
+            index = _bucket_of(key)
+            if index not in copied:
+                buckets[index] = dict(buckets[index])
+                copied.add(index)
+            if key not in buckets[index]:
+                length += 1
+            buckets[index][key] = value
+        return CowMap(tuple(buckets), length)
+
+    def diff(self, old: 'CowMap') -> Tuple[List[Any], List[Any]]:
+        """与旧版本比较，返回 (新增或值变化的键, 删除的键)，只遍历两个版本间不共享的桶"""
+        changed = []
+        removed = []
+        for bucket, old_bucket in zip(self.__buckets, old.__buckets):
+            if bucket is old_bucket:
+                continue
+            for key, value in bucket.items():
+                if key not in old_bucket or old_bucket[key] != value:
+                    changed.append(key)
+            removed.extend(key for key in old_bucket if key not in bucket)
+        return changed, removed
+
+
+_EMPTY_BUCKET: Dict[Any, Any] = {}
+
+EMPTY_COW_MAP = CowMap()
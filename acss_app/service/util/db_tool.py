@@ -0,0 +1,18 @@
+"""数据库工具箱"""
+from typing import Any
+
+from django.conf import settings
+from django.db.backends.base.base import BaseDatabaseWrapper
+
+
+def apply_sqlite_pragmas(sender: Any, connection: BaseDatabaseWrapper, **kwargs) -> None:
+    """新建 SQLite 连接时执行 settings.SQLITE_PRAGMAS 中的 PRAGMA 设置
+
+    作为 connection_created 信号的接收函数注册。
+    """
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = getattr(settings, 'SQLITE_PRAGMAS', {})
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value};')
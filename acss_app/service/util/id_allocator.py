@@ -0,0 +1,128 @@
+"""请求ID分配器"""
+from collections import deque
+from logging import warning
+from threading import Lock
+from typing import Deque, List, Tuple
+
+from acss_app.service.exceptions import OutOfRecycleResource
+
+
+class RequestIdAllocator:
+    """请求ID分配器
+
+    空闲编号保存在先进先出的空闲队列中，分配与释放均为 O(1)；释放的编号排到队尾，
+    尽量推迟复用。空闲队列为空时编号空间翻倍扩容，直至 max_capacity（为 None 时不设上限）。
+
+    启用世代标记时，请求ID = (世代 << SLOT_BITS) | 编号，编号每次释放后世代加一，
+    已结束请求的ID不会与之后分配的ID相同，释放过期的ID不会影响新请求。
+
+    多个调度域各自分配请求ID时，请求ID = 上述编码 * stride + offset，各调度域的ID互不相同，
+    由 ID 除以 stride 的余数即可确定所在调度域。
+    """
+
+    SLOT_BITS = 20  # 启用世代标记时编号所占的位数，编号空间不超过 2 ** SLOT_BITS
+
+    def __init__(self, capacity: int = 1000, max_capacity: int | None = None,
+                 generation_tagged: bool = False, stride: int = 1, offset: int = 0) -> None:
+        """
+        Args:
+            capacity (int, optional): 初始编号空间大小
+            max_capacity (int | None, optional): 编号空间上限，为 None 时按需扩容
+            generation_tagged (bool, optional): 是否在请求ID中附加世代标记
+            stride (int, optional): 划分请求ID空间的调度域数量上限
+            offset (int, optional): 本调度域的编号，0 <= offset < stride
+        """
+        self.__lock = Lock()
+        self.__stride = stride
+        self.__offset = offset
+        self.__max_capacity = max_capacity
+        self.__generation_tagged = generation_tagged
+        if generation_tagged:
+            limit = 1 << RequestIdAllocator.SLOT_BITS
+            self.__max_capacity = limit if max_capacity is None else min(max_capacity, limit)
+        self.__capacity = 0
+        self.__free: Deque[int] = deque()
+        self.__in_use = bytearray()
+        self.__generations: List[int] = []
+        self.__used = 0
+        self.__extend(capacity)
+
+    @property
+    def capacity(self) -> int:
+        return self.__capacity
+
+    def __len__(self) -> int:
+        """已分配的请求ID数量"""
+        return self.__used
+
+    def alloc(self) -> int:
+        with self.__lock:
+            free = self.__free
+            in_use = self.__in_use
+            while True:
+                if not free:
+                    self.__grow()
+                slot = free.popleft()
+                # 恢复时登记的编号可能仍在空闲队列中，出队时跳过
+                if not in_use[slot]:
+                    break
+            in_use[slot] = 1
+            self.__used += 1
+            request_id = slot
+            if self.__generation_tagged:
+                request_id |= self.__generations[slot] << RequestIdAllocator.SLOT_BITS
+            return request_id * self.__stride + self.__offset
+
+    def dealloc(self, request_id: int) -> None:
+        with self.__lock:
+            slot, generation = self.__decode(request_id)
+            in_use = self.__in_use
+            if slot < 0 or slot >= self.__capacity or not in_use[slot] or \
+                    (self.__generation_tagged and generation != self.__generations[slot]):
+                warning("[scheduler] stale request id %d released.", request_id)
+                return
+            in_use[slot] = 0
+            self.__used -= 1
+            if self.__generation_tagged:
+                self.__generations[slot] += 1
+            self.__free.append(slot)
+
+    def reserve(self, request_id: int) -> None:
+        """标记请求ID已被使用（从日志恢复请求时）"""
+        with self.__lock:
+            slot, generation = self.__decode(request_id)
+            if slot < 0:
+                warning("[scheduler] request id %d does not belong to this allocator.", request_id)
+                return
+            if slot >= self.__capacity:
+                # 恢复的请求必须保留原ID，不受编号空间上限限制
+                self.__extend(slot + 1 - self.__capacity)
+            if not self.__in_use[slot]:
+                self.__in_use[slot] = 1
+                self.__used += 1
+            if self.__generation_tagged:
+                self.__generations[slot] = generation
+
+    def __decode(self, request_id: int) -> Tuple[int, int]:
+        """返回 (编号, 世代)，不属于本调度域的ID返回的编号为 -1"""
+        request_id, remainder = divmod(request_id - self.__offset, self.__stride)
+        if remainder != 0 or request_id < 0:
+            return -1, 0
+        if self.__generation_tagged:
+            bits = RequestIdAllocator.SLOT_BITS
+            return request_id & ((1 << bits) - 1), request_id >> bits
+        return request_id, 0
+
+    def __grow(self) -> None:
+        new_capacity = max(self.__capacity * 2, 1)
+        if self.__max_capacity is not None:
+            new_capacity = min(new_capacity, self.__max_capacity)
+        if new_capacity <= self.__capacity:
+            raise OutOfRecycleResource("充电标识已用尽")
+        self.__extend(new_capacity - self.__capacity)
+
+    def __extend(self, count: int) -> None:
+        self.__free.extend(range(self.__capacity, self.__capacity + count))
+        self.__in_use.extend(bytes(count))
+        self.__generations.extend([0] * count)
+        self.__capacity += count
@@ -1,13 +1,38 @@
 """JWT工具箱"""
+import asyncio
 import functools
+import heapq
+import threading
+import time
+import uuid
 
+from collections import OrderedDict
 from enum import Enum
-from typing import Callable
+from logging import debug, exception
+from threading import Lock
+from typing import Callable, Dict, List, Tuple
 
-from jwt import encode, decode, DecodeError
+from jwt import encode, decode, ExpiredSignatureError, InvalidTokenError, MissingRequiredClaimError
 from django.http import HttpRequest, JsonResponse
 
 from acss_app.controller.util.resp_tool import RetCode
+from acss_app.models import RevokedToken
+
+
+# JWT 有效期（单位：秒）
+TOKEN_TTL = 7 * 24 * 3600
+# 验证结果缓存的最长有效期（单位：秒），不超过 JWT 本身的过期时间
+TOKEN_CACHE_TTL = 300
+TOKEN_CACHE_SIZE = 4096
+# 读取其他进程吊销记录的间隔（单位：秒）
+REVOCATION_SYNC_INTERVAL = 1.0
+# 删除数据库中已过期吊销记录的间隔（单位：秒），只由运行调度器的进程执行
+REVOCATION_PURGE_INTERVAL = 3600.0
+# 推送连接票据的有效期（单位：秒）
+STREAM_TICKET_TTL = 30
+
+# 推送连接票据使用单独的密钥签名，票据不能作为 JWT 使用
+__STREAM_TICKET_KEY = 'top-secret:stream-ticket'
 
 
 class Role(Enum):
@@ -16,48 +41,276 @@ class Role(Enum):
 
 
 class RequestContext:
-    def __init__(self, username: str, role: Role) -> None:
+    """请求上下文，验证通过的 JWT 会缓存其上下文并在多个请求间共享，不应修改"""
+
+    def __init__(self, username: str, role: Role, token: str = None, expire_time: float = None,
+                 token_id: str = None) -> None:
         self.username = username
         self.role = role
+        self.token = token
+        self.expire_time = expire_time  # JWT 过期时间戳
+        self.token_id = token_id  # JWT编号（jti）
+
+
+class RevokedTokenError(InvalidTokenError):
+    pass
+
+
+class TokenCache:
+    """JWT 验证结果缓存
+
+    LRU 淘汰，条目在 TOKEN_CACHE_TTL 秒或 JWT 过期后失效。
+    同时按 JWT编号记录已吊销的 JWT，吊销记录按过期时间放入小根堆，JWT 过期后移除；
+    缓存命中时检查吊销记录，其他进程吊销的 JWT 同步到本进程后立即失效。
+    """
+
+    def __init__(self, max_size: int = TOKEN_CACHE_SIZE, ttl: float = TOKEN_CACHE_TTL) -> None:
+        self.__max_size = max_size
+        self.__ttl = ttl
+        self.__lock = Lock()
+        self.__entries: OrderedDict[str, Tuple[RequestContext, float]] = OrderedDict()  # JWT -> (上下文, 失效时间戳)
+        self.__revoked: Dict[str, float] = {}  # JWT编号 -> 过期时间戳
+        self.__revoked_heap: List[Tuple[float, str]] = []  # (过期时间戳, JWT编号)
+
+    def get(self, token: str) -> RequestContext | None:
+        with self.__lock:
+            entry = self.__entries.get(token)
+            if entry is None:
+                return None
+            context, invalid_time = entry
+            if invalid_time <= time.time() or context.token_id in self.__revoked:
+                del self.__entries[token]
+                return None
+            self.__entries.move_to_end(token)
+            return context
+
+    def put(self, context: RequestContext) -> None:
+        invalid_time = min(time.time() + self.__ttl, context.expire_time)
+        with self.__lock:
+            if context.token_id in self.__revoked:
+                return
+            self.__entries[context.token] = (context, invalid_time)
+            self.__entries.move_to_end(context.token)
+            if len(self.__entries) > self.__max_size:
+                self.__entries.popitem(last=False)
+
+    def revoke(self, token_id: str, expire_time: float) -> None:
+        with self.__lock:
+            self.__purge_revoked(time.time())
+            if token_id in self.__revoked:
+                return
+            self.__revoked[token_id] = expire_time
+            heapq.heappush(self.__revoked_heap, (expire_time, token_id))
+
+    def purge_revoked(self) -> None:
+        """移除已过期 JWT 的吊销记录"""
+        with self.__lock:
+            self.__purge_revoked(time.time())
+
+    def __purge_revoked(self, now: float) -> None:
+        heap = self.__revoked_heap
+        while len(heap) > 0 and heap[0][0] <= now:
+            _, token_id = heapq.heappop(heap)
+            del self.__revoked[token_id]
+
+    def is_revoked(self, token_id: str) -> bool:
+        return token_id in self.__revoked
+
+    def revoked_count(self) -> int:
+        return len(self.__revoked)
+
+
+token_cache = TokenCache()
 
 
 def gen_token(username: str, role: str) -> str:
+    issued_at = int(time.time())
     payload = {
         'username': username,
-        'role': role
+        'role': role,
+        'iat': issued_at,
+        'exp': issued_at + TOKEN_TTL,
+        'jti': uuid.uuid4().hex
     }
     token = encode(payload, 'top-secret', algorithm='HS256')
     return token
 
 
+def verify_token(token: str, use_cache: bool = True) -> RequestContext:
+    """验证 JWT 并返回请求上下文
+
+    Raises:
+        ExpiredSignatureError: JWT 已过期
+        MissingRequiredClaimError: 旧版 JWT 没有过期时间或编号
+        RevokedTokenError: JWT 已吊销
+        InvalidTokenError: JWT 损坏
+    """
+    if use_cache:
+        context = token_cache.get(token)
+        if context is not None:
+            return context
+    # 不再接受没有过期时间的旧版 JWT，否则其吊销记录永远不能删除
+    payload = decode(token, 'top-secret', algorithms=['HS256'], options={'require': ['exp', 'jti']})
+    if token_cache.is_revoked(payload['jti']):
+        raise RevokedTokenError("JWT已吊销")
+    context = RequestContext(payload['username'], Role[payload['role']], token, payload['exp'], payload['jti'])
+    if use_cache:
+        token_cache.put(context)
+    return context
+
+
+def revoke_token(context: RequestContext) -> None:
+    """吊销 JWT，直到其过期前都不能再使用
+
+    吊销记录写入数据库，当前进程立即生效，其他进程在 REVOCATION_SYNC_INTERVAL 秒内同步后生效，重启后仍然有效。
+    """
+    RevokedToken.objects.get_or_create(jti=context.token_id, defaults={'expire_time': context.expire_time})
+    token_cache.revoke(context.token_id, context.expire_time)
+
+
+__last_revoke_id = 0
+
+
+def sync_revocations() -> None:
+    """读取数据库中新增的吊销记录，只读查询，不获取数据库写锁"""
+    global __last_revoke_id
+
+    rows = RevokedToken.objects.filter(revoke_id__gt=__last_revoke_id, expire_time__gt=time.time()) \
+        .order_by('revoke_id').values_list('revoke_id', 'jti', 'expire_time')
+    for revoke_id, token_id, expire_time in rows:
+        token_cache.revoke(token_id, expire_time)
+        __last_revoke_id = revoke_id
+    token_cache.purge_revoked()
+
+
+def purge_expired_revocations() -> int:
+    """删除数据库中已过期的吊销记录
+
+    Returns:
+        int: 删除的记录数
+    """
+    deleted_cnt, _ = RevokedToken.objects.filter(expire_time__lte=time.time()).delete()
+    debug("[auth] %d expired revocations purged.", deleted_cnt)
+    return deleted_cnt
+
+
+def __sync_proc(purge: bool) -> None:
+    last_purge_time = time.monotonic()
+    while True:
+        time.sleep(REVOCATION_SYNC_INTERVAL)
+        try:
+            sync_revocations()
+        except Exception:
+            exception("[auth] failed to sync revoked tokens.")
+        if purge and time.monotonic() - last_purge_time >= REVOCATION_PURGE_INTERVAL:
+            last_purge_time = time.monotonic()
+            try:
+                purge_expired_revocations()
+            except Exception:
+                exception("[auth] failed to purge expired revocations.")
+
+
+def on_init(purge: bool = False) -> None:
+    """JWT 模块初始化，读取全部未过期的吊销记录并定期同步其他进程的吊销
+
+    Args:
+        purge (bool, optional): 是否由本进程每隔 REVOCATION_PURGE_INTERVAL 秒删除已过期的吊销记录，
+            多个进程共用数据库时只应由一个进程（运行调度器的进程）执行
+    """
+    if purge:
+        purge_expired_revocations()
+    sync_revocations()
+    debug("[auth] %d revoked tokens loaded.", token_cache.revoked_count())
+    threading.Thread(target=__sync_proc, args=(purge,), daemon=True).start()
+
+
+def authenticate(token: str | None, limited_role: Role | None,
+                 use_cache: bool = True) -> RequestContext | str:
+    """验证 JWT（可带 Bearer 前缀），成功时返回请求上下文，失败时返回错误信息"""
+    if token is None:
+        return '需要登录'
+    try:
+        token = token.removeprefix('Bearer ')
+        context = verify_token(token, use_cache)
+    except (ExpiredSignatureError, MissingRequiredClaimError):
+        return '登录已过期'
+    except RevokedTokenError:
+        return '已退出登录'
+    except (InvalidTokenError, KeyError):
+        return 'JWT损坏'
+    if limited_role is not None and context.role != limited_role:
+        return '无权限'
+    return context
+
+
+def gen_stream_ticket(context: RequestContext) -> str:
+    """签发推送连接票据，EventSource 不能设置请求头，以查询参数传递票据代替 JWT
+
+    票据在 STREAM_TICKET_TTL 秒内（不超过 JWT 的过期时间）可用于建立推送连接，签发票据的 JWT 被吊销后随之失效。
+    """
+    payload = {
+        'username': context.username,
+        'role': context.role.name,
+        'exp': min(int(time.time()) + STREAM_TICKET_TTL, int(context.expire_time)),
+        'sid': context.token_id  # 签发票据的 JWT编号
+    }
+    return encode(payload, __STREAM_TICKET_KEY, algorithm='HS256')
+
+
+def authenticate_stream_ticket(ticket: str, limited_role: Role | None) -> RequestContext | str:
+    """验证推送连接票据，成功时返回请求上下文，失败时返回错误信息"""
+    try:
+        payload = decode(ticket, __STREAM_TICKET_KEY, algorithms=['HS256'], options={'require': ['exp', 'sid']})
+        context = RequestContext(payload['username'], Role[payload['role']], None, payload['exp'], payload['sid'])
+    except ExpiredSignatureError:
+        return '推送票据已过期'
+    except (InvalidTokenError, KeyError):
+        return '推送票据无效'
+    if token_cache.is_revoked(context.token_id):
+        return '已退出登录'
+    if limited_role is not None and context.role != limited_role:
+        return '无权限'
+    return context
+
+
+def __authenticate(request: HttpRequest, limited_role: Role | None,
+                   use_cache: bool) -> RequestContext | JsonResponse:
+    """验证请求的 JWT，成功时返回请求上下文，失败时返回错误响应"""
+    context = authenticate(request.META.get('HTTP_AUTHORIZATION'), limited_role, use_cache)
+    if isinstance(context, str):
+        return JsonResponse({
+            'code': RetCode.FAIL.value,
+            'message': context
+        })
+    return context
+
+
 def preprocess_token(
-    limited_role: Role
+    limited_role: Role | None,
+    use_cache: bool = True
 ) -> Callable:
+    """
+    支持同步与异步（async def）请求处理函数，JWT 验证不访问数据库，异步视图中直接在事件循环内执行。
+
+    Args:
+        limited_role (Role | None): 允许访问的角色，为 None 时允许全部角色
+        use_cache (bool, optional): 是否使用 JWT 验证结果缓存
+    """
     def decorator(request_handler: Callable[[RequestContext, HttpRequest], JsonResponse]):
+        if asyncio.iscoroutinefunction(request_handler):
+            @functools.wraps(request_handler)
+            async def async_wrapper(request: HttpRequest):
+                context = __authenticate(request, limited_role, use_cache)
+                if isinstance(context, JsonResponse):
+                    return context
+                return await request_handler(context, request)
+            return async_wrapper
+
         @functools.wraps(request_handler)
         def wrapper(request: HttpRequest):
-            token: str = request.META.get('HTTP_AUTHORIZATION')
-            if token is None:
-                return JsonResponse({
-                    'code': RetCode.FAIL.value,
-                    'message': '需要登录'
-                })
-            try:
-                token = token.removeprefix('Bearer ')
-                payload = decode(token, 'top-secret', algorithms=['HS256'])
-            except DecodeError:
-                return JsonResponse({
-                    'code': RetCode.FAIL.value,
-                    'message': 'JWT损坏'
-                })
-            username = payload['username']
-            role = Role[payload['role']]
-            if role != limited_role:
-                return JsonResponse({
-                    'code': RetCode.FAIL.value,
-                    'message': '无权限'
-                })
-            context = RequestContext(username, role)
+            context = __authenticate(request, limited_role, use_cache)
+            if isinstance(context, JsonResponse):
+                return context
             response: JsonResponse = request_handler(context, request)
             return response
         return wrapper
@@ -0,0 +1,59 @@
+"""充电桩索引"""
+from heapq import heapify, heappop, heappush
+from typing import Dict, List, Tuple
+
+
+class SparePileIndex:
+    """空闲充电桩索引
+
+    以 (预计排队时长, 充电桩编号) 为键的小根堆，只包含未故障且队列未满的充电桩。
+    更新时压入新键，旧键在查询时延迟删除，查询与更新均为 O(log P)（均摊）。
+    """
+
+    def __init__(self) -> None:
+        self.__heap: List[Tuple[float, int]] = []
+        self.__keys: Dict[int, Tuple[float, int]] = {}  # 充电桩编号 -> 当前键
+
+    def __len__(self) -> int:
+        return len(self.__keys)
+
+    def update(self, pile_id: int, cost: float | None) -> None:
+        """更新充电桩的预计排队时长
+
+        Args:
+            pile_id (int): 充电桩编号
+            cost (float | None): 预计排队时长（单位：秒），为 None 时表示充电桩不再空闲
+        """
+        if cost is None:
+            self.__keys.pop(pile_id, None)
+            return
+        key = (cost, pile_id)
+        if self.__keys.get(pile_id) == key:
+            return
+        self.__keys[pile_id] = key
+        heappush(self.__heap, key)
+        if len(self.__heap) > 2 * len(self.__keys) + 16:
+            self.__heap = list(self.__keys.values())
+            heapify(self.__heap)
+
+    def smallest(self, count: int) -> List[Tuple[float, int]]:
+        """按键从小到大查询至多 count 个空闲充电桩，返回 (预计排队时长, 充电桩编号)"""
+        keys: List[Tuple[float, int]] = []
+        seen = set()
+        while len(keys) < count and len(self.__heap) > 0:
+            key = heappop(self.__heap)
+            if self.__keys.get(key[1]) == key and key[1] not in seen:
+                keys.append(key)
+                seen.add(key[1])
+        for key in keys:
+            heappush(self.__heap, key)
+        return keys
+
+    def first(self) -> int | None:
+        """查询预计排队时长最短的空闲充电桩，时长相同时取编号最小者"""
+        while len(self.__heap) > 0:
+            key = self.__heap[0]
+            if self.__keys.get(key[1]) == key:
+                return key[1]
+            heappop(self.__heap)
+        return None
@@ -0,0 +1,96 @@
+"""持久化排名索引"""
+from typing import Iterable, Tuple
+
+
+# 节点为 (元素数, 左子树, 右子树)，空子树为 None，叶节点的子树均为 None
+_Node = Tuple[int, '_Node | None', '_Node | None']
+
+
+def _update(node: _Node | None, height: int, value: int, delta: int) -> _Node | None:
+    """返回将 value 的计数加 delta 后的子树，只复制从该节点到叶的路径"""
+    count, left, right = node if node is not None else (0, None, None)
+    if height > 0:
+        height -= 1
+        if value >> height & 1:
+            right = _update(right, height, value, delta)
+        else:
+            left = _update(left, height, value, delta)
+    count += delta
+    return None if count == 0 else (count, left, right)
+
+
+class RankIndex:
+    """不可变的非负整数集合，支持查询小于给定值的元素个数
+
+    以计数线段树存储 [0, 2^height) 内的整数，add 与 discard 只复制从根到叶的一条路径，
+    新旧版本共享其余节点，可直接放入快照；插入、删除与排名查询均为 O(height)。
+    值超出范围时在根上方加层，height 约为 log2(最大值)。
+    """
+
+    __slots__ = ('__root', '__height')
+
+    def __init__(self, root: _Node | None = None, height: int = 0) -> None:
+        self.__root = root
+        self.__height = height
+
+    def __len__(self) -> int:
+        return 0 if self.__root is None else self.__root[0]
+
+    def __contains__(self, value: int) -> bool:
+        if value < 0 or value >> self.__height:
+            return False
+        node = self.__root
+        height = self.__height
+        while node is not None and height > 0:
+            height -= 1
+            node = node[2] if value >> height & 1 else node[1]
+        return node is not None
+
+    def add(self, value: int) -> 'RankIndex':
+        """返回加入 value 后的新索引，value 已存在时返回自身"""
+        if value in self:
+            return self
+        root = self.__root
+        height = self.__height
+        while value >> height:
+            if root is not None:
+                root = (root[0], root, None)
+            height += 1
+        return RankIndex(_update(root, height, value, 1), height)
+
+    def discard(self, value: int) -> 'RankIndex':
+        """返回删除 value 后的新索引，value 不存在时返回自身"""
+        if value not in self:
+            return self
+        return RankIndex(_update(self.__root, self.__height, value, -1), self.__height)
+
+    def update(self, added: Iterable[int] = (), discarded: Iterable[int] = ()) -> 'RankIndex':
+        """返回先删除 discarded、再加入 added 后的新索引"""
+        index = self
+        for value in discarded:
+            index = index.discard(value)
+        for value in added:
+            index = index.add(value)
+        return index
+
+    def rank(self, value: int) -> int:
+        """小于 value 的元素个数"""
+        if value <= 0:
+            return 0
+        if value >> self.__height:
+            return len(self)
+        rank = 0
+        node = self.__root
+        height = self.__height
+        while node is not None and height > 0:
+            height -= 1
+            if value >> height & 1:
+                if node[1] is not None:
+                    rank += node[1][0]
+                node = node[2]
+            else:
+                node = node[1]
+        return rank
+
+
+EMPTY_RANK_INDEX = RankIndex()
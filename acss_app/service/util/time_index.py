@@ -0,0 +1,63 @@
+"""按时间排序的请求索引"""
+from heapq import heapify, heappop, heappush
+from typing import Any, Dict, Iterator, List, Tuple
+
+
+class TimeOrderedIndex:
+    """按元素大小排序的索引，充电请求按 (创建时刻, 请求ID) 排序
+
+    以请求ID为键，元素存放在小根堆中，插入与取出最小元素为 O(log n)（均摊）。
+    删除时只从字典移除，堆中的条目在出堆时丢弃，失效条目过多时重建堆。
+    """
+
+    def __init__(self) -> None:
+        self.__heap: List[Tuple[Any, int]] = []
+        self.__items: Dict[int, Any] = {}
+
+    def __len__(self) -> int:
+        return len(self.__items)
+
+    def __contains__(self, key: int) -> bool:
+        return key in self.__items
+
+    def __iter__(self) -> Iterator[Any]:
+        """按从小到大的顺序遍历，O(n log n)"""
+        return iter(sorted(self.__items.values()))
+
+    def push(self, key: int, item: Any) -> None:
+        if self.__items.get(key) is item:
+            return
+        self.__items[key] = item
+        heappush(self.__heap, (item, key))
+
+    def discard(self, key: int) -> None:
+        if self.__items.pop(key, None) is None:
+            return
+        if len(self.__heap) > 2 * len(self.__items) + 16:
+            self.__heap = [(item, key) for key, item in self.__items.items()]
+            heapify(self.__heap)
+
+    def __is_valid(self, entry: Tuple[Any, int]) -> bool:
+        return self.__items.get(entry[1]) is entry[0]
+
+    def pop(self) -> Any | None:
+        """取出最小的元素，为空时返回 None"""
+        while len(self.__heap) > 0:
+            entry = heappop(self.__heap)
+            if self.__is_valid(entry):
+                del self.__items[entry[1]]
+                return entry[0]
+        return None
+
+    def smallest(self, count: int) -> List[Any]:
+        """从小到大查询至多 count 个元素，不取出"""
+        entries: List[Tuple[Any, int]] = []
+        seen = set()  # 删除后重新插入的同一元素可能在堆中有两个条目
+        while len(entries) < count and len(self.__heap) > 0:
+            entry = heappop(self.__heap)
+            if self.__is_valid(entry) and entry[1] not in seen:
+                entries.append(entry)
+                seen.add(entry[1])
+        for entry in entries:
+            heappush(self.__heap, entry)
+        return [item for item, _ in entries]
@@ -0,0 +1,68 @@
+"""等候区队列"""
+from collections import OrderedDict
+from typing import Any, Iterator, Tuple
+
+from acss_app.service.util.rank_index import EMPTY_RANK_INDEX, RankIndex
+
+
+class WaitingArea:
+    """等候区队列
+
+    每个元素以键（请求ID）为句柄，按入队顺序排列并分配递增的入队序号。
+    入队序号同时记录在不可变的排名索引 ranks 中，排队位置即索引中小于该序号的个数，
+    可将 ranks 放入快照，在读取时计算位置。入队、出队与取消均为 O(log 序号)。
+    """
+
+    def __init__(self) -> None:
+        self.__entries: OrderedDict[int, Tuple[int, Any]] = OrderedDict()  # 键 -> (入队序号, 元素)
+        self.__next_seq = 0
+        self.__ranks = EMPTY_RANK_INDEX
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    def __contains__(self, key: int) -> bool:
+        return key in self.__entries
+
+    def __iter__(self) -> Iterator[Any]:
+        for _, item in self.__entries.values():
+            yield item
+
+    @property
+    def ranks(self) -> RankIndex:
+        """当前全部入队序号的排名索引"""
+        return self.__ranks
+
+    def push(self, key: int, item: Any, seq: int | None = None) -> int:
+        """入队并返回入队序号；恢复时可给出原序号，须大于已分配的序号"""
+        if seq is None:
+            seq = self.__next_seq
+        elif seq < self.__next_seq:
+            raise ValueError(f"入队序号 {seq} 小于下一个可用序号 {self.__next_seq}")
+        self.__next_seq = seq + 1
+        self.__entries[key] = (seq, item)
+        self.__ranks = self.__ranks.add(seq)
+        return seq
+
+    def pop(self) -> Any | None:
+        if len(self.__entries) == 0:
+            return None
+        _, (seq, item) = self.__entries.popitem(last=False)
+        self.__ranks = self.__ranks.discard(seq)
+        return item
+
+    def remove(self, key: int) -> Any:
+        seq, item = self.__entries.pop(key)
+        self.__ranks = self.__ranks.discard(seq)
+        return item
+
+    def get(self, key: int) -> Any | None:
+        entry = self.__entries.get(key)
+        return None if entry is None else entry[1]
+
+    def seq_of(self, key: int) -> int:
+        return self.__entries[key][0]
+
+    def rank(self, key: int) -> int:
+        """元素在等候区中的位置（从 0 开始）"""
+        return self.__ranks.rank(self.__entries[key][0])
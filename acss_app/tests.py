@@ -1,3 +1,1511 @@
-from django.test import TestCase
+import asyncio
+import itertools
+import json
+import random
+import tempfile
+import threading
+import time
 
-# Create your tests here.
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+from pathlib import Path
+from unittest import mock
+
+import jwt
+from django.db import OperationalError, transaction
+from django.db.models import Sum
+from django.test import AsyncClient, Client, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from jsonschema import ValidationError as SchemaValidationError
+from jsonschema.exceptions import best_match
+from jsonschema.validators import validator_for
+
+from acss_app.controller import admin_controller, auth_controller, stream_controller, user_controller
+from acss_app.controller.util.validator import CompiledSchema
+from acss_app.models import (Order, Pile, PileEarningRollup, PileStatus, PileType, RevokedToken, RollupPeriod,
+                             StationClaim, User)
+from acss_app.service import journal as journal_module
+from acss_app.service.charge import (WHICH_INTERVAL, WHICH_TYPE, Settlement, calc_cost, calc_costs, create_orders,
+                                     split_by_interval_type)
+from acss_app.service import identity as identity_module
+from acss_app.service import timemock as timemock_module
+from acss_app.service.identity import Identity, IdentityCache
+from acss_app.service.exceptions import AlreadyRequested, OutOfRecycleResource, SchedulerUnavailable, ServiceError
+from acss_app.service.journal import SchedulerJournal
+from acss_app.service.pile_stats import PileStatsDelta, record_pile_stats
+from acss_app.service.rollup import diff_rollups, rebuild_rollups
+from acss_app.service.schd import (_EMPTY_SHARD_SNAPSHOT, MAX_RECYCLE_ID, RequestState, Scheduler, SchedulingMode,
+                                   StatusType, SubmitItem, _ChargingRequest)
+from acss_app.service.schd_partition import STATION_ID_STRIDE, PartitionedScheduler
+from acss_app.service.schd_policy import MinCostBatchPolicy, SchedulingPolicy, solve_min_cost
+from acss_app.service.schd_remote import RemoteScheduler, SchedulerServer, _decode_shard, _encode_shard
+from acss_app.service.settlement import SettlementWriter
+from acss_app.service.util.change_notifier import ChangeNotifier
+from acss_app.service.simple_query import query_report
+from acss_app.service.simulator import generate_workload, simulate
+from acss_app.service.timemock import (US_PER_SECOND, Clock, FastForwardClock, RealClock, VirtualClock, get_boot_time,
+                                       set_boot_time, set_clock, to_us)
+from acss_app.service.util.cow_map import EMPTY_COW_MAP
+from acss_app.service.util.id_allocator import RequestIdAllocator
+from acss_app.service.util import jwt_tool as jwt_tool_module
+from acss_app.service.util.jwt_tool import (Role, TokenCache, authenticate, authenticate_stream_ticket,
+                                            gen_stream_ticket, gen_token, purge_expired_revocations, revoke_token,
+                                            sync_revocations)
+from acss_app.service.util.pile_index import SparePileIndex
+from acss_app.service.util.rank_index import EMPTY_RANK_INDEX
+from acss_app.service.util.waiting_area import WaitingArea
+
+
+def make_piles(fast_cnt: int, normal_cnt: int) -> list:
+    """构造不入库的充电桩对象"""
+    piles = []
+    for _ in range(fast_cnt):
+        piles.append(Pile(pile_id=len(piles) + 1, pile_type=PileType.FAST_CHARGE))
+    for _ in range(normal_cnt):
+        piles.append(Pile(pile_id=len(piles) + 1, pile_type=PileType.CHARGE))
+    return piles
+
+
+def make_scheduler(fast_cnt: int = 2, normal_cnt: int = 3, **kwargs) -> Scheduler:
+    """构造不启动检查线程、不写入结算记录的调度器"""
+    kwargs.setdefault('on_settle', lambda settlement: None)
+    return Scheduler(make_piles(fast_cnt, normal_cnt), run_checker=False, **kwargs)
+
+
+class DeadlineTests(SimpleTestCase):
+    """完成时刻小根堆"""
+
+    START_US = 1_700_000_000_000_000
+    HOUR_US = 3600 * 1_000_000
+
+    def setUp(self) -> None:
+        self.clock = VirtualClock(self.START_US)
+        self.addCleanup(set_clock, set_clock(self.clock))
+        self.settlements = []
+        self.scheduler = make_scheduler(fast_cnt=0, normal_cnt=2, on_settle=self.settlements.append)
+
+    def submit(self, username: str, amount: str) -> int:
+        self.scheduler.submit_request(PileType.CHARGE, username, Decimal(amount), Decimal('60.00'))
+        return self.scheduler.get_request_id_by_username(username)
+
+    def test_next_deadline_skips_cancelled(self):
+        self.assertIsNone(self.scheduler.get_next_deadline())
+        self.submit('u0', '10.00')  # 普通充电桩 10 度/小时
+        short_id = self.submit('u1', '5.00')
+        self.assertEqual(self.scheduler.get_next_deadline(), self.START_US + self.HOUR_US // 2)
+        self.scheduler.end_request(short_id)
+        self.assertEqual(self.scheduler.get_next_deadline(), self.START_US + self.HOUR_US)
+
+    def test_complete_due_requests(self):
+        self.submit('u0', '10.00')
+        self.submit('u1', '5.00')
+        self.submit('u2', '5.00')  # 在 u1 之后排队
+        self.clock.advance_to(self.START_US + self.HOUR_US // 2 - 1)
+        self.assertEqual(self.scheduler.complete_due_requests(), 0)
+        self.clock.advance_to(self.START_US + self.HOUR_US)
+        self.assertEqual(self.scheduler.complete_due_requests(), 2)
+        self.assertEqual([settlement.username for settlement in self.settlements], ['u1', 'u0'])
+        # u2 在处理 u1 的完成时（当前时刻）开始充电，完成时刻随之登记
+        self.assertEqual(self.scheduler.get_next_deadline(), self.START_US + self.HOUR_US * 3 // 2)
+        self.clock.advance_to(self.START_US + self.HOUR_US * 3 // 2)
+        self.assertEqual(self.scheduler.complete_due_requests(), 1)
+        self.assertIsNone(self.scheduler.get_next_deadline())
+
+
+class ClockTests(SimpleTestCase):
+    """模拟时钟"""
+
+    WALL_NS = 1_700_000_000_000_000_000
+
+    def setUp(self) -> None:
+        self.wall_ns = self.WALL_NS
+        self.monotonic_ns = 5_000_000_000
+        patcher = mock.patch.object(timemock_module, 'time')
+        fake_time = patcher.start()
+        self.addCleanup(patcher.stop)
+        fake_time.time_ns.side_effect = lambda: self.wall_ns
+        fake_time.monotonic_ns.side_effect = lambda: self.monotonic_ns
+
+    def test_clock_is_abstract(self):
+        with self.assertRaises(TypeError):
+            Clock(0)
+
+    def test_fast_forward_follows_monotonic_time(self):
+        clock = FastForwardClock(rate=60)
+        boot_us = self.WALL_NS // 1000
+        self.assertEqual(clock.get_boot_us(), boot_us)
+        self.assertEqual(clock.now_us(), boot_us)
+        self.monotonic_ns += 1_000_000_000
+        self.assertEqual(clock.now_us(), boot_us + 60 * US_PER_SECOND)
+        # 调整系统时间不影响已启动的时钟
+        self.wall_ns -= 3600 * 1_000_000_000
+        self.assertEqual(clock.now_us(), boot_us + 60 * US_PER_SECOND)
+        self.assertEqual(clock.to_real_seconds(60 * US_PER_SECOND), 1.0)
+
+    def test_fast_forward_reanchors_on_boot_time(self):
+        clock = FastForwardClock(rate=60)
+        boot_us = self.WALL_NS // 1000 - 10 * US_PER_SECOND
+        clock.set_boot_us(boot_us)
+        self.assertEqual(clock.get_boot_us(), boot_us)
+        self.assertEqual(clock.now_us(), boot_us + 600 * US_PER_SECOND)
+        self.monotonic_ns += 500_000_000
+        self.assertEqual(clock.now_us(), boot_us + 630 * US_PER_SECOND)
+
+    def test_real_clock(self):
+        clock = RealClock()
+        self.monotonic_ns += 2_500_000
+        self.assertEqual(clock.now_us(), self.WALL_NS // 1000 + 2500)
+        self.assertEqual(clock.to_real_seconds(US_PER_SECOND), 1.0)
+
+    def test_virtual_clock_and_boot_time(self):
+        clock = VirtualClock(self.WALL_NS // 1000)
+        self.addCleanup(set_clock, set_clock(clock))
+        clock.advance_to(clock.now_us() + 7)
+        self.assertEqual(clock.now_us(), self.WALL_NS // 1000 + 7)
+        boot_datetime = datetime(2022, 6, 1, 6, 0, 0, 500)
+        set_boot_time(boot_datetime)
+        self.assertEqual(get_boot_time(), boot_datetime)
+        self.assertEqual(clock.get_boot_us(), to_us(boot_datetime))
+
+
+class SchedulerJournalTests(SimpleTestCase):
+    """调度日志的重放、压缩与写入失败重试"""
+
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = Path(self.temp_dir.name) / 'var' / 'scheduler.journal'
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
+
+    @staticmethod
+    def req(request_id: int, state: int, type_: int = 0) -> dict:
+        return {'t': 'req', 'id': request_id, 'type': type_, 'state': state}
+
+    def open_journal(self, **kwargs) -> SchedulerJournal:
+        journal = SchedulerJournal(self.path, fsync_interval=0, **kwargs)
+        journal.replay()
+        journal.start()
+        return journal
+
+    def test_replay_restores_latest_state(self):
+        journal = self.open_journal()
+        journal.append([self.req(1, 0), self.req(2, 0), {'t': 'queue', 'key': 'P1', 'ids': [1, 2]}])
+        journal.append([self.req(1, 3), {'t': 'del', 'id': 2, 'type': 0}, {'t': 'queue', 'key': 'P1', 'ids': [1]}])
+        self.assertTrue(journal.sync(5))
+        journal.close(5)
+
+        state = SchedulerJournal(self.path).replay()
+        self.assertEqual(state.requests, {1: self.req(1, 3)})
+        self.assertEqual(state.queues, {'P1': [1]})
+
+    def test_scheduler_restores_waiting_order(self):
+        self.addCleanup(set_clock, set_clock(VirtualClock(1_700_000_000_000_000)))
+        journal = SchedulerJournal(self.path, fsync_interval=0)
+        scheduler = make_scheduler(fast_cnt=0, normal_cnt=1, journal=journal)
+        for i in range(7):
+            scheduler.submit_request(PileType.CHARGE, f'u{i}', Decimal('10.00'), Decimal('60.00'))
+        scheduler.end_request(scheduler.get_request_id_by_username('u4'))
+        journal.close(5)
+
+        def positions(snapshot) -> dict:
+            return {view.username: (view.status.status, view.status.position) for view in snapshot.iter_views()}
+
+        expected = positions(scheduler.get_snapshot())
+        self.assertEqual(expected['u5'], (StatusType.WAITINGSTAGE1, 4))
+        journal = SchedulerJournal(self.path, fsync_interval=0)
+        self.addCleanup(journal.close, 5)
+        restored = make_scheduler(fast_cnt=0, normal_cnt=1, journal=journal)
+        self.assertEqual(positions(restored.get_snapshot()), expected)
+
+    def test_delete_ignored_for_other_type(self):
+        journal = self.open_journal()
+        journal.append([self.req(1, 0, type_=1), {'t': 'del', 'id': 1, 'type': 0}])
+        journal.close(5)
+        self.assertIn(1, SchedulerJournal(self.path).replay().requests)
+
+    def test_malformed_tail_skipped(self):
+        journal = self.open_journal()
+        journal.append([self.req(1, 0)])
+        journal.close(5)
+        with open(self.path, 'a', encoding='utf-8') as file:
+            file.write('{"t": "req", "id": 2')
+        with self.assertLogs(level='WARNING'):
+            state = SchedulerJournal(self.path).replay()
+        self.assertEqual(list(state.requests), [1])
+
+    def test_compaction_bounds_file_to_live_state(self):
+        journal = self.open_journal(compact_min_records=10)
+        for state in range(200):
+            journal.append([self.req(1, state % 4), self.req(2, state % 4)])
+            self.assertTrue(journal.sync(5))
+        journal.close(5)
+
+        with open(self.path, encoding='utf-8') as file:
+            self.assertLess(len(file.readlines()), 20)
+        self.assertFalse(self.path.with_name(self.path.name + '.tmp').exists())
+        state = SchedulerJournal(self.path).replay()
+        self.assertEqual(state.requests, {1: self.req(1, 3), 2: self.req(2, 3)})
+
+    def test_write_failure_retried(self):
+        journal = self.open_journal()
+        fsync = journal_module.os.fsync
+        failures = [OSError(28, 'No space left on device')]
+
+        def flaky_fsync(fd):
+            if failures:
+                raise failures.pop()
+            fsync(fd)
+
+        with mock.patch.object(journal_module, 'JOURNAL_RETRY_INTERVAL', 0.01), \
+                mock.patch.object(journal_module.os, 'fsync', flaky_fsync), \
+                self.assertLogs(level='ERROR'):
+            journal.append([self.req(1, 0)])
+            journal.append([self.req(2, 0)])
+            # 写入失败期间 sync 立即返回 False，重试成功后全部落盘
+            deadline = time.monotonic() + 5
+            while not journal.sync(0.1) and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertTrue(journal.sync(0))
+        self.assertFalse(journal.failing)
+        journal.close(5)
+        self.assertEqual(set(SchedulerJournal(self.path).replay().requests), {1, 2})
+
+
+class ChargingRequestViewTests(SimpleTestCase):
+    """ASGI 下的充电请求提交、修改与结束接口"""
+
+    def setUp(self) -> None:
+        # 没有快充桩，快充请求留在等候区，可以修改
+        self.scheduler = make_scheduler(fast_cnt=0)
+        patcher = mock.patch.object(user_controller, 'scheduler', self.scheduler)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        cache = IdentityCache()
+        cache.put(Identity(1, 'view_user', False))
+        patcher = mock.patch.object(identity_module, 'identity_cache', cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = AsyncClient()
+        # AsyncClient 将额外的关键字参数作为请求头
+        self.auth = {'authorization': 'Bearer ' + gen_token('view_user', 'USER')}
+
+    async def get(self, path: str) -> dict:
+        response = await self.client.get(path, **self.auth)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    async def post(self, path: str, data: dict) -> dict:
+        response = await self.client.post(path, data, content_type='application/json', **self.auth)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    async def test_submit_edit_end(self):
+        body = await self.post('/user/submit_charging_request',
+                               {'charge_mode': 'F', 'require_amount': '10.00', 'battery_size': '60.00'})
+        self.assertEqual(body['code'], 0)
+
+        body = await self.post('/user/submit_charging_request',
+                               {'charge_mode': 'T', 'require_amount': '10.00', 'battery_size': '60.00'})
+        self.assertEqual(body['code'], -1)
+
+        body = await self.post('/user/edit_charging_request', {'charge_mode': 'F', 'require_amount': '20.00'})
+        self.assertEqual(body['code'], 0)
+
+        body = await self.get('/user/end_charging_request')
+        self.assertEqual(body['code'], 0)
+        self.assertIsNone(self.scheduler.get_snapshot().find_by_username('view_user'))
+
+    async def test_end_without_request(self):
+        body = await self.get('/user/end_charging_request')
+        self.assertEqual(body['code'], -1)
+
+    async def test_scheduler_unavailable(self):
+        with mock.patch.object(self.scheduler, 'submit_request', side_effect=SchedulerUnavailable("调度服务不可用")):
+            body = await self.post('/user/submit_charging_request',
+                                   {'charge_mode': 'F', 'require_amount': '10.00', 'battery_size': '60.00'})
+        self.assertEqual(body, {'code': -1, 'message': "调度服务不可用"})
+
+
+class PileStatusViewTests(TestCase):
+    """修改充电桩状态时先通知调度器"""
+
+    def setUp(self) -> None:
+        self.pile = Pile.objects.create(status=PileStatus.RUNNING, pile_type=PileType.CHARGE,
+                                        register_time=date(2022, 6, 1), cumulative_charging_amount=Decimal('0.00'))
+        self.scheduler = mock.Mock()
+        patcher = mock.patch.object(admin_controller, 'scheduler', self.scheduler)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = Client(HTTP_AUTHORIZATION='Bearer ' + gen_token('admin', 'ADMIN'))
+
+    def update(self, status: str) -> dict:
+        response = self.client.post('/admin/update_pile', {'pile_id': f'P{self.pile.pile_id}', 'status': status},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_brake_and_recover(self):
+        self.assertEqual(self.update('UNAVAILABLE')['code'], 0)
+        self.scheduler.brake.assert_called_once_with(self.pile.pile_id)
+        self.assertEqual(self.update('RUNNING')['code'], 0)
+        self.scheduler.recover.assert_called_once_with(self.pile.pile_id)
+        self.pile.refresh_from_db()
+        self.assertEqual(self.pile.status, PileStatus.RUNNING)
+
+    def test_status_kept_when_scheduler_unavailable(self):
+        self.scheduler.brake.side_effect = SchedulerUnavailable("调度服务不可用")
+        self.assertEqual(self.update('SHUTDOWN'), {'code': -1, 'message': "调度服务不可用"})
+        self.pile.refresh_from_db()
+        self.assertEqual(self.pile.status, PileStatus.RUNNING)
+
+
+class ImportChargingRequestsViewTests(TestCase):
+    """批量导入充电请求"""
+
+    def setUp(self) -> None:
+        patcher = mock.patch.object(identity_module, 'identity_cache', IdentityCache())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.users = [User.objects.create(username=f'import_user{i}', password='x') for i in range(3)]
+        self.scheduler = mock.Mock()
+        self.scheduler.submit_many.side_effect = lambda items: [None] * len(items)
+        patcher = mock.patch.object(admin_controller, 'scheduler', self.scheduler)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = Client(HTTP_AUTHORIZATION='Bearer ' + gen_token('admin', 'ADMIN'))
+
+    def post(self, usernames: list) -> dict:
+        requests = [{'username': username, 'charge_mode': 'T', 'require_amount': '10.00', 'battery_size': '60.00'}
+                    for username in usernames]
+        response = self.client.post('/admin/import_charging_requests', {'requests': requests},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_usernames_resolved_in_one_query(self):
+        usernames = [self.users[0].username, 'nobody', self.users[1].username, self.users[2].username]
+        with self.assertNumQueries(1):
+            body = self.post(usernames)
+        self.assertEqual(body['code'], 0)
+        self.assertEqual([result['code'] for result in body['data']], [0, -1, 0, 0])
+        self.assertEqual(body['data'][1]['message'], "用户不存在")
+        items, = self.scheduler.submit_many.call_args.args
+        self.assertEqual([(item.username, item.user_id) for item in items],
+                         [(user.username, user.user_id) for user in self.users])
+        # 已缓存的用户不再查询数据库
+        with self.assertNumQueries(0):
+            self.post([user.username for user in self.users])
+
+    def test_scheduler_unavailable(self):
+        self.scheduler.submit_many.side_effect = SchedulerUnavailable("调度服务不可用")
+        self.assertEqual(self.post([self.users[0].username]), {'code': -1, 'message': "调度服务不可用"})
+
+
+class OrderQueryViewTests(TransactionTestCase):
+    """ASGI 下分页与流式查询详单，数据库在线程池中访问，数据需已提交"""
+
+    def setUp(self) -> None:
+        user = User.objects.create(username='order_user', password='x')
+        pile = Pile.objects.create(status=PileStatus.RUNNING, pile_type=PileType.CHARGE,
+                                   register_time=date(2022, 6, 1), cumulative_charging_amount=Decimal('0.00'))
+        begin_time = datetime(2022, 6, 1, 8)
+        self.order_ids = []
+        for i in range(3):
+            order = Order.objects.create(user=user, pile=pile, create_time=begin_time + timedelta(hours=i),
+                                 begin_time=begin_time, end_time=begin_time, charging_cost=Decimal('1.00'),
+                                 service_cost=Decimal('0.80'), total_cost=Decimal('1.80'),
+                                 charged_amount=Decimal('1.00'), charged_time=60)
+            self.order_ids.append(str(order.order_id))
+        # 各测试的用户编号不同，不使用之前测试缓存的用户身份
+        patcher = mock.patch.object(identity_module, 'identity_cache', IdentityCache())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = AsyncClient()
+        self.auth = {'authorization': 'Bearer ' + gen_token('order_user', 'USER')}
+
+    async def query(self, query: str) -> dict:
+        response = await self.client.get('/user/query_order_detail?' + query, **self.auth)
+        self.assertEqual(response.status_code, 200)
+        if response.streaming:
+            return json.loads(b''.join(response.streaming_content))
+        return response.json()
+
+    async def test_stream_pages(self):
+        first = await self.query('limit=2&stream=1')
+        self.assertEqual(first['code'], 0)
+        self.assertEqual([order['order_id'] for order in first['data']], self.order_ids[:2])
+        self.assertIsNotNone(first['next_cursor'])
+
+        second = await self.query(f"limit=2&stream=1&cursor={first['next_cursor']}")
+        self.assertEqual([order['order_id'] for order in second['data']], self.order_ids[2:])
+        self.assertIsNone(second['next_cursor'])
+
+    async def test_stream_matches_json(self):
+        self.assertEqual(await self.query('stream=1'), await self.query(''))
+
+    async def test_illegal_cursor(self):
+        self.assertEqual((await self.query('cursor=bad'))['code'], -1)
+
+
+class PileStatsTests(TestCase):
+    """充电桩累计数据与详单在同一事务内自增"""
+
+    def setUp(self) -> None:
+        self.pile = Pile.objects.create(status=PileStatus.RUNNING, pile_type=PileType.CHARGE,
+                                        register_time=date(2022, 6, 1), cumulative_charging_amount=Decimal('0.00'))
+
+    def read(self) -> tuple:
+        pile = Pile.objects.get(pile_id=self.pile.pile_id)
+        return pile.cumulative_usage_times, pile.cumulative_charging_time, pile.cumulative_charging_amount
+
+    def test_deltas_added(self):
+        with transaction.atomic():
+            record_pile_stats({self.pile.pile_id: PileStatsDelta(1, 600, Decimal('10.00'))})
+        with transaction.atomic():
+            record_pile_stats({self.pile.pile_id: PileStatsDelta(2, 300, Decimal('5.50'))})
+        self.assertEqual(self.read(), (3, 900, Decimal('15.50')))
+
+    def test_rolled_back_with_order(self):
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                record_pile_stats({self.pile.pile_id: PileStatsDelta(1, 600, Decimal('10.00'))})
+                raise RuntimeError("详单写入失败")
+        self.assertEqual(self.read(), (0, 0, Decimal('0.00')))
+
+
+class RollupTests(TestCase):
+    """收入汇总的增量更新、重建与报表查询"""
+
+    def setUp(self) -> None:
+        self.user = User.objects.create(username='rollup_user', password='x')
+        self.piles = [Pile.objects.create(status=PileStatus.RUNNING, pile_type=PileType.CHARGE,
+                                          register_time=date(2022, 5, 1), cumulative_charging_amount=Decimal('0.00'))
+                      for _ in range(2)]
+        # 2022-05-30 与 2022-06-06 为周一
+        create_orders([self.settlement(self.piles[0], datetime(2022, 5, 31, 10)),
+                       self.settlement(self.piles[0], datetime(2022, 6, 5, 9))])
+        create_orders([self.settlement(self.piles[0], datetime(2022, 6, 6, 8)),
+                       self.settlement(self.piles[0], datetime(2022, 6, 6, 19)),
+                       self.settlement(self.piles[1], datetime(2022, 6, 6, 20))])
+
+    def settlement(self, pile: Pile, create_time: datetime) -> Settlement:
+        return Settlement(request_type=PileType.CHARGE, pile_id=pile.pile_id, username=self.user.username,
+                          amount=Decimal('10.00'), begin_time=create_time - timedelta(hours=1), end_time=create_time,
+                          create_time=create_time, user_id=self.user.user_id)
+
+    def rollups(self) -> dict:
+        return {(rollup.pile_id, RollupPeriod(rollup.period), rollup.period_start):
+                (rollup.order_count, rollup.charging_earning, rollup.service_earning, rollup.total_earning)
+                for rollup in PileEarningRollup.objects.all()}
+
+    def test_settling_updates_periods(self):
+        pile_id = self.piles[0].pile_id
+        counts = {key[1:]: value[0] for key, value in self.rollups().items() if key[0] == pile_id}
+        self.assertEqual(counts, {
+            (RollupPeriod.DAY, date(2022, 5, 31)): 1,
+            (RollupPeriod.DAY, date(2022, 6, 5)): 1,
+            (RollupPeriod.DAY, date(2022, 6, 6)): 2,
+            (RollupPeriod.WEEK, date(2022, 5, 30)): 2,
+            (RollupPeriod.WEEK, date(2022, 6, 6)): 2,
+            (RollupPeriod.MONTH, date(2022, 5, 1)): 1,
+            (RollupPeriod.MONTH, date(2022, 6, 1)): 3,
+            (RollupPeriod.ALL, date(1970, 1, 1)): 4,
+        })
+        total = Order.objects.filter(pile_id=pile_id).aggregate(total=Sum('total_cost'))['total']
+        rollup = PileEarningRollup.objects.get(pile_id=pile_id, period=RollupPeriod.ALL)
+        self.assertEqual(rollup.total_earning, total)
+        self.assertEqual(rollup.charging_earning + rollup.service_earning, total)
+
+    def test_backfill_matches_incremental(self):
+        incremental = self.rollups()
+        self.assertEqual(diff_rollups(), [])
+        self.assertEqual(rebuild_rollups(), len(incremental))
+        self.assertEqual(self.rollups(), incremental)
+
+        PileEarningRollup.objects.filter(period=RollupPeriod.DAY).delete()
+        self.assertEqual(len(diff_rollups()), 4)
+        rebuild_rollups()
+        self.assertEqual(self.rollups(), incremental)
+
+    def test_report_matches_sum_query(self):
+        self.addCleanup(set_clock, set_clock(VirtualClock(to_us(datetime(2022, 6, 6, 21)))))
+        # 改用汇总表之前的查询方式
+        piles = Pile.objects.annotate(cumulative_charging_earning=Sum('order__charging_cost'),
+                                      cumulative_service_earning=Sum('order__service_cost'),
+                                      cumulative_earning=Sum('order__total_cost'))
+        expected = {str(pile.pile_id): (pile.cumulative_charging_earning.quantize(Decimal('0.00')),
+                                        pile.cumulative_service_earning.quantize(Decimal('0.00')),
+                                        pile.cumulative_earning.quantize(Decimal('0.00')))
+                    for pile in piles}
+        report = {row['pile_id']: row for row in query_report()}
+        self.assertEqual({pile_id: (row['cumulative_charging_earning'], row['cumulative_service_earning'],
+                                    row['cumulative_earning'])
+                          for pile_id, row in report.items()}, expected)
+        daily = Order.objects.filter(pile_id=self.piles[0].pile_id, create_time__gte=datetime(2022, 6, 6))\
+            .aggregate(total=Sum('total_cost'))['total']
+        self.assertEqual(report[str(self.piles[0].pile_id)]['daily_earning'], daily)
+
+
+class SettlementWriterTests(SimpleTestCase):
+    """结算写入失败时的重试与隔离"""
+
+    def setUp(self) -> None:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.spool_path = Path(directory.name) / 'settlement.spool'
+        patcher = mock.patch.object(SettlementWriter, 'RETRY_INTERVAL', 0.01)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.written = []
+        self.failures = []
+
+    def sink(self, batch: list) -> int:
+        if len(self.failures) > 0:
+            raise self.failures.pop()
+        if any(settlement.username == 'bad' for settlement in batch):
+            raise ValueError("无法生成详单")
+        self.written.extend(settlement.username for settlement in batch)
+        return len(batch)
+
+    def run_writer(self, usernames: list) -> None:
+        writer = SettlementWriter(self.spool_path, sink=self.sink)
+        begin_time = datetime(2022, 6, 1, 8)
+        for username in usernames:
+            writer.submit(Settlement(PileType.CHARGE, 1, username, Decimal('1.00'),
+                                     begin_time, begin_time + timedelta(minutes=6), begin_time))
+        writer.start()
+        self.assertTrue(writer.flush(5.0))
+        writer.close()
+
+    def test_poison_settlement_quarantined(self):
+        self.run_writer(['u0', 'bad', 'u1'])
+        self.assertEqual(self.written, ['u0', 'u1'])
+        quarantined = Path(f'{self.spool_path}.quarantine').read_text(encoding='utf-8').splitlines()
+        self.assertEqual([json.loads(line)['username'] for line in quarantined], ['bad'])
+        self.assertEqual(self.spool_path.read_text(encoding='utf-8'), '')
+
+    def test_database_unavailable_retried(self):
+        self.failures = [OperationalError("database is locked"), OperationalError("database is locked")]
+        self.run_writer(['u0', 'u1'])
+        self.assertEqual(self.written, ['u0', 'u1'])
+        self.assertFalse(Path(f'{self.spool_path}.quarantine').exists())
+
+
+class TokenRevocationTests(TestCase):
+    """JWT 吊销记录保存在数据库中，各进程同步"""
+
+    def setUp(self) -> None:
+        self.cache = TokenCache()
+        for patcher in (mock.patch.object(jwt_tool_module, 'token_cache', self.cache),
+                        mock.patch.dict(jwt_tool_module.__dict__, {'__last_revoke_id': 0})):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_revoked_in_other_process(self):
+        token = gen_token('u0', 'USER')
+        context = authenticate(token, Role.USER)
+        self.assertEqual(context.username, 'u0')
+        # 其他进程退出登录：只写入数据库，本进程的缓存仍有该 JWT
+        RevokedToken.objects.create(jti=context.token_id, expire_time=context.expire_time)
+        self.assertIs(authenticate(token, Role.USER), context)
+        sync_revocations()
+        self.assertEqual(authenticate(token, Role.USER), '已退出登录')
+
+    def test_revocation_survives_restart(self):
+        token = gen_token('u0', 'USER')
+        revoke_token(authenticate(token, None))
+        self.assertEqual(authenticate(token, None), '已退出登录')
+        # 重启后的进程从数据库读取吊销记录
+        self.cache = TokenCache()
+        with mock.patch.object(jwt_tool_module, 'token_cache', self.cache):
+            sync_revocations()
+            self.assertEqual(authenticate(token, None), '已退出登录')
+
+    def test_expired_revocations_removed(self):
+        now = time.time()
+        RevokedToken.objects.create(jti='expired', expire_time=now - 1)
+        RevokedToken.objects.create(jti='soon', expire_time=now + 0.05)
+        RevokedToken.objects.create(jti='later', expire_time=now + 3600)
+        sync_revocations()
+        # 同步只读取数据库，过期记录由运行调度器的进程定期删除
+        self.assertTrue(RevokedToken.objects.filter(jti='expired').exists())
+        self.assertEqual(self.cache.revoked_count(), 2)
+        self.assertEqual(purge_expired_revocations(), 1)
+        self.assertFalse(RevokedToken.objects.filter(jti='expired').exists())
+        time.sleep(0.1)
+        self.cache.purge_revoked()
+        self.assertEqual(self.cache.revoked_count(), 1)
+        self.assertTrue(self.cache.is_revoked('later'))
+
+    def test_token_without_expiry_rejected(self):
+        token = jwt.encode({'username': 'u0', 'role': 'USER'}, 'top-secret', algorithm='HS256')
+        self.assertEqual(authenticate(token, None), '登录已过期')
+
+
+def parse_sse_event(event: str) -> tuple:
+    """解析一条 Server-Sent Events 事件，返回 (事件名, data)"""
+    fields = dict(line.split(': ', 1) for line in event.strip().split('\n'))
+    return fields['event'], json.loads(fields['data'])
+
+
+class QueueStreamTests(TestCase):
+    """排队情况推送：增量事件、推送连接票据与跨域来源"""
+
+    def setUp(self) -> None:
+        self.addCleanup(set_clock, set_clock(VirtualClock(1_700_000_000_000_000)))
+        self.scheduler = make_scheduler(fast_cnt=1, normal_cnt=1)
+        patcher = mock.patch.object(stream_controller, 'scheduler', self.scheduler)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        for patcher in (mock.patch.object(jwt_tool_module, 'token_cache', TokenCache()),
+                        mock.patch.dict(jwt_tool_module.__dict__, {'__last_revoke_id': 0})):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def submit(self, username: str, request_mode: PileType = PileType.CHARGE) -> None:
+        self.scheduler.submit_request(request_mode, username, Decimal('10.00'), Decimal('60.00'))
+
+    def test_admin_delta(self):
+        stream = stream_controller.AdminQueueStream()
+        self.submit('u0')
+        self.submit('u1')
+        event, data = parse_sse_event(stream.poll(self.scheduler.get_snapshot()))
+        self.assertEqual((event, len(data['rows'])), ('snapshot', 2))
+        self.assertIsNone(stream.poll(self.scheduler.get_snapshot()))
+
+        self.scheduler.end_request(self.scheduler.get_request_id_by_username('u0'))
+        self.submit('u2')
+        event, data = parse_sse_event(stream.poll(self.scheduler.get_snapshot()))
+        self.assertEqual(event, 'delta')
+        self.assertEqual(data['removes'], ['u0'])
+        # u0 结束后 u1 开始充电
+        self.assertEqual(sorted(row['username'] for row in data['upserts']), ['u1', 'u2'])
+
+        # 充电桩队列已满，u4 留在等候区；修改充电模式后请求移到另一个分片，只更新行
+        self.submit('u3')
+        self.submit('u4')
+        stream.poll(self.scheduler.get_snapshot())
+        self.scheduler.update_request(self.scheduler.get_request_id_by_username('u4'), Decimal('10.00'),
+                                      PileType.FAST_CHARGE)
+        event, data = parse_sse_event(stream.poll(self.scheduler.get_snapshot()))
+        self.assertEqual(([row['username'] for row in data['upserts']], data['removes']), (['u4'], []))
+
+    def test_stream_ticket(self):
+        context = authenticate(gen_token('u0', 'USER'), None)
+        ticket = gen_stream_ticket(context)
+        self.assertEqual(authenticate_stream_ticket(ticket, Role.USER).username, 'u0')
+        self.assertEqual(authenticate_stream_ticket(ticket, Role.ADMIN), '无权限')
+        # 票据不能作为 JWT 使用
+        self.assertEqual(authenticate(ticket, None), 'JWT损坏')
+        revoke_token(context)
+        self.assertEqual(authenticate_stream_ticket(ticket, Role.USER), '已退出登录')
+
+    async def serve(self, query: bytes, origin: bytes) -> tuple:
+        """以 ASGI 方式建立推送连接，收到第一个事件后断开，返回 (响应头, 响应体)"""
+        messages = []
+
+        async def receive() -> dict:
+            await asyncio.sleep(0.05)
+            return {'type': 'http.disconnect'}
+
+        async def send(message: dict) -> None:
+            messages.append(message)
+
+        async def fallback(_scope, _receive, _send) -> None:
+            raise AssertionError("推送连接不应交给 Django 处理")
+
+        scope = {'type': 'http', 'method': 'GET', 'path': stream_controller.USER_STREAM_PATH,
+                 'query_string': query, 'headers': [(b'origin', origin)]}
+        await stream_controller.with_event_streams(fallback)(scope, receive, send)
+        return dict(messages[0]['headers']), b''.join(message.get('body', b'') for message in messages[1:])
+
+    @override_settings(STREAM_ALLOWED_ORIGINS=['https://acss.example.com'])
+    async def test_ticket_and_allowed_origin(self):
+        self.submit('u0')
+        context = authenticate(gen_token('u0', 'USER'), None)
+        ticket = gen_stream_ticket(context)
+
+        headers, body = await self.serve(b'ticket=' + ticket.encode(), b'https://acss.example.com')
+        self.assertEqual(headers[b'content-type'], b'text/event-stream')
+        self.assertEqual(headers[b'access-control-allow-origin'], b'https://acss.example.com')
+        self.assertNotIn(b'access-control-allow-credentials', headers)
+        self.assertEqual(parse_sse_event(body.decode())[0], 'status')
+
+        headers, _ = await self.serve(b'ticket=' + ticket.encode(), b'https://evil.example.com')
+        self.assertNotIn(b'access-control-allow-origin', headers)
+
+        # 不再接受查询参数中的 JWT
+        headers, body = await self.serve(b'token=' + context.token.encode(), b'https://acss.example.com')
+        self.assertEqual(headers[b'content-type'], b'application/json')
+        self.assertEqual(json.loads(body)['message'], '需要登录')
+
+
+class CowMapTests(SimpleTestCase):
+    """写时复制映射"""
+
+    def test_evolve_keeps_old_version(self):
+        old = EMPTY_COW_MAP.evolve({i: str(i) for i in range(1000)})
+        new = old.evolve({1: 'one', 5000: 'x'}, removes=[2, 3, 99999])
+        self.assertEqual(len(old), 1000)
+        self.assertEqual(old[1], '1')
+        self.assertIn(2, old)
+        self.assertEqual(len(new), 999)
+        self.assertEqual(new[1], 'one')
+        self.assertNotIn(2, new)
+        self.assertEqual(dict(new), {**{i: str(i) for i in range(1000) if i not in (2, 3)}, 1: 'one', 5000: 'x'})
+
+    def test_diff(self):
+        old = EMPTY_COW_MAP.evolve({i: i for i in range(0, 1024 * 50, 1024)})  # 同余的请求ID也能分散到各个桶
+        new = old.evolve({1024: -1, 7: 7}, removes=[2048])
+        changed, removed = new.diff(old)
+        self.assertEqual(sorted(changed), [7, 1024])
+        self.assertEqual(removed, [2048])
+        self.assertEqual(old.diff(old), ([], []))
+
+
+class SchedulerSnapshotTests(SimpleTestCase):
+    """快照的增量发布"""
+
+    def setUp(self) -> None:
+        self.addCleanup(set_clock, set_clock(VirtualClock(1_700_000_000_000_000)))
+        self.scheduler = make_scheduler(fast_cnt=0, normal_cnt=2)
+
+    def submit(self, username: str) -> int:
+        self.scheduler.submit_request(PileType.CHARGE, username, Decimal('10.00'), Decimal('60.00'))
+        return self.scheduler.get_request_id_by_username(username)
+
+    def statuses(self) -> dict:
+        snapshot = self.scheduler.get_snapshot()
+        return {view.username: (view.status.status, view.status.position, view.status.pile_id)
+                for view in snapshot.iter_views()}
+
+    def test_positions_follow_queues(self):
+        for i in range(8):
+            self.submit(f'u{i}')
+        statuses = self.statuses()
+        self.assertEqual(statuses['u0'], (StatusType.CHARGING, 0, 1))
+        self.assertEqual(statuses['u1'], (StatusType.CHARGING, 0, 2))
+        self.assertEqual(statuses['u4'][:2], (StatusType.WAITINGSTAGE2, 2))
+        # 两个充电桩的队列已满，等候区的排队位置从最长队列长度开始
+        self.assertEqual(statuses['u6'], (StatusType.WAITINGSTAGE1, 3, None))
+        self.assertEqual(statuses['u7'], (StatusType.WAITINGSTAGE1, 4, None))
+
+        self.scheduler.end_request(self.scheduler.get_request_id_by_username('u0'))
+        statuses = self.statuses()
+        self.assertNotIn('u0', statuses)
+        self.assertEqual(statuses['u2'], (StatusType.CHARGING, 0, 1))
+        self.assertEqual(statuses['u6'][:2], (StatusType.WAITINGSTAGE2, 2))
+        self.assertEqual(statuses['u7'], (StatusType.WAITINGSTAGE1, 3, None))
+
+    def test_unchanged_views_shared(self):
+        for i in range(6):
+            self.submit(f'u{i}')
+        before = self.scheduler.get_snapshot()
+        self.submit('late')
+        after = self.scheduler.get_snapshot()
+        self.assertEqual(after.version, before.version + 1)
+        changed, removed = after.shards[PileType.CHARGE].by_request_id.diff(
+            before.shards[PileType.CHARGE].by_request_id)
+        self.assertEqual(changed, [self.scheduler.get_request_id_by_username('late')])
+        self.assertEqual(removed, [])
+
+    def test_waiting_cancel_keeps_other_views(self):
+        for i in range(12):
+            self.submit(f'u{i}')
+        before = self.scheduler.get_snapshot()
+        self.scheduler.end_request(self.scheduler.get_request_id_by_username('u8'))
+        after = self.scheduler.get_snapshot()
+        # 后面的等候请求排队位置前移，但视图不变，只删除被取消的请求
+        changed, removed = after.shards[PileType.CHARGE].by_request_id.diff(
+            before.shards[PileType.CHARGE].by_request_id)
+        self.assertEqual(changed, [])
+        self.assertEqual(len(removed), 1)
+        self.assertEqual(before.find_by_username('u11').status.position, 8)
+        self.assertEqual(after.find_by_username('u11').status.position, 7)
+        self.assertEqual(after.find_by_username('u7').status.position, 4)
+
+    def test_noop_publish_keeps_version(self):
+        self.submit('u0')
+        version = self.scheduler.get_snapshot().version
+        # 故障并恢复空闲的充电桩不改变任何请求的视图
+        self.scheduler.brake(2)
+        self.scheduler.recover(2)
+        self.assertEqual(self.scheduler.get_snapshot().version, version)
+
+    def test_etag_differs_across_instances(self):
+        self.submit('u0')
+        restarted = make_scheduler(fast_cnt=0, normal_cnt=2)
+        restarted.submit_request(PileType.CHARGE, 'u0', Decimal('10.00'), Decimal('60.00'))
+        # 版本号相同，调度器实例不同
+        self.assertEqual(restarted.get_snapshot().version, self.scheduler.get_snapshot().version)
+        self.assertNotEqual(restarted.get_snapshot().etag, self.scheduler.get_snapshot().etag)
+
+    def test_preview_etag_per_user(self):
+        self.submit('u0')
+        etag = self.scheduler.get_snapshot().preview_etag('u0')
+        self.submit('u1')
+        snapshot = self.scheduler.get_snapshot()
+        self.assertEqual(snapshot.preview_etag('u0'), etag)
+        self.assertNotEqual(snapshot.preview_etag('u1'), etag)
+        self.scheduler.end_request(self.scheduler.get_request_id_by_username('u0'))
+        self.assertNotEqual(self.scheduler.get_snapshot().preview_etag('u0'), etag)
+
+
+class WaitingAreaTests(SimpleTestCase):
+    """等候区队列"""
+
+    def test_fifo_with_cancel(self):
+        area = WaitingArea()
+        for key in range(5):
+            area.push(key, f'r{key}')
+        self.assertEqual(area.remove(2), 'r2')
+        self.assertNotIn(2, area)
+        self.assertEqual(area.pop(), 'r0')
+        area.push(7, 'r7')
+        self.assertEqual(list(area), ['r1', 'r3', 'r4', 'r7'])
+        self.assertEqual(len(area), 4)
+        with self.assertRaises(KeyError):
+            area.remove(2)
+
+    def test_pop_empty(self):
+        self.assertIsNone(WaitingArea().pop())
+
+    def test_rank_after_cancel(self):
+        area = WaitingArea()
+        for key in range(5):
+            area.push(key, f'r{key}')
+        ranks = area.ranks
+        area.remove(1)
+        area.pop()
+        self.assertEqual([area.rank(key) for key in (2, 3, 4)], [0, 1, 2])
+        # 旧版本的排名索引不受影响
+        self.assertEqual(ranks.rank(area.seq_of(4)), 4)
+        with self.assertRaises(ValueError):
+            area.push(9, 'r9', seq=area.seq_of(4))
+
+
+class RankIndexTests(SimpleTestCase):
+    """持久化排名索引"""
+
+    def test_matches_sorted_list(self):
+        rng = random.Random(3)
+        index = EMPTY_RANK_INDEX
+        values = set()
+        versions = []
+        for _ in range(2000):
+            value = rng.randrange(1 << rng.randrange(1, 20))
+            if value in values and rng.random() < 0.6:
+                values.discard(value)
+                index = index.discard(value)
+            else:
+                values.add(value)
+                index = index.add(value)
+            versions.append((index, sorted(values)))
+        for index, expected in versions[::97]:
+            self.assertEqual(len(index), len(expected))
+            for value in expected[::7]:
+                self.assertIn(value, index)
+                self.assertEqual(index.rank(value), expected.index(value))
+            self.assertEqual(index.rank(1 << 30), len(expected))
+
+
+def split_by_walking(begin_time: datetime, end_time: datetime) -> list:
+    """逐小时累计各区间类型的时长（单位：秒），作为查表计算的参照"""
+    intervals_time_cnt = [0, 0, 0]
+    if begin_time.date() == end_time.date() and begin_time < end_time and \
+            WHICH_INTERVAL[begin_time.hour] == WHICH_INTERVAL[end_time.hour]:
+        intervals_time_cnt[WHICH_TYPE[WHICH_INTERVAL[begin_time.hour]]] = (end_time - begin_time).seconds
+    else:
+        current_time = begin_time.replace(microsecond=0)
+        if begin_time.microsecond > 0:
+            current_time += timedelta(seconds=1)
+        end_second = end_time.replace(microsecond=0)
+        while current_time < end_second:
+            next_time = min(current_time.replace(minute=0, second=0) + timedelta(hours=1), end_second)
+            intervals_time_cnt[WHICH_TYPE[WHICH_INTERVAL[current_time.hour]]] += \
+                int((next_time - current_time).total_seconds())
+            current_time = next_time
+    if sum(intervals_time_cnt) == 0:
+        intervals_time_cnt[WHICH_TYPE[WHICH_INTERVAL[begin_time.hour]]] = 1
+    return intervals_time_cnt
+
+
+class TariffTests(SimpleTestCase):
+    """查表计费"""
+
+    def test_known_costs(self):
+        cases = [
+            (datetime(2022, 6, 6, 7), datetime(2022, 6, 6, 10), Decimal('10'), '15.00'),
+            (datetime(2022, 6, 6, 21), datetime(2022, 6, 7), Decimal('30'), '42.00'),
+            (datetime(2022, 6, 6, 21), datetime(2022, 6, 7, 21), Decimal('30'), '45.00'),
+            (datetime(2022, 6, 6, 21), datetime(2022, 6, 8), Decimal('30'), '44.67'),
+            # 跨越月末
+            (datetime(2022, 6, 30, 23), datetime(2022, 7, 1, 7), Decimal('8'), '9.60'),
+        ]
+        for begin_time, end_time, amount, total in cases:
+            with self.subTest(begin_time=begin_time, end_time=end_time):
+                self.assertEqual(calc_cost(begin_time, end_time, amount)[0], Decimal(total))
+
+    def test_sub_second_rounding(self):
+        # 同一区间内取时长的整秒数，跨区间时开始时间向上取整、结束时间向下取整
+        self.assertEqual(split_by_interval_type(datetime(2022, 6, 6, 8, 0, 0, 200000),
+                                                datetime(2022, 6, 6, 8, 0, 2, 900000)), [0, 2, 0])
+        self.assertEqual(split_by_interval_type(datetime(2022, 6, 6, 9, 59, 58, 200000),
+                                                datetime(2022, 6, 6, 10, 0, 2, 900000)), [0, 1, 2])
+        # 不足一秒视为在开始时刻所属区间内充电一秒
+        self.assertEqual(split_by_interval_type(datetime(2022, 6, 6, 9, 59, 59, 500000),
+                                                datetime(2022, 6, 6, 10, 0, 0, 200000)), [0, 1, 0])
+        moment = datetime(2022, 6, 6, 12)
+        self.assertEqual(split_by_interval_type(moment, moment), [0, 0, 1])
+
+    def test_matches_walking(self):
+        rnd = random.Random(0)
+        spans = []
+        for _ in range(3000):
+            begin_time = datetime(2022, rnd.randint(1, 12), rnd.randint(1, 28),
+                                  rnd.randint(0, 23), rnd.randint(0, 59), rnd.randint(0, 59),
+                                  rnd.choice([0, rnd.randint(0, 999999)]))
+            seconds = rnd.choice([rnd.randint(0, 7200), rnd.randint(0, 3 * 86400)])
+            end_time = begin_time + timedelta(seconds=seconds, microseconds=rnd.choice([0, rnd.randint(0, 999999)]))
+            amount = Decimal(rnd.randint(1, 10000)) / 100
+            with self.subTest(begin_time=begin_time, end_time=end_time):
+                self.assertEqual(split_by_interval_type(begin_time, end_time), split_by_walking(begin_time, end_time))
+            spans.append((begin_time, end_time, amount))
+        self.assertEqual(calc_costs(spans), [calc_cost(*span) for span in spans])
+
+
+class SparePileIndexTests(SimpleTestCase):
+    """空闲充电桩索引"""
+
+    def test_first_follows_updates(self):
+        index = SparePileIndex()
+        self.assertIsNone(index.first())
+        index.update(1, 30.0)
+        index.update(2, 10.0)
+        index.update(3, 10.0)
+        self.assertEqual(index.first(), 2)  # 时长相同时取编号最小者
+        index.update(2, 50.0)
+        self.assertEqual(index.first(), 3)
+        index.update(3, None)  # 队列已满或故障
+        self.assertEqual(index.first(), 1)
+        self.assertEqual(len(index), 2)
+
+    def test_smallest(self):
+        index = SparePileIndex()
+        for pile_id in range(1, 6):
+            index.update(pile_id, float(10 - pile_id))
+        index.update(4, 100.0)
+        self.assertEqual(index.smallest(3), [(5.0, 5), (7.0, 3), (8.0, 2)])
+        # 查询不改变索引
+        self.assertEqual(index.smallest(10), [(5.0, 5), (7.0, 3), (8.0, 2), (9.0, 1), (100.0, 4)])
+        self.assertEqual(index.first(), 5)
+
+    def test_stale_keys_compacted(self):
+        index = SparePileIndex()
+        for step in range(1000):
+            index.update(step % 3, float(step))
+        self.assertEqual(index.smallest(3), [(997.0, 1), (998.0, 2), (999.0, 0)])
+
+
+class _StubPile:
+    """只提供调度策略所需接口的充电桩"""
+
+    def __init__(self, pile_id: int, finish_time: int) -> None:
+        self.pile_id = pile_id
+        self.finish_time = finish_time
+
+    def get_pile_id(self) -> int:
+        return self.pile_id
+
+    def estimate_finish_time(self) -> int:
+        return self.finish_time
+
+
+def min_total_completion(durations: list, piles: list) -> int:
+    """枚举请求到充电桩空位的全部分配，各充电桩内按时长从短到长充电，返回完成时刻之和的最小值
+
+    Args:
+        durations (list): 请求的充电时长
+        piles (list): 各充电桩的 (剩余时长, 空位数)
+    """
+    best = None
+    for assignment in itertools.product(range(len(piles)), repeat=len(durations)):
+        pile_durations = [[] for _ in piles]
+        for duration, index in zip(durations, assignment):
+            pile_durations[index].append(duration)
+        if any(len(assigned) > slots for assigned, (_, slots) in zip(pile_durations, piles)):
+            continue
+        total = 0
+        for assigned, (load, _) in zip(pile_durations, piles):
+            finish = load
+            for duration in sorted(assigned):
+                finish += duration
+                total += finish
+        best = total if best is None else min(best, total)
+    return best
+
+
+class DispatchPolicyTests(SimpleTestCase):
+    """等候区调度策略"""
+
+    NOW = 1_700_000_000_000_000
+
+    def setUp(self) -> None:
+        self.addCleanup(set_clock, set_clock(VirtualClock(self.NOW)))
+
+    def test_solve_min_cost_matches_brute_force(self):
+        rng = random.Random(5)
+        for _ in range(200):
+            piles = [(rng.randrange(0, 50), rng.randint(1, 3)) for _ in range(rng.randint(1, 3))]
+            count = rng.randint(1, min(5, sum(slots for _, slots in piles)))
+            durations = sorted((rng.randrange(1, 30) for _ in range(count)), reverse=True)
+            level_loads = [sorted(load for load, slots in piles if slots > r) for r in range(3)]
+            counts = solve_min_cost(durations, level_loads)
+            self.assertEqual(sum(counts), count)
+            # 第 r 层依次分配剩余时长最小的空位与剩余请求中最长的请求
+            cost = 0
+            it = iter(durations)
+            for r, (loads, level_count) in enumerate(zip(level_loads, counts), 1):
+                cost += sum(loads[:level_count]) + r * sum(next(it) for _ in range(level_count))
+            self.assertEqual(cost, min_total_completion(durations, piles))
+
+    def test_batch_dispatch_minimizes_completion(self):
+        rng = random.Random(11)
+        for _ in range(30):
+            piles = [(rng.randrange(0, 7200) * US_PER_SECOND, rng.randint(1, 3)) for _ in range(rng.randint(1, 3))]
+            policy = MinCostBatchPolicy(3)
+            for pile_id, (load, slots) in enumerate(piles, 1):
+                policy.on_pile_change(_StubPile(pile_id, self.NOW + load), slots)
+            area = WaitingArea()
+            requests = [_ChargingRequest(self.NOW, i, PileType.CHARGE, f'u{i}', Decimal(rng.randrange(1, 30)),
+                                         Decimal('60.00'))
+                        for i in range(rng.randint(1, min(5, sum(slots for _, slots in piles))))]
+            for request in requests:
+                area.push(request.request_id, request)
+
+            placements = list(policy.dispatch(area, SparePileIndex()))
+            self.assertCountEqual([request for request, _ in placements], requests)
+            finish = {pile_id: load for pile_id, (load, _) in enumerate(piles, 1)}
+            total = 0
+            for request, pile_id in placements:
+                finish[pile_id] += request.duration
+                total += finish[pile_id]
+            self.assertEqual(total, min_total_completion([request.duration for request in requests], piles))
+
+    def still_waiting(self, policy: SchedulingPolicy) -> list:
+        """一个充电桩的队列已满时两个请求在等候区，充电中的请求结束后仍在等候区的请求"""
+        scheduler = make_scheduler(fast_cnt=0, normal_cnt=1, policy=policy)
+        for username, amount in (('a', '30.00'), ('b', '20.00'), ('c', '10.00'), ('long', '25.00'),
+                                 ('short', '5.00')):
+            scheduler.submit_request(PileType.CHARGE, username, Decimal(amount), Decimal('60.00'))
+        scheduler.end_request(scheduler.get_request_id_by_username('a'))
+        return [view.username for view in scheduler.get_snapshot().iter_views()
+                if view.status.status == StatusType.WAITINGSTAGE1]
+
+    def test_greedy_dispatches_in_arrival_order(self):
+        self.assertEqual(self.still_waiting(SchedulingPolicy.GREEDY), ['short'])
+
+    def test_shortest_job_first(self):
+        self.assertEqual(self.still_waiting(SchedulingPolicy.SHORTEST_JOB_FIRST), ['long'])
+
+    def test_batch_prefers_short_requests_when_slots_are_scarce(self):
+        self.assertEqual(self.still_waiting(SchedulingPolicy.MIN_COST_BATCH), ['long'])
+
+
+class SimulatorTests(SimpleTestCase):
+    """离散事件模拟"""
+
+    def test_two_requests_on_one_pile(self):
+        # 一个快充桩，两个 30 度的请求同时到达，第二个请求等待第一个充满（1 小时）
+        events = [{'t': 0.0, 'op': 'submit', 'user': user, 'mode': 'F', 'amount': '30.00', 'battery': '60.00'}
+                  for user in ('u1', 'u2')]
+        report = simulate(1, events)
+        self.assertEqual((report.completed_cnt, report.interrupted_cnt, report.rejected_cnt), (2, 0, 0))
+        self.assertAlmostEqual(report.simulated_hours, 2.0)
+        self.assertAlmostEqual(report.mean_wait_minutes, 30.0, places=3)
+        self.assertAlmostEqual(report.utilization, 1.0)
+
+    def test_seeded_trace_is_deterministic(self):
+        events = generate_workload(5, 300, seed=7)
+        self.assertEqual(events, generate_workload(5, 300, seed=7))
+        submit_cnt = sum(event['op'] == 'submit' for event in events)
+        for policy in SchedulingPolicy:
+            with self.subTest(policy=policy):
+                report = simulate(5, events, policy)
+                again = simulate(5, events, policy)
+                self.assertEqual((report.completed_cnt, report.interrupted_cnt, report.rejected_cnt),
+                                 (again.completed_cnt, again.interrupted_cnt, again.rejected_cnt))
+                self.assertEqual(report.event_cnt, len(events))
+                self.assertGreater(report.completed_cnt, 0)
+                self.assertLessEqual(report.completed_cnt + report.interrupted_cnt, submit_cnt)
+                self.assertGreaterEqual(report.mean_wait_minutes, 0.0)
+                self.assertGreaterEqual(report.p95_wait_minutes, 0.0)
+                self.assertLessEqual(report.utilization, 1.0)
+
+
+class RequestIdAllocatorTests(SimpleTestCase):
+    """请求ID空闲队列"""
+
+    def test_released_ids_reused_last(self):
+        allocator = RequestIdAllocator(capacity=4)
+        self.assertEqual([allocator.alloc() for _ in range(3)], [0, 1, 2])
+        allocator.dealloc(1)
+        self.assertEqual([allocator.alloc() for _ in range(2)], [3, 1])
+        self.assertEqual(len(allocator), 4)
+
+    def test_grows_up_to_max_capacity(self):
+        allocator = RequestIdAllocator(capacity=2, max_capacity=5)
+        self.assertEqual([allocator.alloc() for _ in range(5)], [0, 1, 2, 3, 4])
+        self.assertEqual(allocator.capacity, 5)
+        with self.assertRaises(OutOfRecycleResource):
+            allocator.alloc()
+        allocator.dealloc(3)
+        self.assertEqual(allocator.alloc(), 3)
+
+    def test_stale_release_ignored(self):
+        allocator = RequestIdAllocator(capacity=2, generation_tagged=True)
+        first = allocator.alloc()
+        allocator.dealloc(first)
+        allocator.alloc()
+        reused = allocator.alloc()
+        self.assertNotEqual(reused, first)  # 同一编号的下一世代
+        with self.assertLogs(level='WARNING'):
+            allocator.dealloc(first)
+        self.assertEqual(len(allocator), 2)
+
+    def test_reserve_and_stride(self):
+        allocator = RequestIdAllocator(capacity=2, stride=4, offset=3)
+        allocator.reserve(3 + 4 * 5)  # 从日志恢复超出编号空间的请求ID
+        ids = [allocator.alloc() for _ in range(6)]
+        self.assertNotIn(23, ids)
+        self.assertTrue(all(request_id % 4 == 3 for request_id in ids))
+        with self.assertLogs(level='WARNING'):
+            allocator.dealloc(4)  # 属于其他调度域
+
+
+class CompiledSchemaTests(SimpleTestCase):
+    """预编译请求格式的校验结果与 jsonschema.validate 一致"""
+
+    STRINGS = ['15.00', '0.50', '15', '1.5', 'abc', 'user01', 'T', 'F', 'O', 'X', '', '9' * 40, '中文']
+    OTHERS = [None, True, 1, 1.5, [], {}]
+
+    def random_value(self, rnd: random.Random, schema: dict):
+        """按格式生成大致合法、部分字段被随机替换的值"""
+        if rnd.random() < 0.1:
+            return rnd.choice(self.STRINGS + self.OTHERS)
+        match schema.get('type'):
+            case 'object':
+                value = {name: self.random_value(rnd, sub_schema)
+                         for name, sub_schema in schema.get('properties', {}).items() if rnd.random() < 0.9}
+                if rnd.random() < 0.1:
+                    value['extra'] = 'x'
+                return value
+            case 'array':
+                return [self.random_value(rnd, schema.get('items', {})) for _ in range(rnd.randint(0, 3))]
+        if 'enum' in schema and rnd.random() < 0.7:
+            return rnd.choice(schema['enum'])
+        return rnd.choice(self.STRINGS)
+
+    @staticmethod
+    def validate_by_jsonschema(schema: dict, instance) -> None:
+        """与 jsonschema.validate 相同（省去每次对格式本身的检查）"""
+        error = best_match(validator_for(schema)(schema).iter_errors(instance))
+        if error is not None:
+            raise error
+
+    @staticmethod
+    def error_of(check, instance) -> tuple | None:
+        try:
+            check(instance)
+        except SchemaValidationError as e:
+            return e.message, e.schema.get('errmsg')
+        return None
+
+    def test_matches_jsonschema(self):
+        schemas = [value for module in (admin_controller, auth_controller, user_controller)
+                   for value in vars(module).values() if isinstance(value, CompiledSchema)]
+        self.assertEqual(len(schemas), 6)
+        rnd = random.Random(0)
+        valid_cnt = 0
+        for compiled in schemas:
+            for _ in range(1000):
+                instance = self.random_value(rnd, compiled.schema)
+                expected = self.error_of(lambda x: self.validate_by_jsonschema(compiled.schema, x), instance)
+                with self.subTest(instance=instance):
+                    self.assertEqual(self.error_of(compiled.check, instance), expected)
+                valid_cnt += expected is None
+        # 合法与非法的请求都应覆盖到
+        self.assertGreater(valid_cnt, 100)
+        self.assertLess(valid_cnt, 5000)
+
+
+class FaultRecoveryTests(SimpleTestCase):
+    """充电桩故障与恢复时只重新调度受影响的请求"""
+
+    def setUp(self) -> None:
+        self.addCleanup(set_clock, set_clock(VirtualClock(1_700_000_000_000_000)))
+
+    def submit(self, scheduler: Scheduler, *usernames: str) -> None:
+        for username in usernames:
+            scheduler.submit_request(PileType.CHARGE, username, Decimal('10.00'), Decimal('60.00'))
+
+    @staticmethod
+    def queues(scheduler: Scheduler) -> dict:
+        """各充电桩队列中的用户名（按排队顺序）"""
+        queues = {}
+        views = sorted(scheduler.get_snapshot().iter_views(), key=lambda view: view.status.position)
+        for view in views:
+            if view.status.pile_id is not None:
+                queues.setdefault(view.status.pile_id, []).append(view.username)
+        return queues
+
+    def end(self, scheduler: Scheduler, username: str) -> None:
+        scheduler.end_request(scheduler.get_request_id_by_username(username))
+
+    def test_brake_inserts_in_time_order(self):
+        scheduler = make_scheduler(fast_cnt=0, normal_cnt=2, recovery_mode=SchedulingMode.TIME_ORDERED)
+        self.submit(scheduler, 'u0', 'u1', 'u2', 'u3', 'u4', 'u5')
+        self.assertEqual(self.queues(scheduler), {1: ['u0', 'u2', 'u4'], 2: ['u1', 'u3', 'u5']})
+        scheduler.brake(1)
+        # 充电桩 2 的队列已满，u2 与 u4 留在故障队列中
+        self.assertEqual(self.queues(scheduler), {2: ['u1', 'u3', 'u5']})
+        self.end(scheduler, 'u3')
+        self.assertEqual(self.queues(scheduler), {2: ['u1', 'u2', 'u5']})
+        self.end(scheduler, 'u1')
+        self.assertEqual(self.queues(scheduler), {2: ['u2', 'u4', 'u5']})
+
+    def test_recover_fills_repaired_pile(self):
+        scheduler = make_scheduler(fast_cnt=0, normal_cnt=3)
+        scheduler.brake(3)
+        self.submit(scheduler, 'u0', 'u1', 'u2', 'u3')
+        self.end(scheduler, 'u0')
+        self.end(scheduler, 'u2')
+        self.assertEqual(self.queues(scheduler), {2: ['u1', 'u3']})
+        # 充电桩 1 同样空闲且编号更小，转出的请求仍应放入恢复的充电桩
+        scheduler.recover(3)
+        self.assertEqual(self.queues(scheduler), {2: ['u1'], 3: ['u3']})
+        view = scheduler.get_snapshot().find_by_username('u3')
+        self.assertEqual(view.status.status, StatusType.CHARGING)
+
+
+def wait_until(predicate, timeout: float = 5.0) -> bool:
+    """轮询等待条件成立（后台线程更新的状态）"""
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def start_scheduler_server(test_case: SimpleTestCase, scheduler: Scheduler, socket_path: Path) -> None:
+    """在线程中运行调度进程的套接字服务，测试结束时关闭"""
+    server = SchedulerServer(scheduler, socket_path)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    test_case.addCleanup(server.server_close)
+    test_case.addCleanup(server.shutdown)
+
+
+class RemoteSchedulerTests(SimpleTestCase):
+    """独立调度进程的客户端"""
+
+    def setUp(self) -> None:
+        self.addCleanup(set_clock, set_clock(VirtualClock(1_700_000_000_000_000)))
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.socket_path = Path(directory.name) / 's.sock'
+
+    def test_snapshot_does_not_wait_for_connection(self):
+        remote = RemoteScheduler(self.socket_path)
+        begin = time.monotonic()
+        snapshot = remote.get_snapshot()
+        self.assertLess(time.monotonic() - begin, 0.05)
+        self.assertEqual(list(snapshot.iter_views()), [])
+
+    def test_commands_update_local_copy(self):
+        scheduler = make_scheduler(fast_cnt=0, normal_cnt=2)
+        scheduler.submit_request(PileType.CHARGE, 'u0', Decimal('10.00'), Decimal('60.00'))
+        start_scheduler_server(self, scheduler, self.socket_path)
+        remote = RemoteScheduler(self.socket_path)
+        # 后台连接建立后收到全部分片
+        self.assertTrue(wait_until(lambda: remote.get_snapshot().find_by_username('u0') is not None))
+        remote.submit_request(PileType.CHARGE, 'u1', Decimal('10.00'), Decimal('60.00'))
+        # 响应到达前本地副本已包含该命令的修改
+        self.assertEqual(remote.get_snapshot().find_by_username('u1').status.pile_id, 2)
+        self.assertEqual(remote.get_snapshot().etag, scheduler.get_snapshot().etag)
+        remote.end_request(remote.get_request_id_by_username('u0'))
+        self.assertIsNone(remote.get_snapshot().find_by_username('u0'))
+
+    def test_delta_only_contains_changed_requests(self):
+        scheduler = make_scheduler(fast_cnt=0, normal_cnt=2)
+        for i in range(6):
+            scheduler.submit_request(PileType.CHARGE, f'u{i}', Decimal('10.00'), Decimal('60.00'))
+        index = list(PileType).index(PileType.CHARGE)
+        base = scheduler.get_snapshot().shards[index]
+        local = _decode_shard(_encode_shard(index, base, None), _EMPTY_SHARD_SNAPSHOT)
+        # 结束等候区中的请求后同一用户重新提交
+        scheduler.end_request(scheduler.get_request_id_by_username('u5'))
+        scheduler.submit_request(PileType.CHARGE, 'u5', Decimal('20.00'), Decimal('60.00'))
+        shard = scheduler.get_snapshot().shards[index]
+        message = _encode_shard(index, shard, base)
+        self.assertEqual(message['base'], base.version)
+        self.assertEqual(len(message['views']), 1)
+        self.assertEqual(len(message['removed']), 1)
+        local = _decode_shard(message, local)
+        self.assertEqual(dict(local.by_request_id.items()), dict(shard.by_request_id.items()))
+        self.assertEqual(dict(local.by_username.items()), dict(shard.by_username.items()))
+        # 基准版本不符时拒绝应用，由调用方重新连接
+        with self.assertRaises(ValueError):
+            _decode_shard(message, local)
+
+    def test_local_copy_follows_deltas(self):
+        rng = random.Random(7)
+        scheduler = make_scheduler(fast_cnt=1, normal_cnt=2)
+        start_scheduler_server(self, scheduler, self.socket_path)
+        remote = RemoteScheduler(self.socket_path)
+        self.assertTrue(wait_until(lambda: remote.get_snapshot().epoch == scheduler.get_snapshot().epoch))
+        for i in range(200):
+            username = f'u{rng.randrange(20)}'
+            try:
+                if rng.random() < 0.6:
+                    remote.submit_request(rng.choice([PileType.CHARGE, PileType.FAST_CHARGE]), username,
+                                          Decimal(rng.randrange(1, 30)), Decimal('60.00'))
+                else:
+                    remote.end_request(remote.get_request_id_by_username(username))
+            except ServiceError:
+                pass
+            self.assertEqual(remote.get_snapshot().to_rows(), scheduler.get_snapshot().to_rows())
+            self.assertEqual(sorted((view.request_id, view.status.status.value, view.status.position)
+                                    for view in remote.get_snapshot().iter_views()),
+                             sorted((view.request_id, view.status.status.value, view.status.position)
+                                    for view in scheduler.get_snapshot().iter_views()))
+
+
+def make_station(station_id: int, notifier: ChangeNotifier | None = None) -> Scheduler:
+    """构造按充电站划分请求ID的调度域，两个普通充电桩，等候区容量 15"""
+    id_allocator = RequestIdAllocator(MAX_RECYCLE_ID, stride=STATION_ID_STRIDE, offset=station_id)
+    return make_scheduler(fast_cnt=0, normal_cnt=2, id_allocator=id_allocator, notifier=notifier,
+                          waiting_area_capacity=15)
+
+
+class PartitionedSchedulerTests(SimpleTestCase):
+    """按充电站划分的调度器（调度域在进程内）"""
+
+    AMOUNT = Decimal('10.00')
+
+    def setUp(self) -> None:
+        self.clock = VirtualClock(1_700_000_000_000_000)
+        self.addCleanup(set_clock, set_clock(self.clock))
+        notifier = ChangeNotifier()
+        self.scheduler = PartitionedScheduler({1: make_station(1, notifier), 2: make_station(2, notifier)},
+                                              {}, notifier)
+
+    def submit(self, username: str, station_id: int) -> None:
+        self.scheduler.submit_request(PileType.CHARGE, username, self.AMOUNT, self.AMOUNT, station_id=station_id)
+
+    def tracked_users(self) -> dict:
+        return dict(self.scheduler._PartitionedScheduler__user_stations)
+
+    def test_one_request_per_user(self):
+        self.submit('u0', 1)
+        with self.assertRaises(AlreadyRequested):
+            self.submit('u0', 2)
+        results = self.scheduler.submit_many([SubmitItem(PileType.CHARGE, 'u0', self.AMOUNT, self.AMOUNT, station_id=2),
+                                              SubmitItem(PileType.CHARGE, 'u1', self.AMOUNT, self.AMOUNT, station_id=2),
+                                              SubmitItem(PileType.CHARGE, 'u1', self.AMOUNT, self.AMOUNT, station_id=1)])
+        self.assertIsInstance(results[0], AlreadyRequested)
+        self.assertIsNone(results[1])
+        self.assertIsInstance(results[2], AlreadyRequested)
+        request_id = self.scheduler.get_request_id_by_username('u1')
+        self.assertEqual(request_id % STATION_ID_STRIDE, 2)
+        self.scheduler.end_request(request_id)
+        self.submit('u1', 1)
+
+    def test_ended_users_forgotten(self):
+        for i in range(4):
+            self.submit(f'u{i}', 1 + i % 2)
+        self.assertEqual(len(self.tracked_users()), 4)
+        self.scheduler.end_request(self.scheduler.get_request_id_by_username('u0'))
+        # 充满后由调度域结束的请求同样会被清理
+        self.clock.advance_to(self.clock.now_us() + 3600 * 1_000_000)
+        self.assertEqual(self.scheduler.complete_due_requests(), 3)
+        self.submit('u4', 1)
+        self.assertEqual(self.tracked_users(), {'u4': 1})
+
+    def test_mode_change_keeps_station(self):
+        for i in range(6):  # 填满充电桩队列，u0 留在等候区
+            self.submit(f'f{i}', 2)
+        self.submit('u0', 2)
+        request_id = self.scheduler.get_request_id_by_username('u0')
+        self.scheduler.update_request(request_id, self.AMOUNT, PileType.FAST_CHARGE)
+        self.submit('u1', 1)
+        self.assertEqual(self.tracked_users()['u0'], 2)
+        with self.assertRaises(AlreadyRequested):
+            self.submit('u0', 1)
+
+
+class PartitionedRemoteTests(TransactionTestCase):
+    """连接调度进程时在数据库中认领用户的充电站"""
+
+    AMOUNT = Decimal('10.00')
+
+    def setUp(self) -> None:
+        self.addCleanup(set_clock, set_clock(VirtualClock(1_700_000_000_000_000)))
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.socket_paths = {}
+        self.stations = {}
+        for station_id in (1, 2):
+            self.socket_paths[station_id] = Path(directory.name) / f's{station_id}.sock'
+            self.stations[station_id] = make_station(station_id)
+            start_scheduler_server(self, self.stations[station_id], self.socket_paths[station_id])
+        # 两个 Web 进程
+        self.web1 = self.connect()
+        self.web2 = self.connect()
+
+    def connect(self) -> PartitionedScheduler:
+        notifier = ChangeNotifier()
+        domains = {station_id: RemoteScheduler(path, notifier=notifier) for station_id, path in self.socket_paths.items()}
+        # 连接建立后本地副本与调度进程的快照属于同一实例
+        def connected() -> bool:
+            return all(domain.get_snapshot().epoch == self.stations[station_id].get_snapshot().epoch
+                       for station_id, domain in domains.items())
+
+        self.assertTrue(wait_until(connected))
+        return PartitionedScheduler(domains, {}, notifier)
+
+    def submit(self, web: PartitionedScheduler, username: str, station_id: int) -> None:
+        web.submit_request(PileType.CHARGE, username, self.AMOUNT, self.AMOUNT, station_id=station_id)
+
+    def test_claim_shared_between_processes(self):
+        self.submit(self.web1, 'u0', 1)
+        with self.assertRaises(AlreadyRequested):
+            self.submit(self.web2, 'u0', 2)
+        claim = StationClaim.objects.get(username='u0')
+        self.assertEqual((claim.station_id, claim.request_id), (1, self.web2.get_request_id_by_username('u0')))
+
+        self.web2.end_request(claim.request_id)
+        self.assertTrue(wait_until(lambda: self.web1.get_snapshot().find_by_username('u0') is None))
+        self.submit(self.web1, 'u0', 2)
+        self.assertEqual(StationClaim.objects.get(username='u0').station_id, 2)
+
+    def test_stale_claim_taken_over(self):
+        now = datetime.now()
+        StationClaim.objects.create(username='fresh', station_id=1, claim_time=now)
+        StationClaim.objects.create(username='stale', station_id=1, claim_time=now - timedelta(minutes=5))
+        # 其他进程刚认领、尚未提交成功
+        with self.assertRaises(AlreadyRequested):
+            self.submit(self.web1, 'fresh', 2)
+        self.submit(self.web1, 'stale', 2)
+        self.assertEqual(StationClaim.objects.get(username='stale').station_id, 2)
+
+    def test_failed_submit_releases_claim(self):
+        for i in range(6):
+            self.submit(self.web1, f'f{i}', 1)
+        results = self.web2.submit_many([SubmitItem(PileType.CHARGE, f'w{i}', self.AMOUNT, self.AMOUNT, station_id=1)
+                                         for i in range(20)])
+        failed = [f'w{i}' for i, error in enumerate(results) if error is not None]
+        self.assertGreater(len(failed), 0)  # 等候区已满
+        self.assertFalse(StationClaim.objects.filter(username__in=failed).exists())
+        self.assertEqual(StationClaim.objects.filter(request_id=None).count(), 0)
@@ -3,6 +3,7 @@ from django.urls import path
 
 import acss_app.controller.user_controller as user_controller
 import acss_app.controller.auth_controller as auth_controller
+import acss_app.controller.stream_controller as stream_controller
 
 
 urlpatterns = [
@@ -12,4 +13,5 @@ urlpatterns = [
     path('edit_charging_request', user_controller.edit_charging_request),
     path('end_charging_request', user_controller.end_charging_request),
     path('preview_queue', user_controller.preview_queue_api),
+    path('subscribe_queue', stream_controller.user_subscribe_queue_api),
 ]
@@ -12,5 +12,12 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'acss_site.settings')
+# 由 ASGI 服务器导入时启动调度器等后台服务，见 acss_app.apps.SERVICE_PROCESS_ENV
+os.environ.setdefault('ACSS_SERVICE_PROCESS', '1')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# 排队情况推送连接需要在应用初始化后导入，在事件循环内直接处理
+from acss_app.controller.stream_controller import with_event_streams  # noqa: E402
+
+application = with_event_streams(django_application)
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.0/ref/settings/
 """
 import logging
+import os
 
 from pathlib import Path
 
@@ -82,7 +83,37 @@ STATIC_URL = 'static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# 运行时文件（结算 spool、调度进程套接字等）所在目录，不纳入版本管理
+RUNTIME_DIR = BASE_DIR / 'var'
+
+# 结算 spool 文件，保存尚未生成详单的结算记录
+SETTLEMENT_SPOOL_PATH = RUNTIME_DIR / 'settlement.spool'
+
+# 调度器运行方式：local 在 Web 进程内运行调度器；
+# remote 连接 manage.py run_scheduler 启动的独立调度进程，可运行多个 Web 进程
+SCHEDULER_MODE = os.environ.get('ACSS_SCHEDULER_MODE', 'local')
+SCHEDULER_SOCKET_PATH = os.environ.get('ACSS_SCHEDULER_SOCKET', str(RUNTIME_DIR / 'scheduler.sock'))
+
+# 调度日志，记录调度器的每次修改，重启时重放以恢复排队状态；为 None 时不记录
+SCHEDULER_JOURNAL_PATH = RUNTIME_DIR / 'scheduler.journal'
+
+# 请求ID编号空间上限，为 None 时按需扩容；启用世代标记后已结束请求的ID不会被复用
+REQUEST_ID_MAX_CAPACITY = None
+REQUEST_ID_GENERATION_TAGGED = False
+
+# 等候区调度策略：greedy 按到达顺序逐个放入预计排队时长最短的充电桩；sjf 优先调度充电时长最短的请求；
+# batch 将等候区中的请求批量分配到充电桩空位，使完成时刻之和最小
+SCHEDULING_POLICY = os.environ.get('ACSS_SCHEDULING_POLICY', 'greedy')
+
+# 按充电站划分调度域：每个充电站（Station）运行独立的调度器，请求按充电站路由，
+# 调度日志与套接字文件名后附加充电站编号；设置 ACSS_SCHEDULER_STATION 时只运行该充电站的调度域
+SCHEDULER_PARTITIONED = os.environ.get('ACSS_SCHEDULER_PARTITIONED', '0') == '1'
+SCHEDULER_STATION = os.environ.get('ACSS_SCHEDULER_STATION')
+
 CORS_ALLOW_ALL_ORIGINS = True
 CORS_ALLOW_CREDENTIALS = True
 
+# ASGI 下的排队情况推送连接（subscribe_queue）允许的跨域来源，逗号分隔；为空时不允许跨域
+STREAM_ALLOWED_ORIGINS = [origin for origin in os.environ.get('ACSS_STREAM_ALLOWED_ORIGINS', '').split(',') if origin]
+
 logging.getLogger('root').setLevel('DEBUG')
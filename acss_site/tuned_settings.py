@@ -0,0 +1,20 @@
+"""
+数据库调优配置
+
+在 prod_settings 的基础上复用数据库连接，并为新建的 SQLite 连接设置 WAL 等 PRAGMA。
+使用方式：python manage.py serve --settings=acss_site.tuned_settings
+"""
+from acss_site.prod_settings import *  # noqa: F401,F403
+from acss_site.prod_settings import DATABASES
+
+# 复用数据库连接（单位：秒）
+DATABASES['default']['CONN_MAX_AGE'] = 600
+
+# 新建 SQLite 连接时执行的 PRAGMA 设置
+# WAL 模式下读写互不阻塞，synchronous=NORMAL 在 WAL 模式下只在检查点时 fsync
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'temp_store': 'MEMORY',
+}
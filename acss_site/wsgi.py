@@ -12,5 +12,7 @@ import os
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'acss_site.settings')
+# 由 WSGI 服务器导入时启动调度器等后台服务，见 acss_app.apps.SERVICE_PROCESS_ENV
+os.environ.setdefault('ACSS_SERVICE_PROCESS', '1')
 
 application = get_wsgi_application()
@@ -0,0 +1,48 @@
+"""基准测试公用的 Django 初始化"""
+import sys
+
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+
+def setup(database: str | None = None) -> None:
+    """初始化 Django，但不创建全局调度器
+
+    Args:
+        database (str | None, optional): SQLite 数据库路径，为 None 时不配置数据库
+    """
+    import django
+    from django.conf import settings
+
+    import acss_app.apps
+    acss_app.apps.init_flag = False  # 跳过 on_init，基准测试自行创建调度器
+
+    databases = {}
+    if database is not None:
+        databases['default'] = {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': database,
+        }
+    settings.configure(
+        INSTALLED_APPS=['acss_app'],
+        DATABASES=databases,
+        USE_TZ=False,
+        TIME_ZONE='Asia/Shanghai',
+        DEFAULT_AUTO_FIELD='django.db.models.BigAutoField',
+    )
+    django.setup()
+
+
+def make_piles(fast_cnt: int, normal_cnt: int) -> list:
+    """构造不入库的充电桩对象"""
+    from acss_app.models import Pile, PileType
+
+    piles = []
+    for _ in range(fast_cnt):
+        piles.append(Pile(pile_id=len(piles) + 1, pile_type=PileType.FAST_CHARGE))
+    for _ in range(normal_cnt):
+        piles.append(Pile(pile_id=len(piles) + 1, pile_type=PileType.CHARGE))
+    return piles
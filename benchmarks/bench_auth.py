@@ -0,0 +1,52 @@
+"""JWT 鉴权开销测试
+
+比较 preprocess_token 在使用与不使用 JWT 验证结果缓存时，每个请求的鉴权耗时。
+请求处理函数为空操作，--tokens 个不同 JWT 轮流发起请求，用于观察缓存容量不足时的退化。
+
+用法：python benchmarks/bench_auth.py [--requests 100000] [--tokens 100]
+"""
+import argparse
+import time
+
+import _django
+
+_django.setup()
+
+from django.test import RequestFactory  # noqa: E402
+
+from acss_app.service.util.jwt_tool import Role, gen_token, preprocess_token  # noqa: E402
+
+
+def handler(_context, _request):
+    return None
+
+
+def run(view, requests: list, total: int) -> float:
+    begin = time.perf_counter()
+    for i in range(total):
+        view(requests[i % len(requests)])
+    return (time.perf_counter() - begin) / total
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=100000)
+    parser.add_argument('--tokens', type=int, nargs='+', default=[1, 100, 10000])
+    args = parser.parse_args()
+
+    factory = RequestFactory()
+    views = {
+        'uncached': preprocess_token(Role.USER, use_cache=False)(handler),
+        'cached': preprocess_token(Role.USER)(handler),
+    }
+    print(f"{'tokens':>8}{'mode':>10}{'us/request':>12}")
+    for token_cnt in args.tokens:
+        requests = [factory.get('/', HTTP_AUTHORIZATION='Bearer ' + gen_token(f'user{i}', 'USER'))
+                    for i in range(token_cnt)]
+        for mode, view in views.items():
+            cost = run(view, requests, args.requests)
+            print(f'{token_cnt:>8}{mode:>10}{cost * 1e6:>12.2f}')
+
+
+if __name__ == '__main__':
+    main()
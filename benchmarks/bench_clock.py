@@ -0,0 +1,64 @@
+"""读取模拟时间开销测试
+
+比较原先的 get_datetime_now（每次调用 datetime.now() 后做 timedelta 减法、乘法与加法）与
+按单调时钟整数运算的时钟读取微秒时刻，以及调度器中最常见的完成检查（当前时刻与完成时刻比较）的耗时。
+get_datetime_now 现在只用于接口边界，需要转换为 datetime，因此列出其耗时作为参考。
+
+用法：python benchmarks/bench_clock.py [--calls 1000000]
+"""
+import argparse
+import time
+
+from datetime import datetime, timedelta
+
+import _django
+
+_django.setup()
+
+from acss_app.service.timemock import FAST_FORWARD_RATE, get_clock, get_datetime_now, now_us  # noqa: E402
+
+__legacy_boot = datetime.now()
+
+
+def legacy_get_datetime_now() -> datetime:
+    """原先的 get_datetime_now"""
+    real_datetime = datetime.now()
+    delta = real_datetime - __legacy_boot
+    return __legacy_boot + delta * FAST_FORWARD_RATE
+
+
+def run(read, calls: int) -> float:
+    begin = time.perf_counter()
+    for _ in range(calls):
+        read()
+    return (time.perf_counter() - begin) / calls
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--calls', type=int, default=1000000)
+    args = parser.parse_args()
+
+    legacy_deadline = legacy_get_datetime_now() + timedelta(hours=1)
+    deadline_us = now_us() + 3600 * 1000000
+    clock_now_us = get_clock().now_us
+    cases = (
+        ('legacy datetime', legacy_get_datetime_now),
+        ('clock.now_us', clock_now_us),
+        ('now_us', now_us),
+        ('get_datetime_now', get_datetime_now),
+        ('legacy check', lambda: legacy_get_datetime_now() >= legacy_deadline),
+        ('now_us check', lambda: now_us() >= deadline_us),
+    )
+
+    baseline = 0.0
+    print(f"{'read':>18}{'ns/call':>10}{'speedup':>10}")
+    for name, read in cases:
+        cost = run(read, args.calls)
+        if name.startswith('legacy'):
+            baseline = cost
+        print(f'{name:>18}{cost * 1e9:>10.0f}{baseline / cost:>10.2f}')
+
+
+if __name__ == '__main__':
+    main()
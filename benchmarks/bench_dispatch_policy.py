@@ -0,0 +1,104 @@
+"""批量调度求解开销测试
+
+构造 n 个等候请求与 n 个剩余时长随机、空位数随机的充电桩，测量最小代价批量调度一次分配全部请求的耗时，
+并与按到达顺序逐个放入预计全部充满时刻最早的充电桩（贪心）比较这些请求的完成时刻之和。
+等候区容量为 WAITING_AREA_CAPACITY，这里直接调用调度策略以测试更大的规模。
+
+用法：python benchmarks/bench_dispatch_policy.py [--requests 15 100 300 1000] [--seed 0]
+"""
+import argparse
+import random
+import time
+
+from decimal import Decimal
+
+import _django
+
+_django.setup()
+
+from acss_app.models import PileType  # noqa: E402
+from acss_app.service.schd import WAITING_QUEUE_CAPACITY, _ChargingRequest  # noqa: E402
+from acss_app.service.schd_policy import MinCostBatchPolicy  # noqa: E402
+from acss_app.service.timemock import US_PER_SECOND, VirtualClock, set_clock  # noqa: E402
+from acss_app.service.util.pile_index import SparePileIndex  # noqa: E402
+from acss_app.service.util.waiting_area import WaitingArea  # noqa: E402
+
+NOW = 1000 * US_PER_SECOND
+
+
+class _Pile:
+    """只提供调度策略所需接口的充电桩"""
+
+    def __init__(self, pile_id: int, finish_time: int) -> None:
+        self.pile_id = pile_id
+        self.finish_time = finish_time
+
+    def get_pile_id(self) -> int:
+        return self.pile_id
+
+    def estimate_finish_time(self) -> int:
+        return self.finish_time
+
+
+def make_case(count: int, rand: random.Random) -> tuple:
+    requests = [_ChargingRequest(i, i, PileType.CHARGE, f'u{i}', Decimal(f'{rand.uniform(5, 50):.2f}'),
+                                 Decimal('100.00')) for i in range(count)]
+    piles = [(_Pile(i + 1, NOW + rand.randrange(0, 4 * 3600) * US_PER_SECOND),
+              rand.randint(1, WAITING_QUEUE_CAPACITY)) for i in range(count)]
+    return requests, piles
+
+
+def total_completion(placements: list, piles: list) -> float:
+    """各充电桩按放入顺序充电时，请求完成时刻之和（单位：小时，自 NOW 起）"""
+    finish = {pile.pile_id: max(pile.finish_time - NOW, 0) for pile, _ in piles}
+    total = 0
+    for request, pile_id in placements:
+        finish[pile_id] += request.duration
+        total += finish[pile_id]
+    return total / US_PER_SECOND / 3600
+
+
+def greedy_placements(requests: list, piles: list) -> list:
+    free = {pile.pile_id: slots for pile, slots in piles}
+    finish = {pile.pile_id: max(pile.finish_time - NOW, 0) for pile, _ in piles}
+    placements = []
+    for request in requests:
+        pile_id = min((pile_id for pile_id in free if free[pile_id] > 0), key=lambda p: (finish[p], p))
+        free[pile_id] -= 1
+        finish[pile_id] += request.duration
+        placements.append((request, pile_id))
+    return placements
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, nargs='+', default=[15, 100, 300, 1000])
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    previous_clock = set_clock(VirtualClock(NOW))
+    print(f"{'n':>6}{'solve(ms)':>11}{'greedy(h)':>11}{'batch(h)':>11}{'saving':>8}")
+    try:
+        for count in args.requests:
+            requests, piles = make_case(count, random.Random(args.seed))
+            policy = MinCostBatchPolicy(WAITING_QUEUE_CAPACITY)
+            for pile, slots in piles:
+                policy.on_pile_change(pile, slots)
+            waiting_area = WaitingArea()
+            for request in requests:
+                waiting_area.push(request.request_id, request)
+
+            begin = time.perf_counter()
+            placements = list(policy.dispatch(waiting_area, SparePileIndex()))
+            cost = time.perf_counter() - begin
+            assert len(placements) == count
+
+            greedy = total_completion(greedy_placements(requests, piles), piles)
+            batch = total_completion(placements, piles)
+            print(f'{count:>6}{cost * 1000:>11.1f}{greedy:>11.1f}{batch:>11.1f}{1 - batch / greedy:>8.1%}')
+    finally:
+        set_clock(previous_clock)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""充电桩故障处理开销测试
+
+所有充电桩队列与等候区填满后，令同一个充电桩反复故障与恢复（--cycles 次），
+测量每次 brake 与 recover 的耗时（含发布快照），以及此前不在该充电桩上、被改变位置（充电桩或排位）的请求数。
+快照发布的耗时与存活请求数成正比，充电桩很多时是故障处理耗时的主要部分。
+
+用法：python benchmarks/bench_fault_recovery.py [--piles 100 1000 10000] [--cycles 20]
+"""
+import argparse
+import logging
+import time
+
+from decimal import Decimal
+
+import _django
+
+_django.setup()
+
+from acss_app.models import PileType  # noqa: E402
+from acss_app.service.schd import (Scheduler, SchedulingMode, SubmitItem, WAITING_AREA_CAPACITY,  # noqa: E402
+                                   WAITING_QUEUE_CAPACITY)
+
+
+def discard(_settlement) -> None:
+    pass
+
+
+def placements(scheduler: Scheduler) -> dict:
+    """各请求所在的 (状态, 充电桩, 排位)"""
+    return {view.request_id: (view.status.status, view.status.pile_id, view.status.position)
+            for view in scheduler.get_snapshot().iter_views()}
+
+
+def disturbed(before: dict, after: dict, pile_id: int) -> int:
+    """此前不在 pile_id 上且仍然存活的请求中，位置改变的请求数"""
+    return sum(1 for request_id, place in before.items()
+               if place[1] != pile_id and request_id in after and after[request_id] != place)
+
+
+def measure(pile_cnt: int, mode: SchedulingMode, cycles: int) -> tuple:
+    scheduler = Scheduler(_django.make_piles(0, pile_cnt), on_settle=discard, run_checker=False,
+                          recovery_mode=mode)
+    # 充电量足够大，测试期间不会有请求充电完成
+    count = pile_cnt * WAITING_QUEUE_CAPACITY + WAITING_AREA_CAPACITY
+    scheduler.submit_many([SubmitItem(PileType.CHARGE, f'u{i}', Decimal('1000.00'), Decimal('1000.00'))
+                           for i in range(count)])
+    pile_id = pile_cnt // 2 + 1
+    brake_cost = recover_cost = 0.0
+    brake_moved = recover_moved = 0
+    for _ in range(cycles):
+        before = placements(scheduler)
+        begin = time.perf_counter()
+        scheduler.brake(pile_id)
+        brake_cost += time.perf_counter() - begin
+        after = placements(scheduler)
+        brake_moved += disturbed(before, after, pile_id)
+
+        begin = time.perf_counter()
+        scheduler.recover(pile_id)
+        recover_cost += time.perf_counter() - begin
+        recover_moved += disturbed(after, placements(scheduler), pile_id)
+    return brake_cost / cycles, recover_cost / cycles, brake_moved / cycles, recover_moved / cycles
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--piles', type=int, nargs='+', default=[100, 1000, 10000])
+    parser.add_argument('--cycles', type=int, default=20)
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    print(f"{'mode':>13}{'piles':>8}{'brake(ms)':>11}{'recover(ms)':>13}{'moved/brake':>13}{'moved/recover':>15}")
+    for pile_cnt in args.piles:
+        for mode in (SchedulingMode.PRIORITY, SchedulingMode.TIME_ORDERED):
+            brake_cost, recover_cost, brake_moved, recover_moved = measure(pile_cnt, mode, args.cycles)
+            print(f'{mode.name:>13}{pile_cnt:>8}{brake_cost * 1000:>11.2f}{recover_cost * 1000:>13.2f}'
+                  f'{brake_moved:>13.1f}{recover_moved:>15.1f}')
+
+
+if __name__ == '__main__':
+    main()
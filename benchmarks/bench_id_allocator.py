@@ -0,0 +1,97 @@
+"""请求ID分配器测试
+
+比较原先线性探测的分配器与空闲队列分配器：先占用 --fill 比例的编号（编号空间为 1000）并分给各线程，
+再由多个线程并发循环“随机释放一个自己持有的ID，再分配一个新ID”（请求不按提交顺序结束），
+输出每次释放加分配的平均耗时。
+原分配器在编号空间接近用尽时需要探测大量已占用编号，空闲队列分配器的耗时与占用率无关。
+
+用法：python benchmarks/bench_id_allocator.py [--ops 20000] [--threads 1 4 16] [--fill 0 0.9 0.999]
+"""
+import argparse
+import random
+import threading
+import time
+
+from threading import Lock
+
+import _django
+
+_django.setup()
+
+from acss_app.service.exceptions import OutOfRecycleResource  # noqa: E402
+from acss_app.service.util.id_allocator import RequestIdAllocator  # noqa: E402
+
+CAPACITY = 1000
+
+
+class _LegacyIdAllocator:
+    """原先的请求ID分配器"""
+
+    def __init__(self) -> None:
+        self.__lock = Lock()
+        self.__id_flags = [False for _ in range(CAPACITY)]
+        self.__cur = 0
+
+    def alloc(self) -> int:
+        with self.__lock:
+            failure_cnt = 0
+            while self.__id_flags[self.__cur]:
+                if failure_cnt == CAPACITY:
+                    raise OutOfRecycleResource("充电标识已用尽")
+                self.__cur = (self.__cur + 1) % CAPACITY
+                failure_cnt += 1
+            self.__id_flags[self.__cur] = True
+            return self.__cur
+
+    def dealloc(self, charging_id: int) -> None:
+        with self.__lock:
+            self.__id_flags[charging_id] = False
+
+
+def measure(allocator, thread_cnt: int, ops: int, fill: float) -> float:
+    held = [[] for _ in range(thread_cnt)]
+    for i in range(max(int(CAPACITY * fill), thread_cnt)):
+        held[i % thread_cnt].append(allocator.alloc())
+    per_thread = ops // thread_cnt
+    barrier = threading.Barrier(thread_cnt + 1)
+
+    def worker(ids: list, seed: int) -> None:
+        rand = random.Random(seed)
+        choices = [rand.randrange(len(ids)) for _ in range(per_thread)]
+        barrier.wait()
+        for index in choices:
+            allocator.dealloc(ids[index])
+            ids[index] = allocator.alloc()
+
+    threads = [threading.Thread(target=worker, args=(held[i], i)) for i in range(thread_cnt)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    begin = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    return (time.perf_counter() - begin) / (per_thread * thread_cnt)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--ops', type=int, default=20000)
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--fill', type=float, nargs='+', default=[0, 0.9, 0.999])
+    args = parser.parse_args()
+
+    allocators = (
+        ('legacy', _LegacyIdAllocator),
+        ('free-list', lambda: RequestIdAllocator(CAPACITY)),
+        ('tagged', lambda: RequestIdAllocator(CAPACITY, generation_tagged=True)),
+    )
+    print(f"{'allocator':>10}{'fill':>8}{'threads':>9}{'ns/op':>10}")
+    for fill in args.fill:
+        for thread_cnt in args.threads:
+            for name, factory in allocators:
+                cost = measure(factory(), thread_cnt, args.ops, fill)
+                print(f'{name:>10}{fill:>8}{thread_cnt:>9}{cost * 1e9:>10.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""调度日志开销与恢复时间测试
+
+写入开销：比较不记录日志与记录日志（批量 fsync）时，单线程循环提交并取消请求的每次操作耗时。
+恢复时间：先提交请求使每个充电桩队列与等候区填满（存活请求数约为 3 * 充电桩数 + 等候区容量），
+再执行 --history 次“结束一个充电中的请求并提交一个新请求”，之后测量由日志重建调度器的耗时。
+日志定期压缩，恢复时间应只随存活请求数增长，而不随历史长度增长。
+
+用法：python benchmarks/bench_journal.py [--ops 5000] [--piles 10 100 300] [--history 0 5000]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from decimal import Decimal
+
+import _django
+
+_django.setup()
+
+from acss_app.models import PileType  # noqa: E402
+from acss_app.service.journal import SchedulerJournal  # noqa: E402
+from acss_app.service.schd import Scheduler, WAITING_AREA_CAPACITY, WAITING_QUEUE_CAPACITY  # noqa: E402
+
+
+def discard(_settlement) -> None:
+    pass
+
+
+def measure_write(journal_path: str | None, ops: int) -> float:
+    journal = None if journal_path is None else SchedulerJournal(journal_path)
+    scheduler = Scheduler(_django.make_piles(2, 3), on_settle=discard, journal=journal)
+    begin = time.perf_counter()
+    for i in range(ops):
+        username = f'w{i}'
+        scheduler.submit_request(PileType.CHARGE, username, Decimal('10.00'), Decimal('60.00'))
+        scheduler.end_request(scheduler.get_request_id_by_username(username))
+    if journal is not None:
+        journal.sync()
+    cost = (time.perf_counter() - begin) / (ops * 2)
+    if journal is not None:
+        journal.close()
+    return cost
+
+
+def build_journal(journal_path: str, pile_cnt: int, history: int) -> int:
+    # 充电量足够大，测试期间不会有请求充电完成，避免检查线程干扰计时
+    journal = SchedulerJournal(journal_path)
+    scheduler = Scheduler(_django.make_piles(0, pile_cnt), on_settle=discard, journal=journal)
+    live = pile_cnt * WAITING_QUEUE_CAPACITY + WAITING_AREA_CAPACITY
+    for i in range(live):
+        scheduler.submit_request(PileType.CHARGE, f'u{i}', Decimal('1000.00'), Decimal('1000.00'))
+    for i in range(history):
+        executing = next(view for view in scheduler.get_snapshot().iter_views() if view.status.position == 0
+                         and view.status.pile_id is not None)
+        scheduler.end_request(executing.request_id)
+        scheduler.submit_request(PileType.CHARGE, f'h{i}', Decimal('1000.00'), Decimal('1000.00'))
+    journal.close()
+    return live
+
+
+def measure_recovery(journal_path: str, pile_cnt: int) -> float:
+    begin = time.perf_counter()
+    journal = SchedulerJournal(journal_path)
+    Scheduler(_django.make_piles(0, pile_cnt), on_settle=discard, journal=journal)
+    cost = time.perf_counter() - begin
+    journal.close()
+    return cost
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--ops', type=int, default=5000)
+    parser.add_argument('--piles', type=int, nargs='+', default=[10, 100, 300])
+    parser.add_argument('--history', type=int, nargs='+', default=[0, 5000])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        journal_path = os.path.join(directory, 'scheduler.journal')
+
+        print(f"{'journal':>10}{'us/op':>10}")
+        for name, path in (('off', None), ('on', journal_path)):
+            print(f'{name:>10}{measure_write(path, args.ops) * 1e6:>10.1f}')
+        os.remove(journal_path)
+
+        print(f"\n{'piles':>8}{'live':>8}{'history':>10}{'journal(KB)':>13}{'recover(ms)':>13}")
+        for pile_cnt in args.piles:
+            for history in args.history:
+                live = build_journal(journal_path, pile_cnt, history)
+                size = os.path.getsize(journal_path) / 1024
+                cost = measure_recovery(journal_path, pile_cnt)
+                print(f'{pile_cnt:>8}{live:>8}{history:>10}{size:>13.1f}{cost * 1000:>13.1f}')
+                os.remove(journal_path)
+
+
+if __name__ == '__main__':
+    main()
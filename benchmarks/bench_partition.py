@@ -0,0 +1,106 @@
+"""按充电站划分调度域的开销测试
+
+同样数量的充电桩分别由一个调度器统一调度，以及按每站 --station-size 个充电桩划分为多个充电站各自调度。
+所有充电桩队列与等候区填满后，反复取消一个排队中的请求并提交一个新请求（两次操作均发布快照），
+以及令一个充电桩故障再恢复，测量每个循环的耗时。划分后耗时只与充电站规模有关，不随充电桩总数增长。
+
+用法：python benchmarks/bench_partition.py [--piles 100 1000 10000] [--station-size 100] [--cycles 200]
+"""
+import argparse
+import logging
+import time
+
+from decimal import Decimal
+
+import _django
+
+_django.setup()
+
+from acss_app.models import PileType  # noqa: E402
+from acss_app.service.schd import (MAX_RECYCLE_ID, Scheduler, SubmitItem, WAITING_AREA_CAPACITY,  # noqa: E402
+                                   WAITING_QUEUE_CAPACITY)
+from acss_app.service.schd_partition import STATION_ID_STRIDE, PartitionedScheduler  # noqa: E402
+from acss_app.service.util.change_notifier import ChangeNotifier  # noqa: E402
+from acss_app.service.util.id_allocator import RequestIdAllocator  # noqa: E402
+
+AMOUNT = Decimal('1000.00')  # 充电量足够大，测试期间不会有请求充电完成
+
+
+def discard(_settlement) -> None:
+    pass
+
+
+def make_single(pile_cnt: int) -> tuple:
+    scheduler = Scheduler(_django.make_piles(0, pile_cnt), on_settle=discard, run_checker=False)
+    return scheduler, {None: list(range(1, pile_cnt + 1))}
+
+
+def make_partitioned(pile_cnt: int, station_size: int) -> tuple:
+    piles = _django.make_piles(0, pile_cnt)
+    notifier = ChangeNotifier()
+    domains = {}
+    station_piles = {}
+    for begin in range(0, pile_cnt, station_size):
+        station_id = begin // station_size + 1
+        domain_piles = piles[begin:begin + station_size]
+        id_allocator = RequestIdAllocator(MAX_RECYCLE_ID, stride=STATION_ID_STRIDE, offset=station_id)
+        domains[station_id] = Scheduler(domain_piles, on_settle=discard, id_allocator=id_allocator,
+                                        run_checker=False, notifier=notifier)
+        station_piles[station_id] = [pile.pile_id for pile in domain_piles]
+    pile_stations = {pile_id: station_id for station_id, pile_ids in station_piles.items() for pile_id in pile_ids}
+    return PartitionedScheduler(domains, pile_stations, notifier), station_piles
+
+
+def fill(scheduler, station_piles: dict) -> dict:
+    """填满各充电站的队列与等候区，返回各充电站的用户名列表"""
+    users = {}
+    for station_id, pile_ids in station_piles.items():
+        count = len(pile_ids) * WAITING_QUEUE_CAPACITY + WAITING_AREA_CAPACITY
+        users[station_id] = [f's{station_id}u{i}' for i in range(count)]
+        scheduler.submit_many([SubmitItem(PileType.CHARGE, username, AMOUNT, AMOUNT, station_id=station_id)
+                               for username in users[station_id]])
+    return users
+
+
+def measure(scheduler, station_piles: dict, cycles: int) -> tuple:
+    users = fill(scheduler, station_piles)
+    station_id = next(iter(station_piles))
+    station_users = users[station_id]
+    pile_id = station_piles[station_id][len(station_piles[station_id]) // 2]
+
+    begin = time.perf_counter()
+    for i in range(cycles):
+        # 取消最早提交的请求（排在充电桩队列中），再以新用户名提交
+        username = station_users[i]
+        scheduler.end_request(scheduler.get_request_id_by_username(username))
+        station_users.append(f'{username}x')
+        scheduler.submit_request(PileType.CHARGE, station_users[-1], AMOUNT, AMOUNT, station_id=station_id)
+    churn_cost = (time.perf_counter() - begin) / cycles
+
+    begin = time.perf_counter()
+    for _ in range(cycles):
+        scheduler.brake(pile_id)
+        scheduler.recover(pile_id)
+    fault_cost = (time.perf_counter() - begin) / cycles
+    return churn_cost, fault_cost
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--piles', type=int, nargs='+', default=[100, 1000, 10000])
+    parser.add_argument('--station-size', type=int, default=100)
+    parser.add_argument('--cycles', type=int, default=200)
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    print(f"{'piles':>7}{'stations':>10}{'end+submit(ms)':>16}{'brake+recover(ms)':>19}")
+    for pile_cnt in args.piles:
+        cases = (('1', make_single(pile_cnt)),
+                 (str(-(-pile_cnt // args.station_size)), make_partitioned(pile_cnt, args.station_size)))
+        for stations, (scheduler, station_piles) in cases:
+            churn_cost, fault_cost = measure(scheduler, station_piles, args.cycles)
+            print(f'{pile_cnt:>7}{stations:>10}{churn_cost * 1000:>16.3f}{fault_cost * 1000:>19.3f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+"""充电请求存储开销测试
+
+比较原先以普通 dataclass 与多个标志位表示的充电请求，与使用 __slots__、单一状态字段、
+预先计算充电时长的充电请求，在 --count 个存活请求下的：
+- 内存占用：请求对象本身（含实例 __dict__）的大小，以及 tracemalloc 统计的创建后净增内存
+  （后者包含各请求的用户名、时间与 Decimal 对象）
+- 创建速度
+- 排序速度（故障队列按 (create_time, request_id) 排序）
+- 状态遍历速度（模拟发布快照时逐个判断请求阶段，并在开始充电时计算完成时刻）
+
+用法：python benchmarks/bench_request_store.py [--count 100000]
+"""
+import argparse
+import gc
+import sys
+import time
+import tracemalloc
+
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import Callable, List
+
+import _django
+
+_django.setup()
+
+from acss_app.models import PileType  # noqa: E402
+from acss_app.service.schd import RequestState, _ChargingRequest, _get_power  # noqa: E402
+from acss_app.service.timemock import to_us  # noqa: E402
+
+
+@dataclass(order=True)
+class _LegacyChargingRequest:
+    """原先的充电请求表示"""
+    create_time: datetime
+    request_id: int
+    request_type: PileType
+    username: str
+    amount: Decimal
+    battery_capacity: Decimal
+    user_id: int | None = None
+    is_in_waiting_queue = False
+    is_executing = False
+    begin_time: datetime = None
+    complete_time: datetime = None
+    is_removed = False
+    pile_id: int = None
+    requeue_flag = False
+    fail_flag = False
+
+
+def _legacy_duration(request: _LegacyChargingRequest) -> timedelta:
+    return timedelta(seconds=float(request.amount) / _get_power(request.request_type) * 3600)
+
+
+def make_legacy(count: int, base: datetime) -> List[_LegacyChargingRequest]:
+    requests = []
+    for i in range(count):
+        request = _LegacyChargingRequest(base + timedelta(microseconds=i), i, PileType(i % 2), f'u{i}',
+                                         Decimal('15.00'), Decimal('65.50'), i)
+        request.is_in_waiting_queue = i % 3 != 0
+        request.is_executing = i % 3 == 1
+        requests.append(request)
+    return requests
+
+
+def make_compact(count: int, base: datetime) -> List[_ChargingRequest]:
+    states = (RequestState.WAITING, RequestState.CHARGING, RequestState.QUEUED)
+    base_us = to_us(base)
+    return [_ChargingRequest(base_us + i, i, PileType(i % 2), f'u{i}',
+                             Decimal('15.00'), Decimal('65.50'), i, state=states[i % 3])
+            for i in range(count)]
+
+
+def scan_legacy(requests: List[_LegacyChargingRequest], now: datetime) -> int:
+    charging = 0
+    for request in requests:
+        if not request.is_in_waiting_queue:
+            continue
+        if request.fail_flag:
+            continue
+        if request.is_executing:
+            request.complete_time = now + _legacy_duration(request)
+            charging += 1
+    return charging
+
+
+def scan_compact(requests: List[_ChargingRequest], now: datetime) -> int:
+    charging = 0
+    now_us = to_us(now)
+    for request in requests:
+        if request.state == RequestState.CHARGING:
+            request.complete_time = now_us + request.duration
+            charging += 1
+    return charging
+
+
+def object_size(request) -> int:
+    size = sys.getsizeof(request)
+    if hasattr(request, '__dict__'):
+        size += sys.getsizeof(request.__dict__)
+    return size
+
+
+def measure(name: str, count: int, make: Callable, scan: Callable) -> None:
+    base = datetime(2022, 6, 1, 6)
+    gc.collect()
+    begin = time.perf_counter()
+    make(count, base)
+    create_cost = time.perf_counter() - begin
+
+    gc.collect()
+    tracemalloc.start()
+    requests = make(count, base)
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    shuffled = requests[1::2] + requests[::2]
+    begin = time.perf_counter()
+    sorted(shuffled)
+    sort_cost = time.perf_counter() - begin
+
+    begin = time.perf_counter()
+    scan(requests, base)
+    scan_cost = time.perf_counter() - begin
+
+    print(f'{name:>10}{object_size(requests[-1]):>11}{memory / count:>12.0f}{memory / 1024 / 1024:>12.1f}'
+          f'{create_cost * 1e9 / count:>13.0f}{sort_cost * 1000:>11.1f}{scan_cost * 1e9 / count:>12.0f}')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--count', type=int, default=100000)
+    args = parser.parse_args()
+
+    print(f"{'layout':>10}{'object(B)':>11}{'B/request':>12}{'total(MB)':>12}"
+          f"{'create(ns)':>13}{'sort(ms)':>11}{'scan(ns)':>12}")
+    measure('legacy', args.count, make_legacy, scan_legacy)
+    measure('compact', args.count, make_compact, scan_compact)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""调度器并发压力测试
+
+比较 GLOBAL（单锁）与 SHARDED（按充电桩类型分片加锁）两种并发模式下，
+不同并发客户端数量的吞吐量。每个客户端循环执行：提交请求、查询 5 次状态、取消请求，
+一半客户端使用快充，一半使用慢充。取消充电中的请求会触发结算，结算以 --settle-ms 指定的
+耗时模拟一批详单的数据库写入：inline 在调度锁内逐条写入，async 提交给结算写入线程批量写入。
+
+用法：python benchmarks/bench_scheduler_concurrency.py [--duration 2] [--piles 10] [--settle-ms 1]
+"""
+import argparse
+import threading
+import time
+
+from decimal import Decimal
+
+import _django
+
+_django.setup()
+
+from acss_app.models import PileType  # noqa: E402
+from acss_app.service.schd import ConcurrencyMode, Scheduler  # noqa: E402
+from acss_app.service.settlement import SettlementWriter  # noqa: E402
+
+STATUS_POLLS = 5
+
+
+def run_clients(scheduler: Scheduler, client_cnt: int, duration: float) -> int:
+    stop = threading.Event()
+    counters = [0] * client_cnt
+
+    def client(index: int) -> None:
+        pile_type = PileType.CHARGE if index % 2 == 0 else PileType.FAST_CHARGE
+        seq = 0
+        while not stop.is_set():
+            username = f'c{index}-{seq}'
+            seq += 1
+            scheduler.submit_request(pile_type, username, Decimal('100.00'), Decimal('100.00'))
+            request_id = scheduler.get_request_id_by_username(username)
+            for _ in range(STATUS_POLLS):
+                scheduler.get_request_status(request_id)
+            scheduler.end_request(request_id)
+            counters[index] += STATUS_POLLS + 3
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(client_cnt)]
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return sum(counters)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--duration', type=float, default=2.0)
+    parser.add_argument('--piles', type=int, default=10, help='每种类型的充电桩数量')
+    parser.add_argument('--clients', type=int, nargs='+', default=[1, 2, 4, 8, 16])
+    parser.add_argument('--settle-ms', type=float, default=1.0, help='模拟的单次结算耗时')
+    args = parser.parse_args()
+
+    # 结算不写数据库，仅模拟其耗时
+    def settle(*_args) -> None:
+        time.sleep(args.settle_ms / 1000)
+
+    print(f"{'mode':<8}{'settle':>8}{'clients':>8}{'ops/s':>12}")
+    for mode in ConcurrencyMode:
+        for settle_mode in ('inline', 'async'):
+            for client_cnt in args.clients:
+                writer = None
+                on_settle = settle
+                if settle_mode == 'async':
+                    writer = SettlementWriter(sink=settle)
+                    writer.start()
+                    on_settle = writer.submit
+                scheduler = Scheduler(piles=_django.make_piles(args.piles, args.piles),
+                                      concurrency_mode=mode, on_settle=on_settle)
+                ops = run_clients(scheduler, client_cnt, args.duration)
+                if writer is not None:
+                    writer.close()
+                print(f'{mode.name:<8}{settle_mode:>8}{client_cnt:>8}{ops / args.duration:>12.0f}')
+
+
+if __name__ == '__main__':
+    main()
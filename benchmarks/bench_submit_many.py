@@ -0,0 +1,65 @@
+"""批量提交充电请求测试
+
+比较逐个调用 submit_request 与一次调用 submit_many 提交 k 个请求的总耗时。
+k = 3 * 充电桩数 + 等候区容量，恰好填满全部充电桩队列与等候区。
+逐个提交时每个请求都要调度并发布一次快照（快照大小随存活请求数增长），批量提交每个分片只发布一次。
+
+用法：python benchmarks/bench_submit_many.py [--piles 10 100 300] [--repeat 5]
+"""
+import argparse
+import time
+
+from decimal import Decimal
+
+import _django
+
+_django.setup()
+
+from acss_app.models import PileType  # noqa: E402
+from acss_app.service.schd import Scheduler, SubmitItem, WAITING_AREA_CAPACITY, WAITING_QUEUE_CAPACITY  # noqa: E402
+
+
+def discard(_settlement) -> None:
+    pass
+
+
+def make_items(pile_cnt: int) -> list:
+    # 充电量足够大，测试期间不会有请求充电完成
+    count = pile_cnt * WAITING_QUEUE_CAPACITY + WAITING_AREA_CAPACITY
+    return [SubmitItem(PileType.CHARGE, f'u{i}', Decimal('1000.00'), Decimal('1000.00')) for i in range(count)]
+
+
+def measure_loop(pile_cnt: int, items: list) -> float:
+    scheduler = Scheduler(_django.make_piles(0, pile_cnt), on_settle=discard)
+    begin = time.perf_counter()
+    for item in items:
+        scheduler.submit_request(item.request_mode, item.username, item.amount, item.battery_capacity)
+    return time.perf_counter() - begin
+
+
+def measure_batch(pile_cnt: int, items: list) -> float:
+    scheduler = Scheduler(_django.make_piles(0, pile_cnt), on_settle=discard)
+    begin = time.perf_counter()
+    results = scheduler.submit_many(items)
+    cost = time.perf_counter() - begin
+    assert all(result is None for result in results)
+    return cost
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--piles', type=int, nargs='+', default=[10, 100, 300])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'piles':>8}{'k':>8}{'loop(ms)':>11}{'batch(ms)':>11}{'speedup':>10}")
+    for pile_cnt in args.piles:
+        items = make_items(pile_cnt)
+        loop_cost = min(measure_loop(pile_cnt, items) for _ in range(args.repeat))
+        batch_cost = min(measure_batch(pile_cnt, items) for _ in range(args.repeat))
+        print(f'{pile_cnt:>8}{len(items):>8}{loop_cost * 1000:>11.1f}{batch_cost * 1000:>11.1f}'
+              f'{loop_cost / batch_cost:>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
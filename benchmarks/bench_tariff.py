@@ -0,0 +1,62 @@
+"""计费性能测试
+
+测量查表计费 calc_cost 在不同充电时长下的单次耗时，以及批量计费 calc_costs 的吞吐量。
+与逐区间计算结果的一致性由 acss_app/tests.py 中的 TariffTests 校验。
+
+用法：python benchmarks/bench_tariff.py [--seed 0]
+"""
+import argparse
+import random
+import timeit
+
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import _django
+
+_django.setup()
+
+from acss_app.service.charge import calc_cost, calc_costs  # noqa: E402
+
+
+def random_span(rnd: random.Random):
+    begin = datetime(2022, rnd.randint(1, 12), rnd.randint(1, 24),
+                     rnd.randint(0, 23), rnd.randint(0, 59), rnd.randint(0, 59),
+                     rnd.choice([0, rnd.randint(0, 999999)]))
+    seconds = rnd.choice([rnd.randint(1, 7200), rnd.randint(1, 3 * 86400)])
+    end = begin + timedelta(seconds=seconds, microseconds=rnd.choice([0, rnd.randint(0, 999999)]))
+    amount = Decimal(rnd.randint(1, 10000)) / 100
+    return begin, end, amount
+
+
+def bench_single() -> None:
+    begin = datetime(2022, 6, 1, 8, 30, 0)
+    amount = Decimal('30.00')
+    print(f"{'span':<10}{'calc_cost(us)':>14}")
+    for label, span in (('1h', timedelta(hours=1)),
+                        ('1d', timedelta(days=1)),
+                        ('20d', timedelta(days=20))):
+        end = begin + span
+        number = 2000
+        table = min(timeit.repeat(lambda: calc_cost(begin, end, amount), number=number, repeat=5))
+        print(f'{label:<10}{table / number * 1e6:>14.1f}')
+
+
+def bench_batch(seed: int) -> None:
+    rnd = random.Random(seed)
+    spans = [random_span(rnd) for _ in range(50000)]
+    single = timeit.timeit(lambda: [calc_cost(*span) for span in spans], number=1)
+    batch = timeit.timeit(lambda: calc_costs(spans), number=1)
+    print(f'batch of {len(spans)}: calc_cost {single:.3f}s, calc_costs {batch:.3f}s')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    bench_single()
+    bench_batch(args.seed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""请求格式校验开销测试
+
+比较原先每次调用 jsonschema.validate（每次检查格式本身并创建校验器）与预编译校验器，
+校验一个请求（含 JSON 解析）的耗时。合法请求只执行快速检查，非法请求回退到 jsonschema 生成错误信息。
+
+用法：python benchmarks/bench_validator.py [--requests 20000]
+"""
+import argparse
+import json
+import time
+
+from json import JSONDecodeError
+
+import _django
+
+_django.setup()
+
+from django.test import RequestFactory  # noqa: E402
+from jsonschema import validate as _validate, ValidationError as _ValidationError  # noqa: E402
+
+from acss_app.controller import admin_controller, user_controller  # noqa: E402
+from acss_app.controller.util.validator import ValidationError, validate  # noqa: E402
+
+
+def legacy_validate(request, method: str = 'POST', schema=None):
+    """原先的 validate"""
+    if request.method != method:
+        raise ValidationError(f"请使用{method}请求")
+    try:
+        req = json.loads(request.body)
+        _validate(req, schema)
+    except JSONDecodeError as e:
+        raise ValidationError("请求解析错误") from e
+    except _ValidationError as e:
+        if 'errmsg' in e.schema:
+            raise ValidationError(f"请求格式非法: {e.schema['errmsg']}") from e
+        raise ValidationError(f"请求格式非法: {e.message}") from e
+    return req
+
+
+def run(validator, request, schema, total: int) -> tuple:
+    message = 'ok'
+    begin = time.perf_counter()
+    for _ in range(total):
+        try:
+            validator(request, schema=schema)
+        except ValidationError as e:
+            message = str(e)
+    return (time.perf_counter() - begin) / total, message
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=20000)
+    args = parser.parse_args()
+
+    factory = RequestFactory()
+    submit_schema = getattr(user_controller, '__submit_charging_request_schema')
+    import_schema = getattr(admin_controller, '__import_charging_requests_schema')
+    item = {'username': 'user01', 'charge_mode': 'T', 'require_amount': '15.00', 'battery_size': '65.50'}
+    cases = (
+        ('submit', submit_schema, {'charge_mode': 'T', 'require_amount': '15.00', 'battery_size': '65.50'}),
+        ('submit-bad', submit_schema, {'charge_mode': 'T', 'require_amount': '15', 'battery_size': '65.50'}),
+        ('import-100', import_schema, {'requests': [item] * 100}),
+        ('import-bad', import_schema, {'requests': [item] * 99 + [dict(item, charge_mode='X')]}),
+    )
+
+    print(f"{'case':>12}{'legacy(us)':>12}{'compiled(us)':>14}{'speedup':>9}  message")
+    for name, compiled, body in cases:
+        request = factory.post('/', data=json.dumps(body), content_type='application/json')
+        total = args.requests if not name.startswith('import') else args.requests // 50
+        legacy_cost, legacy_message = run(legacy_validate, request, compiled.schema, total)
+        cost, message = run(validate, request, compiled, total)
+        assert message == legacy_message, (message, legacy_message)
+        print(f'{name:>12}{legacy_cost * 1e6:>12.1f}{cost * 1e6:>14.1f}{legacy_cost / cost:>9.1f}  {message}')
+
+
+if __name__ == '__main__':
+    main()
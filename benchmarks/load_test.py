@@ -0,0 +1,86 @@
+"""轮询接口压力测试
+
+以 --connections 个保持连接的客户端并发请求轮询接口，统计每个服务地址的吞吐量与延迟分位数，
+用于比较 runserver 与 ASGI 服务（manage.py serve）。
+
+先分别启动待测服务，例如：
+    python manage.py runserver 8000 --noreload
+    python manage.py serve --port 8001
+
+用法：python benchmarks/load_test.py runserver=http://127.0.0.1:8000 asgi=http://127.0.0.1:8001
+      [--path /user/preview_queue] [--connections 32] [--duration 10]
+"""
+import argparse
+import http.client
+import threading
+import time
+
+from urllib.parse import urlsplit
+
+import _django
+
+_django.setup()
+
+from acss_app.service.util.jwt_tool import gen_token  # noqa: E402
+
+
+def run_target(base_url: str, path: str, headers: dict, connections: int, duration: float):
+    url = urlsplit(base_url)
+    latencies = [[] for _ in range(connections)]
+    errors = [0] * connections
+    deadline = time.perf_counter() + duration
+
+    def client(index: int) -> None:
+        conn = http.client.HTTPConnection(url.hostname, url.port, timeout=10)
+        while time.perf_counter() < deadline:
+            begin = time.perf_counter()
+            try:
+                conn.request('GET', path, headers=headers)
+                response = conn.getresponse()
+                response.read()
+                if response.status != 200:
+                    errors[index] += 1
+            except (OSError, http.client.HTTPException):
+                errors[index] += 1
+                conn.close()
+                conn = http.client.HTTPConnection(url.hostname, url.port, timeout=10)
+                continue
+            latencies[index].append(time.perf_counter() - begin)
+        conn.close()
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(connections)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    merged = sorted(latency for client_latencies in latencies for latency in client_latencies)
+    return merged, sum(errors)
+
+
+def percentile(sorted_values: list, ratio: float) -> float:
+    if len(sorted_values) == 0:
+        return float('nan')
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * ratio))]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('targets', nargs='+', help='name=base_url')
+    parser.add_argument('--path', default='/user/preview_queue')
+    parser.add_argument('--connections', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--username', default='user01')
+    parser.add_argument('--role', default='USER', choices=['USER', 'ADMIN'])
+    args = parser.parse_args()
+
+    headers = {'Authorization': 'Bearer ' + gen_token(args.username, args.role)}
+    print(f"{'target':<12}{'req/s':>10}{'p50(ms)':>10}{'p99(ms)':>10}{'errors':>8}")
+    for target in args.targets:
+        name, base_url = target.split('=', 1)
+        latencies, errors = run_target(base_url, args.path, headers, args.connections, args.duration)
+        print(f'{name:<12}{len(latencies) / args.duration:>10.0f}'
+              f'{percentile(latencies, 0.5) * 1000:>10.2f}{percentile(latencies, 0.99) * 1000:>10.2f}{errors:>8}')
+
+
+if __name__ == '__main__':
+    main()
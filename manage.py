@@ -4,9 +4,15 @@ import os
 import sys
 
 
+# 需要运行调度器等后台服务的管理命令，见 acss_app.apps.SERVICE_PROCESS_ENV
+SERVICE_COMMANDS = {'runserver', 'serve', 'run_scheduler'}
+
+
 def main():
     """Run administrative tasks."""
     os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'acss_site.settings')
+    if len(sys.argv) > 1 and sys.argv[1] in SERVICE_COMMANDS:
+        os.environ.setdefault('ACSS_SERVICE_PROCESS', '1')
     try:
         from django.core.management import execute_from_command_line
     except ImportError as exc: